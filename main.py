@@ -4,12 +4,21 @@ import logfire
 
 logfire.configure()
 
-from dotenv import load_dotenv  # noqa: E402
+from os import getenv  # noqa: E402
 
-from src.bot.client import init_bot  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
 
 # Load environment variables from .env file
 load_dotenv()
 
 
-init_bot()
+if __name__ == "__main__":
+    # Workers are started with the spawn method and import this module again, so the guard is required.
+    if int(getenv("CLUSTER_WORKERS", "1")) > 1:
+        from src.bot.cluster import run_cluster
+
+        run_cluster()
+    else:
+        from src.bot.client import init_bot
+
+        init_bot()
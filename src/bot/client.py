@@ -6,12 +6,40 @@ import discord as pycord
 import logfire
 from dotenv import load_dotenv
 
-from src.database.db_models import init_peewee_db
+from src.bot import middleware
+from src.bot.cluster_bus import bus_client
+from src.bot.health_server import health_server
+from src.bot.instrumentation import instrumentation
+from src.bot.interaction_budget import deferral_budget
+from src.bot.shard_metrics import shard_metrics
+from src.database.db_models import db, init_peewee_db
+from src.database.org_index import load_org_indexes
+from src.database.user_index import load_user_index
+from src.extras import guild_cache
+from src.extras.activity_log import activity_log
+from src.extras.welcome_queue import welcome_queue
+from src.match.match_scheduler import match_scheduler
 
 load_dotenv()
 
 
-def init_bot():
+def create_bot(shard_ids: list[int] | None = None, shard_count: int | None = None) -> pycord.Bot:
+    """Create a single connection Bot, or an AutoShardedBot when sharding is enabled.
+
+    Sharding is enabled by passing shard ids (cluster workers) or with DISCORD_SHARDED=true, DISCORD_SHARD_COUNT
+    sets the shard count (leave it empty to use the count recommended by Discord).
+    """
+    sharded = shard_ids is not None or getenv("DISCORD_SHARDED", "false").lower() in ("1", "true", "yes")
+    if not sharded:
+        return pycord.Bot(command_prefix="!", intents=pycord.Intents.all())
+    shard_count = shard_count or int(getenv("DISCORD_SHARD_COUNT", "0") or 0) or None
+    logfire.info(f"Sharded mode: shard_count={shard_count or 'auto'}, shard_ids={shard_ids or 'all'}")
+    return pycord.AutoShardedBot(
+        command_prefix="!", intents=pycord.Intents.all(), shard_count=shard_count, shard_ids=shard_ids
+    )
+
+
+def init_bot(shard_ids: list[int] | None = None, shard_count: int | None = None):
     """Initialize the bot."""
     with logfire.span("STARTING BOT"):
         logfire.info("Load pycord intents")
@@ -20,7 +48,13 @@ def init_bot():
         # intents.message_content = True  # Required for message commands
         # intents.members = True  # Required for member-based interactions like lookup
         logfire.info("Initialize bot")
-        bot = pycord.Bot(command_prefix="!", intents=pycord.Intents.all())
+        bot = create_bot(shard_ids=shard_ids, shard_count=shard_count)
+        shard_metrics.install(bot)
+        middleware.install(bot)
+        # Registered first so its timing wraps the other middleware.
+        middleware.register(instrumentation)
+        middleware.register(deferral_budget)
+        instrumentation.install(bot, db)
         logfire.info("Run bot")
 
         @bot.event
@@ -28,7 +62,19 @@ def init_bot():
             """Initialize PeeWee connection."""
             logfire.info("Initialize PeeWee connection.")
 
+            guild_cache.configure(bot.shard_count or 1)
             init_peewee_db()
+            load_org_indexes()
+            load_user_index()
+            activity_log.start(bot)
+            welcome_queue.start(bot)
+            match_scheduler.start(bot)
+            try:
+                await health_server.start(bot)
+            except OSError as e:
+                logfire.error(f"Failed to start the health endpoint: {e}")
+            if bus_client is not None:
+                bus_client.start(metrics_provider=lambda: {"shards": shard_metrics.snapshot()})
 
             # Sync commands
             try:
@@ -40,11 +86,13 @@ def init_bot():
             logfire.info("Bot is now ready!")
 
         @bot.user_command(name="Say Hello")
+        @middleware.public_reply
         async def test_hi(ctx, user):
             """Say hello to a user."""
             await ctx.respond(f"{ctx.author.mention} says hello to {user.name}!")
 
         @bot.slash_command(command_prefix="!")
+        @middleware.public_reply
         async def test_hello(ctx, name: str | None = None):
             """Test command to say hello."""
             logfire.info("test_hello command")
@@ -53,9 +101,10 @@ def init_bot():
             logfire.info(f"Hello {name}! Done")
 
         bot.load_extension("src.cogs.user_cog")
-        # bot.load_extension("src.cogs.administrator_cog")
+        bot.load_extension("src.cogs.administrator_cog")
         # bot.load_extension("src.cogs.membership_cog")
         bot.load_extension("src.cogs.org_cog")
+        bot.load_extension("src.cogs.match_cog")
 
         logfire.info("Get: DISCORD_BOT_TOKEN")
         TOKEN = getenv("DISCORD_BOT_TOKEN")
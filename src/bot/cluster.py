@@ -0,0 +1,224 @@
+"""Cluster launcher: run the bot as several worker processes, each owning a range of shards.
+
+The coordinator (this process) does not connect to Discord. It starts the workers, serves the cluster bus on a
+Unix socket, relays cache invalidations between workers, aggregates their metrics and restarts workers that crash.
+Workers connect to the bus with ``src.bot.cluster_bus.BusClient``. Background jobs on shared state (zwid
+verification, match archival, database backups) only run in worker 0, see ``is_primary_worker``.
+"""
+
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import signal
+import time
+from dataclasses import dataclass, field
+
+import logfire
+from dotenv import load_dotenv
+
+from src.bot.cluster_bus import encode
+
+load_dotenv()
+
+RESTART_BASE_DELAY = 1.0
+RESTART_MAX_DELAY = 60.0
+# A worker that ran this long is considered healthy again and restarts without backoff.
+STABLE_AFTER_SECONDS = 300.0
+METRICS_LOG_INTERVAL = 60.0
+SHUTDOWN_TIMEOUT = 20.0
+
+
+def shard_ranges(workers: int, shard_count: int) -> list[list[int]]:
+    """Split the shards evenly over the workers, e.g. 3 workers and 8 shards -> [0, 1, 2] [3, 4, 5] [6, 7]."""
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for index in range(workers):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def _worker_main(index: int, shard_ids: list[int], shard_count: int, socket_path: str) -> None:
+    """Entry point of a worker process."""
+    os.environ["VWR_CLUSTER_SOCKET"] = socket_path
+    os.environ["VWR_WORKER_ID"] = str(index)
+    logfire.configure()
+    # Imported here so the coordinator never loads the bot (and the database) itself.
+    from src.bot.client import init_bot
+
+    logfire.info(f"Worker {index} starting with shards {shard_ids} of {shard_count}")
+    init_bot(shard_ids=shard_ids, shard_count=shard_count)
+
+
+@dataclass
+class Worker:
+    """A worker process and its supervision state."""
+
+    index: int
+    shard_ids: list[int]
+    process: multiprocessing.Process | None = None
+    started_at: float = 0.0
+    restarts: int = 0
+    writer: asyncio.StreamWriter | None = None
+    metrics: dict = field(default_factory=dict)
+
+
+class Coordinator:
+    """Start, supervise and connect the worker processes."""
+
+    def __init__(self, workers: int, shard_count: int, socket_path: str):
+        self.shard_count = shard_count
+        self.socket_path = socket_path
+        self.workers = [Worker(i, ids) for i, ids in enumerate(shard_ranges(workers, shard_count))]
+        self.relayed = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._stopping = asyncio.Event()
+        self._server: asyncio.base_events.Server | None = None
+
+    @classmethod
+    def from_env(cls, workers: int | None = None) -> "Coordinator":
+        """Create a coordinator configured from environment variables."""
+        workers = workers or int(os.getenv("CLUSTER_WORKERS", "1"))
+        shard_count = int(os.getenv("DISCORD_SHARD_COUNT", "0") or 0) or workers
+        return cls(workers, shard_count, os.getenv("CLUSTER_SOCKET", "/tmp/vwr-cluster.sock"))
+
+    async def run(self) -> None:
+        """Run until SIGTERM/SIGINT, then stop all workers."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path)
+        logfire.info(
+            f"Cluster coordinator listening on {self.socket_path}: "
+            f"{len(self.workers)} workers, {self.shard_count} shards"
+        )
+        try:
+            for worker in self.workers:
+                self._start(worker)
+            metrics_task = loop.create_task(self._log_metrics())
+            await self._supervise()
+            metrics_task.cancel()
+        finally:
+            await self._shutdown()
+
+    def _start(self, worker: Worker) -> None:
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.index, worker.shard_ids, self.shard_count, self.socket_path),
+            name=f"vwr-worker-{worker.index}",
+            daemon=False,
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        logfire.info(f"Started worker {worker.index} (pid {worker.process.pid}) for shards {worker.shard_ids}")
+
+    async def _supervise(self) -> None:
+        """Restart crashed workers with exponential backoff, other workers keep running."""
+        restart_at: dict[int, float] = {}
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.process is None or worker.process.is_alive():
+                    continue
+                if worker.index not in restart_at:
+                    if now - worker.started_at > STABLE_AFTER_SECONDS:
+                        worker.restarts = 0
+                    delay = min(RESTART_BASE_DELAY * 2**worker.restarts, RESTART_MAX_DELAY)
+                    restart_at[worker.index] = now + delay
+                    logfire.error(
+                        f"Worker {worker.index} exited with code {worker.process.exitcode}, restarting in {delay:.0f}s"
+                    )
+                elif now >= restart_at[worker.index]:
+                    del restart_at[worker.index]
+                    worker.restarts += 1
+                    worker.metrics = {}
+                    self._start(worker)
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._stopping.wait(), timeout=1.0)
+
+    async def _shutdown(self) -> None:
+        logfire.info("Stopping cluster workers")
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            await asyncio.to_thread(worker.process.join, max(deadline - time.monotonic(), 0))
+            if worker.process.is_alive():
+                logfire.warn(f"Worker {worker.index} did not stop in time, killing it")
+                worker.process.kill()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.socket_path)
+        logfire.info("Cluster stopped")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handle one worker connection."""
+        worker: Worker | None = None
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    logfire.warn(f"Malformed cluster bus message: {line[:200]!r}")
+                    continue
+                kind = message.get("type")
+                if kind == "hello":
+                    worker = self.workers[int(message["worker"])]
+                    worker.writer = writer
+                elif kind == "invalidate":
+                    self._broadcast(line, sender=writer)
+                elif kind == "metrics" and worker is not None:
+                    worker.metrics = message
+                elif kind == "cluster_metrics":
+                    writer.write(encode({"type": "cluster_metrics", **self.aggregate()}))
+        except (OSError, asyncio.IncompleteReadError) as e:
+            logfire.warn(f"Cluster bus connection lost: {e}")
+        finally:
+            if worker is not None and worker.writer is writer:
+                worker.writer = None
+            writer.close()
+
+    def _broadcast(self, line: bytes, sender: asyncio.StreamWriter) -> None:
+        for worker in self.workers:
+            if worker.writer is not None and worker.writer is not sender and not worker.writer.is_closing():
+                worker.writer.write(line)
+                self.relayed += 1
+
+    def aggregate(self) -> dict:
+        """Cluster wide totals plus the latest metrics of every worker."""
+        shards = [shard for w in self.workers for shard in w.metrics.get("shards", [])]
+        return {
+            "workers": len(self.workers),
+            "workers_alive": sum(1 for w in self.workers if w.process is not None and w.process.is_alive()),
+            "workers_connected": sum(1 for w in self.workers if w.writer is not None),
+            "restarts": sum(w.restarts for w in self.workers),
+            "relayed_invalidations": self.relayed,
+            "guilds": sum(s.get("guilds", 0) for s in shards),
+            "events": sum(s.get("events", 0) for s in shards),
+            "event_rate": sum(s.get("event_rate", 0.0) for s in shards),
+            "reconnects": sum(s.get("reconnects", 0) for s in shards),
+            "per_worker": {w.index: w.metrics for w in self.workers},
+        }
+
+    async def _log_metrics(self) -> None:
+        while True:
+            await asyncio.sleep(METRICS_LOG_INTERVAL)
+            totals = {k: v for k, v in self.aggregate().items() if k != "per_worker"}
+            logfire.info(f"Cluster metrics: {totals}")
+
+
+def run_cluster(workers: int | None = None) -> None:
+    """Run the bot as a cluster of worker processes, blocks until the cluster is stopped."""
+    asyncio.run(Coordinator.from_env(workers).run())
@@ -0,0 +1,123 @@
+"""Worker side of the cluster bus.
+
+Workers connect to the coordinator's Unix socket and exchange newline delimited JSON messages:
+
+- ``{"type": "hello", "worker": 0}`` sent once after connecting.
+- ``{"type": "invalidate", "kind": "user", "key": 123}`` broadcast to every other worker.
+- ``{"type": "metrics", "worker": 0, ...}`` pushed periodically, aggregated by the coordinator.
+"""
+
+import asyncio
+import json
+import os
+
+import logfire
+
+from src.extras import cache_bus
+
+RECONNECT_DELAY = 2.0
+METRICS_INTERVAL = 15.0
+# Stop writing while the coordinator is not reading, rather than buffering without bound.
+MAX_BUFFER_BYTES = 1 << 20
+
+
+def encode(message: dict) -> bytes:
+    """One message per line."""
+    return (json.dumps(message, separators=(",", ":"), default=str) + "\n").encode()
+
+
+class BusClient:
+    """Connection of a worker to the coordinator."""
+
+    def __init__(self, socket_path: str, worker_id: int):
+        self.socket_path = socket_path
+        self.worker_id = worker_id
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._metrics_provider = None
+
+    @classmethod
+    def from_env(cls) -> "BusClient | None":
+        """The client of this worker, None when the bot does not run as a cluster worker."""
+        socket_path = os.getenv("VWR_CLUSTER_SOCKET")
+        if not socket_path:
+            return None
+        return cls(socket_path, int(os.getenv("VWR_WORKER_ID", "0")))
+
+    def start(self, metrics_provider=None) -> None:
+        """Connect in the background and forward local cache invalidations, safe to call on every on_ready."""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._metrics_provider = metrics_provider
+        self._tasks.append(self._loop.create_task(self._connection_loop(), name="cluster-bus"))
+        if metrics_provider is not None:
+            self._tasks.append(self._loop.create_task(self._metrics_loop(), name="cluster-bus-metrics"))
+        cache_bus.set_forwarder(self.invalidate)
+
+    def invalidate(self, kind: str, key) -> None:
+        """Broadcast an invalidation to the other workers, callable from any thread."""
+        self.send({"type": "invalidate", "kind": kind, "key": key, "worker": self.worker_id})
+
+    def send(self, message: dict) -> None:
+        """Queue a message for the coordinator, dropped while disconnected."""
+        if self._loop is None:
+            return
+        # Model saves can happen in worker threads (asyncio.to_thread), the writer belongs to the loop.
+        self._loop.call_soon_threadsafe(self._write, encode(message))
+
+    def _write(self, data: bytes) -> None:
+        writer = self._writer
+        if writer is None or writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_BUFFER_BYTES:
+            self.dropped += 1
+            return
+        writer.write(data)
+        self.sent += 1
+
+    async def _connection_loop(self) -> None:
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path)
+                self._writer = writer
+                writer.write(encode({"type": "hello", "worker": self.worker_id}))
+                logfire.info(f"Worker {self.worker_id} connected to the cluster bus")
+                while line := await reader.readline():
+                    self._handle(line)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logfire.warn(f"Worker {self.worker_id} cluster bus connection lost: {e}")
+            finally:
+                self._writer = None
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def _handle(self, line: bytes) -> None:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            logfire.warn(f"Malformed cluster bus message: {line[:200]!r}")
+            return
+        self.received += 1
+        if message.get("type") == "invalidate":
+            cache_bus.publish(message["kind"], message["key"], remote=True)
+
+    async def _metrics_loop(self) -> None:
+        while True:
+            await asyncio.sleep(METRICS_INTERVAL)
+            try:
+                self.send({"type": "metrics", "worker": self.worker_id, **self._metrics_provider()})
+            except Exception as e:
+                logfire.error(f"Failed to collect worker metrics: {e}")
+
+
+def is_primary_worker() -> bool:
+    """True for a bot that is not a cluster worker, and for worker 0 of a cluster.
+
+    Jobs on state shared by all workers (the database, archive files, backups) run in the primary worker only.
+    """
+    return os.getenv("VWR_CLUSTER_SOCKET") is None or int(os.getenv("VWR_WORKER_ID", "0")) == 0
+
+
+bus_client = BusClient.from_env()
@@ -0,0 +1,329 @@
+"""Optional HTTP endpoint with ``/healthz`` and Prometheus ``/metrics``, served on the bot's event loop.
+
+Disabled unless HEALTH_PORT is set. ``/healthz`` answers 200 when the gateway is connected and the database answers
+``SELECT 1``, 503 otherwise. ``/metrics`` only reads in-memory counters, so scraping it every few seconds is cheap.
+
+Run ``python -m src.bot.health_server`` to serve the endpoint without a bot, e.g. to check the output locally.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+
+import discord
+import logfire
+from aiohttp import web
+from dotenv import load_dotenv
+
+from src.bot.cluster_bus import bus_client
+from src.bot.instrumentation import instrumentation
+from src.bot.interaction_budget import deferral_budget
+from src.bot.shard_metrics import shard_metrics
+from src.database.backup import sqlite_backup
+from src.database.db_models import db
+from src.extras import guild_cache
+from src.extras.activity_log import activity_log
+from src.extras.singleflight import flights
+from src.extras.welcome_queue import welcome_queue
+from src.extras.zwift_client import zwift_client
+from src.match.match_scheduler import match_scheduler
+
+load_dotenv()
+
+DB_CHECK_TIMEOUT = 2.0
+
+
+@dataclass
+class Metric:
+    """One metric family in the Prometheus text format."""
+
+    name: str
+    kind: str  # gauge, counter or histogram
+    help: str
+    samples: list[tuple[str, dict[str, str], float]] = field(default_factory=list)
+
+    def add(self, value: float, suffix: str = "", **labels) -> "Metric":
+        """Add a sample, ``suffix`` is appended to the name (``_bucket``, ``_sum``, ...)."""
+        self.samples.append((suffix, labels, value))
+        return self
+
+    def render(self) -> str:
+        """Render the family, HELP and TYPE lines included."""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples:
+            label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items())
+            label_text = f"{{{label_text}}}" if labels else ""
+            lines.append(f"{self.name}{suffix}{label_text} {_number(value)}")
+        return "\n".join(lines)
+
+
+Collector = Callable[[], Iterable[Metric]]
+
+
+class MetricsRegistry:
+    """Collectors are called on every scrape and return the current values."""
+
+    def __init__(self):
+        self._collectors: list[Collector] = []
+
+    def register(self, collector: Collector) -> Collector:
+        """Add a collector, usable as a decorator."""
+        self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        families = []
+        for collector in self._collectors:
+            try:
+                families.extend(metric.render() for metric in collector())
+            except Exception as e:
+                logfire.error(f"Metrics collector {collector.__name__} failed: {e}")
+        return "\n".join(families) + "\n"
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up a sleeping task."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Start measuring, safe to call more than once."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="loop-lag")
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+
+    def take_max(self) -> float:
+        """Largest lag since the previous call."""
+        value, self.max_lag = self.max_lag, self.lag
+        return value
+
+
+class HealthServer:
+    """The aiohttp app and its runner."""
+
+    def __init__(self, port: int | None, host: str = "127.0.0.1"):
+        self.port = port
+        self.host = host
+        self.bot: discord.Client | None = None
+        self.registry = MetricsRegistry()
+        self.loop_lag = LoopLagMonitor()
+        self._runner: web.AppRunner | None = None
+        _register_default_collectors(self)
+
+    @classmethod
+    def from_env(cls) -> "HealthServer":
+        """Create a server configured from HEALTH_PORT and HEALTH_HOST, disabled when HEALTH_PORT is empty."""
+        port = os.getenv("HEALTH_PORT", "")
+        return cls(port=int(port) if port else None, host=os.getenv("HEALTH_HOST", "127.0.0.1"))
+
+    def create_app(self) -> web.Application:
+        """The aiohttp application, also usable with aiohttp's test client."""
+        app = web.Application()
+        app.router.add_get("/healthz", self.healthz)
+        app.router.add_get("/metrics", self.metrics)
+        return app
+
+    async def start(self, bot: discord.Client | None) -> None:
+        """Start serving on the running loop, safe to call on every on_ready."""
+        self.bot = bot
+        if self.port is None or self._runner is not None:
+            return
+        self.loop_lag.start()
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logfire.info(f"Health endpoint listening on http://{self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """Stop serving."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def gateway_connected(self) -> bool:
+        """The bot is logged in and its heartbeat latency is known."""
+        bot = self.bot
+        return bot is not None and bot.is_ready() and not bot.is_closed() and math.isfinite(bot.latency)
+
+    async def database_reachable(self) -> bool:
+        """The database answers a trivial query."""
+        try:
+            await asyncio.wait_for(asyncio.to_thread(db.execute_sql, "SELECT 1"), timeout=DB_CHECK_TIMEOUT)
+            return True
+        except Exception as e:
+            logfire.warn(f"Health check: database unreachable: {e}")
+            return False
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        """200 when healthy, 503 with the failing checks otherwise."""
+        checks = {"gateway": self.gateway_connected(), "database": await self.database_reachable()}
+        return web.json_response({"ok": all(checks.values()), **checks}, status=200 if all(checks.values()) else 503)
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Prometheus text format."""
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+
+def _register_default_collectors(server: HealthServer) -> None:
+    registry = server.registry
+
+    @registry.register
+    def gateway() -> Iterable[Metric]:
+        latency = Metric("vwr_gateway_latency_seconds", "gauge", "Gateway heartbeat latency per shard")
+        guilds = Metric("vwr_guilds", "gauge", "Guilds per shard")
+        events = Metric("vwr_gateway_events_total", "counter", "Gateway events per shard")
+        reconnects = Metric("vwr_gateway_reconnects_total", "counter", "Gateway reconnects per shard")
+        for shard in shard_metrics.snapshot():
+            labels = {"shard": shard["shard_id"]}
+            latency.add(shard["latency"], **labels)
+            guilds.add(shard["guilds"], **labels)
+            events.add(shard["events"], **labels)
+            reconnects.add(shard["reconnects"], **labels)
+        up = Metric("vwr_gateway_up", "gauge", "1 when the gateway is connected").add(server.gateway_connected())
+        return [up, latency, guilds, events, reconnects]
+
+    @registry.register
+    def event_loop() -> Iterable[Metric]:
+        return [
+            Metric("vwr_event_loop_lag_seconds", "gauge", "Last measured event loop lag").add(server.loop_lag.lag),
+            Metric("vwr_event_loop_lag_max_seconds", "gauge", "Largest event loop lag since the last scrape").add(
+                server.loop_lag.take_max()
+            ),
+            Metric("vwr_event_loop_tasks", "gauge", "Pending asyncio tasks").add(len(asyncio.all_tasks())),
+        ]
+
+    @registry.register
+    def database() -> Iterable[Metric]:
+        metrics = [
+            Metric("vwr_db_queries_total", "counter", "SQL queries").add(
+                sum(s.sql_queries for s in instrumentation.commands.values()) + instrumentation.background.sql_queries
+            )
+        ]
+        # Only pooled databases (playhouse.pool) have these, a plain connection is one per thread.
+        in_use = getattr(db, "_in_use", None)
+        if in_use is not None:
+            idle = getattr(db, "_connections", [])
+            metrics.append(Metric("vwr_db_pool_in_use", "gauge", "Connections checked out").add(len(in_use)))
+            metrics.append(Metric("vwr_db_pool_idle", "gauge", "Idle pooled connections").add(len(idle)))
+            max_connections = getattr(db, "_max_connections", None)
+            if max_connections:
+                metrics.append(
+                    Metric("vwr_db_pool_utilisation", "gauge", "Fraction of the pool in use").add(
+                        len(in_use) / max_connections
+                    )
+                )
+        return metrics
+
+    @registry.register
+    def caches() -> Iterable[Metric]:
+        hits = Metric("vwr_cache_hits_total", "counter", "Guild cache hits")
+        misses = Metric("vwr_cache_misses_total", "counter", "Guild cache misses")
+        for cache in guild_cache.caches():
+            hits.add(cache.hits, cache=cache.name)
+            misses.add(cache.misses, cache=cache.name)
+        return [hits, misses]
+
+    @registry.register
+    def lookups() -> Iterable[Metric]:
+        calls = Metric("vwr_lookups_total", "counter", "Single-flight lookups")
+        coalesced = Metric("vwr_lookups_coalesced_total", "counter", "Lookups that shared an in-flight query")
+        for flight in flights():
+            calls.add(flight.stats.calls, lookup=flight.name)
+            coalesced.add(flight.stats.coalesced, lookup=flight.name)
+        zwift = Metric("vwr_zwift_requests_total", "counter", "ZwiftPower/ZwiftRacing lookups by outcome")
+        for outcome, value in zwift_client.stats.__dict__.items():
+            zwift.add(value, outcome=outcome)
+        return [calls, coalesced, zwift]
+
+    @registry.register
+    def queues() -> Iterable[Metric]:
+        depth = Metric("vwr_queue_depth", "gauge", "Items waiting in background queues")
+        depth.add(activity_log.depth, queue="activity_log")
+        depth.add(welcome_queue.depth, queue="welcome")
+        depth.add(match_scheduler.depth, queue="match_reminders")
+        dropped = Metric("vwr_queue_dropped_total", "counter", "Items dropped by background queues")
+        dropped.add(activity_log.stats.dropped, queue="activity_log")
+        dropped.add(welcome_queue.stats.dropped, queue="welcome")
+        metrics = [depth, dropped]
+        if bus_client is not None:
+            metrics.append(
+                Metric("vwr_cluster_bus_messages_total", "counter", "Cluster bus messages")
+                .add(bus_client.sent, direction="sent")
+                .add(bus_client.received, direction="received")
+                .add(bus_client.dropped, direction="dropped")
+            )
+        return metrics
+
+    @registry.register
+    def backups() -> Iterable[Metric]:
+        if not sqlite_backup.enabled:
+            return []
+        report = sqlite_backup.last_report
+        failures = Metric("vwr_backup_failures_total", "counter", "Failed database backups").add(sqlite_backup.failures)
+        if report is None:
+            return [failures]
+        return [
+            failures,
+            Metric("vwr_backup_duration_seconds", "gauge", "Duration of the last backup").add(report.seconds),
+            Metric("vwr_backup_size_bytes", "gauge", "Size of the last snapshot").add(report.bytes),
+            Metric("vwr_backup_timestamp_seconds", "gauge", "When the last backup finished").add(report.finished_at),
+        ]
+
+    @registry.register
+    def commands() -> Iterable[Metric]:
+        latency = Metric("vwr_command_duration_seconds", "histogram", "Command and callback latency")
+        sql = Metric("vwr_command_sql_queries_total", "counter", "SQL queries run by commands")
+        errors = Metric("vwr_command_errors_total", "counter", "Failed commands")
+        deferred = Metric("vwr_command_auto_deferred_total", "counter", "Commands deferred by the 3 second budget")
+        for name, stats in instrumentation.commands.items():
+            cumulative = 0
+            for bound, count in zip((*stats.latency.buckets, math.inf), stats.latency.counts, strict=True):
+                cumulative += count
+                latency.add(cumulative, "_bucket", command=name, le="+Inf" if bound == math.inf else bound)
+            latency.add(stats.latency.sum, "_sum", command=name)
+            latency.add(stats.latency.count, "_count", command=name)
+            sql.add(stats.sql_queries, command=name)
+            errors.add(stats.errors, command=name)
+        for name, stats in deferral_budget.stats.items():
+            deferred.add(stats.deferred, command=name)
+        return [latency, sql, errors, deferred]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if not value.is_integer() else str(int(value))
+
+
+health_server = HealthServer.from_env()
+
+
+if __name__ == "__main__":
+
+    async def _serve_without_bot():
+        health_server.port = health_server.port or 8080
+        await health_server.start(bot=None)
+        await asyncio.Event().wait()
+
+    asyncio.run(_serve_without_bot())
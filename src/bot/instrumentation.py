@@ -0,0 +1,183 @@
+"""Per command latency, SQL and Discord REST instrumentation.
+
+Runs as the outermost middleware, so it sees every slash/user command and every wrapped modal/view callback.
+While a command runs, its counters live in a ContextVar: the wrapped ``db.execute_sql`` and ``bot.http.request``
+add to whatever command is running in the current task (``asyncio.to_thread`` copies the context, so queries run in
+worker threads are counted too). Results are kept in memory for ``/admin stats`` and exported as logfire metrics.
+"""
+
+import bisect
+import contextlib
+import functools
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import discord
+import logfire
+
+from src.bot.middleware import InteractionCall, Middleware
+
+# Upper bounds in seconds, the last bucket is +Inf.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed bucket histogram with percentile estimates."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record one value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        """Estimate the p-th percentile (0-100) by interpolating inside the bucket it falls in."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        """Average value."""
+        return self.sum / self.count if self.count else 0.0
+
+
+@dataclass
+class CallCounters:
+    """What one invocation did, filled in while it runs."""
+
+    sql_queries: int = 0
+    sql_seconds: float = 0.0
+    rest_calls: int = 0
+
+
+@dataclass
+class CommandStats:
+    """Totals for one command or callback."""
+
+    calls: int = 0
+    errors: int = 0
+    latency: Histogram = field(default_factory=Histogram)
+    sql_queries: int = 0
+    sql_seconds: float = 0.0
+    max_sql_queries: int = 0
+    rest_calls: int = 0
+
+    def record(self, elapsed: float, counters: CallCounters, failed: bool) -> None:
+        """Add one invocation."""
+        self.calls += 1
+        self.errors += failed
+        self.latency.observe(elapsed)
+        self.sql_queries += counters.sql_queries
+        self.sql_seconds += counters.sql_seconds
+        self.max_sql_queries = max(self.max_sql_queries, counters.sql_queries)
+        self.rest_calls += counters.rest_calls
+
+
+_current: ContextVar[CallCounters | None] = ContextVar("instrumentation_call", default=None)
+
+
+class Instrumentation(Middleware):
+    """Record latency, SQL queries and REST calls per command."""
+
+    def __init__(self):
+        self.commands: dict[str, CommandStats] = {}
+        # Work done outside of any command: listeners, background tasks.
+        self.background = CallCounters()
+        self._latency_metric = logfire.metric_histogram(
+            "vwr.command.duration", unit="s", description="Command and callback latency"
+        )
+        self._sql_metric = logfire.metric_counter("vwr.command.sql_queries", description="SQL queries per command")
+        self._rest_metric = logfire.metric_counter("vwr.command.rest_calls", description="Discord REST calls")
+        self._error_metric = logfire.metric_counter("vwr.command.errors", description="Failed commands")
+
+    async def before(self, call: InteractionCall) -> None:
+        """Start counting for this invocation."""
+        counters = CallCounters()
+        call.state["instrumentation"] = (counters, _current.set(counters))
+
+    async def after(self, call: InteractionCall, error: BaseException | None) -> None:
+        """Record the invocation and export it."""
+        counters, token = call.state.pop("instrumentation", (None, None))
+        if counters is None:
+            return
+        # after() may run in a different context than before(), the command's context is discarded anyway.
+        with contextlib.suppress(ValueError):
+            _current.reset(token)
+        elapsed = call.elapsed
+        self.commands.setdefault(call.name, CommandStats()).record(elapsed, counters, error is not None)
+        attributes = {"command": call.name}
+        self._latency_metric.record(elapsed, attributes)
+        self._sql_metric.add(counters.sql_queries, attributes)
+        self._rest_metric.add(counters.rest_calls, attributes)
+        if error is not None:
+            self._error_metric.add(1, attributes)
+
+    def record_query(self, seconds: float) -> None:
+        """Count a SQL query against the running command."""
+        counters = _current.get() or self.background
+        counters.sql_queries += 1
+        counters.sql_seconds += seconds
+
+    def record_rest_call(self) -> None:
+        """Count a Discord REST call against the running command."""
+        (_current.get() or self.background).rest_calls += 1
+
+    def install_db(self, db) -> None:
+        """Wrap the peewee database so every query is counted."""
+        original = db.execute_sql
+
+        @functools.wraps(original)
+        def execute_sql(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.record_query(time.perf_counter() - started)
+
+        db.execute_sql = execute_sql
+
+    def install_http(self, bot: discord.Client) -> None:
+        """Wrap the bot's HTTP client so every REST call is counted."""
+        original = bot.http.request
+
+        @functools.wraps(original)
+        async def request(*args, **kwargs):
+            self.record_rest_call()
+            return await original(*args, **kwargs)
+
+        bot.http.request = request
+
+    def install(self, bot: discord.Client, db) -> None:
+        """Hook into the database and the bot's HTTP client."""
+        self.install_db(db)
+        self.install_http(bot)
+
+    def top(self, limit: int = 20, sort: str = "calls") -> list[tuple[str, CommandStats]]:
+        """The busiest commands, sorted by calls, p99 or sql."""
+        keys = {
+            "calls": lambda item: item[1].calls,
+            "p99": lambda item: item[1].latency.percentile(99),
+            "sql": lambda item: item[1].sql_queries / max(item[1].calls, 1),
+        }
+        return sorted(self.commands.items(), key=keys.get(sort, keys["calls"]), reverse=True)[:limit]
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,151 @@
+"""Automatic deferral of interactions that are about to miss Discord's 3 second deadline.
+
+If a command or callback has not answered within the budget, the interaction is deferred so Discord shows
+"thinking..." instead of "interaction failed". Commands are deferred ephemeral unless they are marked
+``public_reply``, components are deferred invisibly so their answers keep their own visibility.
+
+The interaction's response is replaced by a ``BudgetedResponse``: the deferral and the handler's first answer take
+the same per-interaction lock, so they never both send an initial response. An answer that comes after the
+deferral is sent as a followup (or edits the original message), and an explicit ``defer()`` becomes a no-op.
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass
+
+import discord
+import logfire
+from dotenv import load_dotenv
+
+from src.bot.middleware import InteractionCall, Middleware
+
+load_dotenv()
+
+
+@dataclass
+class DeferralStats:
+    """Per command deferral counters."""
+
+    invocations: int = 0
+    deferred: int = 0
+    defer_failed: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def deferred_ratio(self) -> float:
+        """Fraction of invocations that had to be deferred."""
+        return self.deferred / self.invocations if self.invocations else 0.0
+
+
+class BudgetedResponse(discord.InteractionResponse):
+    """An interaction response whose first answer cannot race the automatic deferral."""
+
+    __slots__ = ("_auto_deferred", "_gate")
+
+    def __init__(self, parent: discord.Interaction):
+        super().__init__(parent)
+        self._gate = asyncio.Lock()
+        # None until the budget deferred the interaction, then whether that deferral was ephemeral.
+        self._auto_deferred: bool | None = None
+
+    @classmethod
+    def install(cls, interaction: discord.Interaction) -> "BudgetedResponse":
+        """Replace the interaction's response, before the handler answers."""
+        response = interaction.response
+        if isinstance(response, cls):
+            return response
+        budgeted = cls(interaction)
+        budgeted._responded = response.is_done()
+        # Interaction.response is a cached slot property, there is no public hook to swap its class.
+        interaction._cs_response = budgeted
+        return budgeted
+
+    async def auto_defer(self, ephemeral: bool) -> bool:
+        """Defer unless the interaction was answered already. Returns True if it was deferred here."""
+        async with self._gate:
+            if self.is_done():
+                return False
+            if self._parent.type is discord.InteractionType.component:
+                await super().defer(invisible=True)
+            else:
+                await super().defer(ephemeral=ephemeral)
+            self._auto_deferred = ephemeral
+            return True
+
+    async def defer(self, *, ephemeral: bool = False, invisible: bool = True) -> None:
+        """Defer the interaction, a no-op once the budget deferred it."""
+        async with self._gate:
+            if self._auto_deferred is None:
+                await super().defer(ephemeral=ephemeral, invisible=invisible)
+
+    async def send_message(self, *args, **kwargs):
+        """Send the initial response, or a followup once the budget deferred the interaction."""
+        async with self._gate:
+            if self._auto_deferred is None:
+                return await super().send_message(*args, **kwargs)
+        ephemeral = kwargs.get("ephemeral", False)
+        if self._parent.type is discord.InteractionType.application_command and ephemeral != self._auto_deferred:
+            # The first followup replaces the "thinking..." message, which keeps the visibility of the deferral.
+            logfire.warn(
+                f"Auto-deferred interaction {self._parent.id} with ephemeral={self._auto_deferred}, "
+                f"the reply asked for ephemeral={ephemeral}"
+            )
+        return await self._parent.followup.send(*args, **kwargs)
+
+    async def edit_message(self, **kwargs):
+        """Edit the component's message, through the original response once the budget deferred it."""
+        async with self._gate:
+            if self._auto_deferred is None:
+                return await super().edit_message(**kwargs)
+        return await self._parent.edit_original_response(**kwargs)
+
+    async def send_modal(self, modal: discord.ui.Modal):
+        """Send a modal, which is only possible before any deferral."""
+        async with self._gate:
+            return await super().send_modal(modal)
+
+
+class DeferralBudget(Middleware):
+    """Defer any interaction that is still unanswered after ``budget`` seconds."""
+
+    def __init__(self, budget: float = 2.0):
+        self.budget = budget
+        self.stats: dict[str, DeferralStats] = {}
+
+    @classmethod
+    def from_env(cls) -> "DeferralBudget":
+        """Create the middleware with the budget from INTERACTION_DEFER_BUDGET (seconds)."""
+        return cls(budget=float(os.getenv("INTERACTION_DEFER_BUDGET", "2.0")))
+
+    async def before(self, call: InteractionCall) -> None:
+        """Start the deferral timer."""
+        self.stats.setdefault(call.name, DeferralStats()).invocations += 1
+        if not call.skip_auto_defer:
+            response = BudgetedResponse.install(call.interaction)
+            call.state["defer_task"] = asyncio.create_task(self._defer_when_due(call, response))
+
+    async def after(self, call: InteractionCall, error: BaseException | None) -> None:
+        """Cancel the timer and record the handler latency."""
+        task = call.state.pop("defer_task", None)
+        if task is not None:
+            task.cancel()
+        stats = self.stats[call.name]
+        elapsed = call.elapsed
+        stats.total_seconds += elapsed
+        stats.max_seconds = max(stats.max_seconds, elapsed)
+
+    async def _defer_when_due(self, call: InteractionCall, response: BudgetedResponse) -> None:
+        await asyncio.sleep(max(self.budget - call.elapsed, 0))
+        stats = self.stats[call.name]
+        try:
+            if not await response.auto_defer(call.defer_ephemeral):
+                return
+            stats.deferred += 1
+            logfire.warn(f"Auto-deferred {call.name} after {call.elapsed:.2f}s ({stats.deferred}/{stats.invocations})")
+        except discord.HTTPException as e:
+            stats.defer_failed += 1
+            logfire.error(f"Failed to auto-defer {call.name}: {e}")
+
+
+deferral_budget = DeferralBudget.from_env()
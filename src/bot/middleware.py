@@ -0,0 +1,137 @@
+"""Middleware run around application commands and modal/view callbacks.
+
+Slash and user commands are hooked through the bot's before/after invoke hooks, see ``install``.
+Modal and view callbacks are not commands, so they are wrapped with the ``interaction_callback`` decorator.
+"""
+
+import functools
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+import discord
+import logfire
+
+
+@dataclass
+class InteractionCall:
+    """One invocation of a command or callback as seen by the middleware."""
+
+    name: str
+    interaction: discord.Interaction
+    skip_auto_defer: bool = False
+    defer_ephemeral: bool = True
+    started: float = field(default_factory=time.perf_counter)
+    state: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the invocation started."""
+        return time.perf_counter() - self.started
+
+
+class Middleware:
+    """Base class for middleware, override the hooks you need."""
+
+    async def before(self, call: InteractionCall) -> None:
+        """Run before the command or callback."""
+
+    async def after(self, call: InteractionCall, error: BaseException | None) -> None:
+        """Run after the command or callback, also when it raised."""
+
+
+_middlewares: list[Middleware] = []
+# Commands get separate before/after hooks, so the call is parked here between them.
+_pending_calls: dict[int, InteractionCall] = {}
+
+
+def register(middleware: Middleware) -> Middleware:
+    """Add a middleware to the chain, in order of registration."""
+    if middleware not in _middlewares:
+        _middlewares.append(middleware)
+    return middleware
+
+
+def skip_auto_defer(func):
+    """Mark a command or callback that answers with a modal, which cannot be sent after a defer."""
+    func.__skip_auto_defer__ = True
+    return func
+
+
+def public_reply(func):
+    """Mark a command that answers publicly, so an automatic deferral is public too."""
+    func.__public_reply__ = True
+    return func
+
+
+async def _run_before(call: InteractionCall) -> None:
+    for middleware in _middlewares:
+        try:
+            await middleware.before(call)
+        except Exception as e:
+            logfire.error(f"Middleware {type(middleware).__name__}.before failed for {call.name}: {e}")
+
+
+async def _run_after(call: InteractionCall, error: BaseException | None) -> None:
+    for middleware in reversed(_middlewares):
+        try:
+            await middleware.after(call, error)
+        except Exception as e:
+            logfire.error(f"Middleware {type(middleware).__name__}.after failed for {call.name}: {e}")
+
+
+def install(bot: discord.Bot) -> None:
+    """Hook the middleware chain into every application command of the bot."""
+
+    @bot.before_invoke
+    async def _before_command(ctx: discord.ApplicationContext):
+        call = InteractionCall(
+            name=ctx.command.qualified_name,
+            interaction=ctx.interaction,
+            skip_auto_defer=getattr(ctx.command.callback, "__skip_auto_defer__", False),
+            defer_ephemeral=not getattr(ctx.command.callback, "__public_reply__", False),
+        )
+        _pending_calls[ctx.interaction.id] = call
+        await _run_before(call)
+
+    @bot.after_invoke
+    async def _after_command(ctx: discord.ApplicationContext):
+        call = _pending_calls.pop(ctx.interaction.id, None)
+        if call is not None:
+            # py-cord runs the after hooks in a ``finally``, a failed command's exception is still being handled here.
+            # It is wrapped in ApplicationCommandInvokeError, the middleware gets what the command raised.
+            error = sys.exception()
+            await _run_after(call, getattr(error, "original", error))
+
+
+def interaction_callback(name: str):
+    """Wrap a modal or view callback in the middleware chain.
+
+    Args:
+        name: The name the callback is reported under.
+
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next((a for a in args if isinstance(a, discord.Interaction)), None)
+            if interaction is None:
+                return await func(*args, **kwargs)
+            call = InteractionCall(
+                name=name, interaction=interaction, skip_auto_defer=getattr(func, "__skip_auto_defer__", False)
+            )
+            await _run_before(call)
+            error = None
+            try:
+                return await func(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                await _run_after(call, error)
+
+        return wrapper
+
+    return decorator
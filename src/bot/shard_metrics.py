@@ -0,0 +1,170 @@
+"""Per-shard gateway health: latency, event rates and reconnects.
+
+Works for both ``Bot`` (reported as shard 0) and ``AutoShardedBot``. Events are counted by wrapping
+``bot.dispatch`` and attributed to the shard of the guild they belong to, events without a guild are counted
+under the bot as a whole.
+"""
+
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+import discord
+import logfire
+
+from src.extras import guild_cache
+
+RATE_WINDOW_SECONDS = 60
+
+
+@dataclass
+class ShardStats:
+    """Counters for one shard."""
+
+    shard_id: int
+    connects: int = 0
+    disconnects: int = 0
+    resumes: int = 0
+    events: int = 0
+    last_connect: float | None = None
+    # Per second event counts for the last RATE_WINDOW_SECONDS.
+    _buckets: list[int] = field(default_factory=lambda: [0] * RATE_WINDOW_SECONDS)
+    _bucket_second: int = 0
+
+    @property
+    def reconnects(self) -> int:
+        """Connections after the first one."""
+        return max(self.connects - 1, 0)
+
+    def record_event(self, now: float) -> None:
+        """Count one event."""
+        self.events += 1
+        second = int(now)
+        if second != self._bucket_second:
+            for s in range(max(self._bucket_second + 1, second - RATE_WINDOW_SECONDS + 1), second + 1):
+                self._buckets[s % RATE_WINDOW_SECONDS] = 0
+            self._bucket_second = second
+        self._buckets[second % RATE_WINDOW_SECONDS] += 1
+
+    def event_rate(self, now: float) -> float:
+        """Events per second over the last minute."""
+        first = max(int(now), self._bucket_second) - RATE_WINDOW_SECONDS + 1
+        seconds = range(max(first, self._bucket_second - RATE_WINDOW_SECONDS + 1), self._bucket_second + 1)
+        return sum(self._buckets[s % RATE_WINDOW_SECONDS] for s in seconds) / RATE_WINDOW_SECONDS
+
+
+class ShardMetrics:
+    """Collects ShardStats for a bot."""
+
+    def __init__(self):
+        self.bot: discord.Bot | None = None
+        self.shards: dict[int, ShardStats] = {}
+        self.unsharded_events = 0
+        self.event_types: Counter[str] = Counter()
+
+    def stats(self, shard_id: int) -> ShardStats:
+        """Stats of a shard, created on first use."""
+        if shard_id not in self.shards:
+            self.shards[shard_id] = ShardStats(shard_id)
+        return self.shards[shard_id]
+
+    def install(self, bot: discord.Bot) -> None:
+        """Wrap the bot's dispatch and listen to the shard lifecycle events."""
+        self.bot = bot
+        original_dispatch = bot.dispatch
+
+        def dispatch(event_name: str, *args, **kwargs):
+            self._record(event_name, args)
+            return original_dispatch(event_name, *args, **kwargs)
+
+        bot.dispatch = dispatch
+        sharded = isinstance(bot, discord.AutoShardedBot)
+        if sharded:
+            bot.add_listener(self._on_shard_connect, "on_shard_connect")
+            bot.add_listener(self._on_shard_disconnect, "on_shard_disconnect")
+            bot.add_listener(self._on_shard_resumed, "on_shard_resumed")
+        else:
+            bot.add_listener(self._on_connect, "on_connect")
+            bot.add_listener(self._on_disconnect, "on_disconnect")
+            bot.add_listener(self._on_resumed, "on_resumed")
+        bot.add_listener(self._on_guild_remove, "on_guild_remove")
+
+    def _record(self, event_name: str, args: tuple) -> None:
+        self.event_types[event_name] += 1
+        guild_id = _guild_id_of(args)
+        if guild_id is None:
+            self.unsharded_events += 1
+            return
+        self.stats(guild_cache.shard_for(guild_id)).record_event(time.time())
+
+    async def _on_shard_connect(self, shard_id: int) -> None:
+        stats = self.stats(shard_id)
+        stats.connects += 1
+        stats.last_connect = time.time()
+        if stats.connects > 1:
+            logfire.warn(f"Shard {shard_id} reconnected ({stats.reconnects} reconnects)")
+
+    async def _on_shard_disconnect(self, shard_id: int) -> None:
+        self.stats(shard_id).disconnects += 1
+        logfire.warn(f"Shard {shard_id} disconnected")
+
+    async def _on_shard_resumed(self, shard_id: int) -> None:
+        self.stats(shard_id).resumes += 1
+
+    async def _on_connect(self) -> None:
+        await self._on_shard_connect(0)
+
+    async def _on_disconnect(self) -> None:
+        await self._on_shard_disconnect(0)
+
+    async def _on_resumed(self) -> None:
+        await self._on_shard_resumed(0)
+
+    async def _on_guild_remove(self, guild: discord.Guild) -> None:
+        guild_cache.drop_guild(guild.id)
+
+    def latencies(self) -> dict[int, float]:
+        """Gateway heartbeat latency in seconds per shard."""
+        if self.bot is None:
+            return {}
+        if isinstance(self.bot, discord.AutoShardedBot):
+            return dict(self.bot.latencies)
+        return {0: self.bot.latency}
+
+    def snapshot(self) -> list[dict]:
+        """Current values for every shard, for the admin command and the metrics endpoint."""
+        now = time.time()
+        latencies = self.latencies()
+        shard_ids = sorted(set(latencies) | set(self.shards))
+        guild_counts = Counter(guild_cache.shard_for(g.id) for g in self.bot.guilds) if self.bot else Counter()
+        return [
+            {
+                "shard_id": shard_id,
+                "latency": latencies.get(shard_id, float("nan")),
+                "guilds": guild_counts.get(shard_id, 0),
+                "events": self.stats(shard_id).events,
+                "event_rate": self.stats(shard_id).event_rate(now),
+                "connects": self.stats(shard_id).connects,
+                "disconnects": self.stats(shard_id).disconnects,
+                "reconnects": self.stats(shard_id).reconnects,
+                "resumes": self.stats(shard_id).resumes,
+            }
+            for shard_id in shard_ids
+        ]
+
+
+def _guild_id_of(args: tuple) -> int | None:
+    """Best effort guild id of an event from its first argument."""
+    if not args:
+        return None
+    first = args[0]
+    if isinstance(first, discord.Guild):
+        return first.id
+    guild_id = getattr(first, "guild_id", None)
+    if guild_id is not None:
+        return guild_id
+    guild = getattr(first, "guild", None)
+    return getattr(guild, "id", None)
+
+
+shard_metrics = ShardMetrics()
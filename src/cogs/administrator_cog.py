@@ -1,6 +1,24 @@
+import asyncio
+import os
+
+import discord
 import logfire
 from discord import slash_command
-from discord.ext import commands
+from discord.ext import commands, tasks
+
+from src.bot.cluster_bus import is_primary_worker
+from src.bot.instrumentation import instrumentation
+from src.bot.shard_metrics import shard_metrics
+from src.database.archive import match_archive
+from src.database.backup import sqlite_backup
+from src.database.export import FORMATS, TABLES, export_table
+from src.extras.channel_mgnt import provision_orgs
+from src.extras.role_sync import role_reconciler
+from src.extras.roles_mgnt import BaseRole, check_user_roles
+from src.extras.singleflight import flights
+from src.extras.zwid_verification import zwid_verifier
+
+MAX_UPLOAD_BYTES = 8 * 1024 * 1024  # Discord's attachment limit without boosts
 
 
 class AdminCog(commands.Cog):
@@ -8,6 +26,21 @@ class AdminCog(commands.Cog):
 
     def __init__(self, bot):  # this is a special method that is called when the cog is loaded
         self.bot = bot
+        # Every cluster worker syncs the roles of the guilds on its own shards.
+        self.incremental_role_sync.start()
+        if is_primary_worker():
+            self.zwid_verification.start()
+            self.match_archival.start()
+            self.database_backup.start()
+
+    def cog_unload(self):
+        """Stop background jobs when the cog is unloaded."""
+        self.incremental_role_sync.cancel()
+        self.zwid_verification.cancel()
+        self.match_archival.cancel()
+        self.database_backup.cancel()
+
+    admin = discord.SlashCommandGroup("admin", "Server admin commands.")
 
     @slash_command(name="list_roles")
     async def list_roles(self, ctx):
@@ -23,6 +56,225 @@ class AdminCog(commands.Cog):
             logfire.error(f"Failed to list roles and permissions: {e}")
             await ctx.send("❌ Failed to list roles and permissions.")
 
+    @admin.command(name="reconcile_roles", description="Bring Discord roles in line with club/team membership.")
+    async def reconcile_roles(self, ctx, incremental: bool = False, dry_run: bool = False):
+        """Reconcile member roles with the database. PRESS ENTER."""
+        with logfire.span("RECONCILE ROLES"):
+            check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+            if not check:
+                await ctx.respond(f"Error: {msg}", ephemeral=True)
+                return
+            await ctx.respond("Role sync started, this can take a few minutes.", ephemeral=True)
+            try:
+                report = await role_reconciler.run(ctx.guild, incremental=incremental, dry_run=dry_run)
+                await ctx.followup.send(report.summary(), ephemeral=True)
+            except Exception as e:
+                logfire.error(f"Role sync failed: {e}", exc_info=True)
+                await ctx.followup.send("❌ Role sync failed, progress is checkpointed.", ephemeral=True)
+
+    @admin.command(name="provision_orgs", description="Create roles and channels for clubs and teams missing them.")
+    async def provision(self, ctx, concurrency: int = 5):
+        """Bulk create club/team roles and channels, e.g. at season start. PRESS ENTER."""
+        with logfire.span("PROVISION ORGS CMD"):
+            check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+            if not check:
+                await ctx.respond(f"Error: {msg}", ephemeral=True)
+                return
+            await ctx.respond("Provisioning started.", ephemeral=True)
+            try:
+                report = await provision_orgs(ctx.guild, concurrency=max(1, min(concurrency, 10)))
+                await ctx.followup.send(report.summary(), ephemeral=True)
+            except Exception as e:
+                logfire.error(f"Provisioning failed: {e}", exc_info=True)
+                await ctx.followup.send("❌ Provisioning failed.", ephemeral=True)
+
+    @admin.command(name="shards", description="Gateway latency, event rate and reconnects per shard.")
+    async def shards(self, ctx):
+        """Show per shard gateway health. PRESS ENTER."""
+        check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+        if not check:
+            await ctx.respond(f"Error: {msg}", ephemeral=True)
+            return
+        lines = [
+            f"`{s['shard_id']:>3}` {s['latency'] * 1000:.0f} ms, {s['guilds']} guilds, "
+            f"{s['event_rate']:.1f} events/s, {s['reconnects']} reconnects, {s['resumes']} resumes"
+            for s in shard_metrics.snapshot()
+        ]
+        await ctx.respond("\n".join(lines) or "No shard data yet.", ephemeral=True)
+
+    @admin.command(name="stats", description="Latency, SQL queries and REST calls per command.")
+    async def stats(
+        self,
+        ctx,
+        sort: discord.Option(str, "Sort by", choices=["calls", "p99", "sql"], default="calls"),
+    ):
+        """Show per command instrumentation. PRESS ENTER."""
+        check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+        if not check:
+            await ctx.respond(f"Error: {msg}", ephemeral=True)
+            return
+        lines = [
+            f"`{name}` {s.calls} calls, {s.errors} errors, "
+            f"p50/p95/p99 {s.latency.percentile(50) * 1000:.0f}/{s.latency.percentile(95) * 1000:.0f}/"
+            f"{s.latency.percentile(99) * 1000:.0f} ms, "
+            f"{s.sql_queries / s.calls:.1f} queries "
+            f"({s.sql_seconds / s.calls * 1000:.1f} ms, max {s.max_sql_queries}), "
+            f"{s.rest_calls / s.calls:.1f} REST calls"
+            for name, s in instrumentation.top(sort=sort)
+        ]
+        background = instrumentation.background
+        lines.append(
+            f"Outside commands: {background.sql_queries} queries ({background.sql_seconds:.1f} s), "
+            f"{background.rest_calls} REST calls"
+        )
+        lines.extend(
+            f"`{flight.name}` {flight.stats.calls} lookups, {flight.stats.coalesced} coalesced "
+            f"({flight.stats.coalesced_ratio:.0%})"
+            for flight in flights()
+        )
+        embed = discord.Embed(title="Command stats", description="\n".join(lines)[:4096], color=discord.Color.blue())
+        await ctx.respond(embed=embed, ephemeral=True)
+
+    @admin.command(name="verify_zwids", description="Verify Zwift IDs against stored race results.")
+    async def verify_zwids(self, ctx, full: bool = False):
+        """Run the zwid verification job now. PRESS ENTER."""
+        check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+        if not check:
+            await ctx.respond(f"Error: {msg}", ephemeral=True)
+            return
+        await ctx.defer(ephemeral=True)
+        try:
+            report = await zwid_verifier.run_async(full=full)
+        except Exception as e:
+            logfire.error(f"Zwid verification failed: {e}", exc_info=True)
+            await ctx.respond("❌ Zwid verification failed.", ephemeral=True)
+            return
+        lines = [report.summary()]
+        lines.extend(
+            f"zwid `{c.zwid}` of <@{c.owner_discord_id}> raced match {c.match_id}, rostered riders without a result: "
+            + ", ".join(f"<@{d}>" for d in c.unmatched_discord_ids)
+            for c in report.conflicts[:20]
+        )
+        await ctx.respond("\n".join(lines)[:2000], ephemeral=True)
+
+    @admin.command(name="export", description="Export a table as a gzip-compressed CSV or JSONL file.")
+    async def export(
+        self,
+        ctx,
+        table: discord.Option(str, "What to export.", choices=sorted(TABLES)),
+        fmt: discord.Option(str, "File format.", name="format", choices=list(FORMATS), default="csv"),
+    ):
+        """Export users, clubs, teams or match results. PRESS ENTER."""
+        check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+        if not check:
+            await ctx.respond(f"Error: {msg}", ephemeral=True)
+            return
+        await ctx.defer(ephemeral=True)
+        try:
+            report = await asyncio.to_thread(export_table, table, fmt)
+        except Exception as e:
+            logfire.error(f"Export of {table} failed: {e}", exc_info=True)
+            await ctx.respond("❌ Export failed.", ephemeral=True)
+            return
+        logfire.info(f"{ctx.author} exported {table}: {report.summary()}")
+        if report.bytes > MAX_UPLOAD_BYTES:
+            await ctx.respond(f"{report.summary()}\nToo large to upload, it is on the server.", ephemeral=True)
+            return
+        attachment = discord.File(report.path, filename=os.path.basename(report.path))
+        await ctx.respond(report.summary(), file=attachment, ephemeral=True)
+
+    @admin.command(name="archive_matches", description="Move the matches of past seasons to the archive.")
+    async def archive_matches(self, ctx):
+        """Archive the matches older than ARCHIVE_KEEP_SEASONS now. PRESS ENTER."""
+        check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+        if not check:
+            await ctx.respond(f"Error: {msg}", ephemeral=True)
+            return
+        await ctx.defer(ephemeral=True)
+        try:
+            report = await asyncio.to_thread(match_archive.archive_matches)
+        except Exception as e:
+            logfire.error(f"Match archival failed: {e}", exc_info=True)
+            await ctx.respond("❌ Match archival failed.", ephemeral=True)
+            return
+        await ctx.respond(report.summary(), ephemeral=True)
+
+    @tasks.loop(hours=24)
+    async def match_archival(self):
+        """Archive a season once it falls behind the kept seasons, a single query on the other days."""
+        try:
+            await asyncio.to_thread(match_archive.archive_matches)
+        except Exception as e:
+            logfire.error(f"Scheduled match archival failed: {e}", exc_info=True)
+
+    @match_archival.before_loop
+    async def before_match_archival(self):
+        """Wait until the database is initialised in on_ready."""
+        await self.bot.wait_until_ready()
+
+    @admin.command(name="backup", description="Take a snapshot of the SQLite database.")
+    async def backup(self, ctx):
+        """Back up the SQLite database now. PRESS ENTER."""
+        check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+        if not check:
+            await ctx.respond(f"Error: {msg}", ephemeral=True)
+            return
+        if not sqlite_backup.enabled:
+            await ctx.respond("The database is not a SQLite file, nothing to back up.", ephemeral=True)
+            return
+        await ctx.defer(ephemeral=True)
+        try:
+            report = await asyncio.to_thread(sqlite_backup.backup)
+        except Exception as e:
+            logfire.error(f"Database backup failed: {e}", exc_info=True)
+            await ctx.respond("❌ Database backup failed.", ephemeral=True)
+            return
+        await ctx.respond(f"{report.summary()}\n{len(sqlite_backup.snapshots())} snapshots kept.", ephemeral=True)
+
+    @tasks.loop(hours=24)
+    async def database_backup(self):
+        """Daily snapshot of a SQLite database, taken in a worker thread."""
+        if not sqlite_backup.enabled:
+            return
+        try:
+            await asyncio.to_thread(sqlite_backup.backup)
+        except Exception as e:
+            logfire.error(f"Scheduled database backup failed: {e}", exc_info=True)
+
+    @database_backup.before_loop
+    async def before_database_backup(self):
+        """Wait until the database is initialised in on_ready."""
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=24)
+    async def zwid_verification(self):
+        """Pick up results stored since the last run."""
+        try:
+            report = await zwid_verifier.run_async()
+            for conflict in report.conflicts:
+                logfire.warn(f"Zwid conflict: {conflict}")
+        except Exception as e:
+            logfire.error(f"Scheduled zwid verification failed: {e}", exc_info=True)
+
+    @zwid_verification.before_loop
+    async def before_zwid_verification(self):
+        """Wait until the database is initialised in on_ready."""
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=1)
+    async def incremental_role_sync(self):
+        """Pick up membership changes whose role update failed."""
+        for guild in self.bot.guilds:
+            try:
+                await role_reconciler.run(guild, incremental=True)
+            except Exception as e:
+                logfire.error(f"Scheduled role sync failed for {guild.name}: {e}", exc_info=True)
+
+    @incremental_role_sync.before_loop
+    async def before_incremental_role_sync(self):
+        """Wait for the guild cache before the first run."""
+        await self.bot.wait_until_ready()
+
 
 def setup(bot):
     """Pycord calls to setup the cog."""
@@ -0,0 +1,188 @@
+"""Match related commands."""
+
+import asyncio
+import re
+from datetime import datetime
+
+import discord
+import logfire
+from discord.ext import commands
+
+from src.cogs.user_cog import team_autocomplete
+from src.database.db_models import Team
+from src.database.org_index import team_index
+from src.extras.activity_log import activity_log
+from src.extras.vwr_exceptions import MatchConflict, MatchNotFound
+from src.forms.match_forms import handle_match_accept, match_message
+from src.match.setup_match import (
+    captain_team,
+    get_match,
+    propose_match,
+    set_roster,
+    start_timestamp,
+    team_riders,
+    team_side,
+    upcoming_matches,
+    utc_now,
+)
+
+START_FORMAT = "%Y-%m-%d %H:%M"
+MENTION = re.compile(r"<@!?(\d+)>")
+
+
+class MatchCog(commands.Cog):
+    """Match related cogs."""
+
+    def __init__(self, bot):  # this is a special method that is called when the cog is loaded
+        self.bot = bot
+
+    matches = discord.SlashCommandGroup("match", "Match commands for team captains.")
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        """Route clicks on match Accept buttons, they carry the match and its version in the custom_id."""
+        await handle_match_accept(interaction)
+
+    async def _captain(self, ctx) -> int | None:
+        team_id = await asyncio.to_thread(captain_team, ctx.author.id)
+        if team_id is None:
+            await ctx.respond("Error: Only team captains (team admins) can manage matches.", ephemeral=True)
+        return team_id
+
+    @matches.command(name="propose")
+    async def propose(
+        self,
+        ctx,
+        opponent: discord.Option(str, "Start typing the opposing team's name.", autocomplete=team_autocomplete),
+        start: discord.Option(str, "Start of the race, YYYY-MM-DD HH:MM UTC."),
+        course: discord.Option(str, "Course name.", required=False, default=None),
+        laps: discord.Option(int, "Number of laps.", required=False, default=None, min_value=1),
+        race_link: discord.Option(str, "Link to the Zwift event.", required=False, default=None),
+    ):
+        """Challenge another team to a match."""
+        with logfire.span("PROPOSE MATCH"):
+            team_id = await self._captain(ctx)
+            if team_id is None:
+                return
+            entry = team_index.resolve(opponent)
+            if entry is None or entry.key == team_id:
+                await ctx.respond(f"Error: `{opponent}` is not another active team.", ephemeral=True)
+                return
+            try:
+                start_datetime = datetime.strptime(start.strip(), START_FORMAT)
+            except ValueError:
+                await ctx.respond(f"Error: `{start}` is not a date like `2025-01-31 18:00`.", ephemeral=True)
+                return
+            if start_datetime <= utc_now():
+                await ctx.respond("Error: The match has to start in the future.", ephemeral=True)
+                return
+            try:
+                match_id = await propose_match(
+                    team_id, entry.key, start_datetime, course_name=course, laps=laps, race_link=race_link
+                )
+                embed, view = await match_message(await asyncio.to_thread(get_match, match_id))
+            except Exception as e:
+                logfire.error(f"Failed to propose a match: {e}", exc_info=True)
+                await ctx.respond("❌ Failed to propose the match.", ephemeral=True)
+                return
+            await ctx.respond(embed=embed, ephemeral=True)
+            opponent_team = await Team.lookup_async(entry.key)
+            channel = self.bot.get_channel(opponent_team.discord_channel_id) if opponent_team else None
+            if channel is not None:
+                await channel.send(f"⚔️ {ctx.author.mention} challenges you to a match.", embed=embed, view=view)
+                # Clicks are routed by on_interaction from the custom_id, the view is not kept in the view store.
+                if view is not None:
+                    view.stop()
+            else:
+                logfire.warn(f"No channel to post match {match_id} to team {entry.label}")
+            activity_log.post(ctx.guild, f"{ctx.author} proposed match #{match_id} against {entry.label}")
+
+    @matches.command(name="show")
+    async def show(self, ctx, match_id: discord.Option(int, "The match number.")):
+        """Show a match, with an Accept button while it is not accepted by both teams."""
+        try:
+            match = await asyncio.to_thread(get_match, match_id)
+        except MatchNotFound:
+            await ctx.respond(f"Error: Match #{match_id} not found.", ephemeral=True)
+            return
+        embed, view = await match_message(match)
+        await ctx.respond(embed=embed, view=view, ephemeral=True)
+        if view is not None:
+            view.stop()
+
+    @matches.command(name="list")
+    async def list_matches(self, ctx):
+        """List the upcoming matches of your team."""
+        team_id = await self._captain(ctx)
+        if team_id is None:
+            return
+        matches = await asyncio.to_thread(upcoming_matches, team_id)
+        if not matches:
+            await ctx.respond("Your team has no upcoming matches.", ephemeral=True)
+            return
+        lines = []
+        for match in matches:
+            opponent_id = match.team_id_2_id if match.team_id_1_id == team_id else match.team_id_1_id
+            opponent = team_index.get(opponent_id)
+            state = "✅" if match.team_1_accepted and match.team_2_accepted else "⏳"
+            lines.append(
+                f"{state} #{match.id} vs **{opponent.label if opponent else '?'}** "
+                f"<t:{start_timestamp(match.start_datetime)}:R>"
+            )
+        await ctx.respond("\n".join(lines), ephemeral=True)
+
+    @matches.command(name="roster")
+    async def roster(
+        self,
+        ctx,
+        match_id: discord.Option(int, "The match number."),
+        riders: discord.Option(str, "Mention the riders of your team, e.g. @rider1 @rider2."),
+    ):
+        """Set your team's roster for a match, the other team has to accept the match again."""
+        with logfire.span("MATCH ROSTER"):
+            team_id = await self._captain(ctx)
+            if team_id is None:
+                return
+            discord_ids = list(dict.fromkeys(int(discord_id) for discord_id in MENTION.findall(riders)))
+            if not discord_ids:
+                await ctx.respond("Error: Mention at least one rider.", ephemeral=True)
+                return
+            try:
+                match = await asyncio.to_thread(get_match, match_id)
+            except MatchNotFound:
+                await ctx.respond(f"Error: Match #{match_id} not found.", ephemeral=True)
+                return
+            side = team_side(match, team_id)
+            if side is None:
+                await ctx.respond(f"Error: Your team does not play match #{match_id}.", ephemeral=True)
+                return
+            if match.start_datetime and match.start_datetime <= utc_now():
+                await ctx.respond(f"Error: Match #{match_id} has already started.", ephemeral=True)
+                return
+            roster, others = await asyncio.to_thread(team_riders, team_id, discord_ids)
+            if others:
+                mentions = " ".join(f"<@{discord_id}>" for discord_id in others)
+                await ctx.respond(f"Error: Not riders of your team: {mentions}", ephemeral=True)
+                return
+            try:
+                await set_roster(match_id, side, team_id, roster, match.version)
+            except MatchConflict:
+                embed, _ = await match_message(await asyncio.to_thread(get_match, match_id))
+                await ctx.respond(
+                    "⚠️ The match was changed while you edited it, here is the current version. Try again.",
+                    embed=embed,
+                    ephemeral=True,
+                )
+                return
+            except Exception as e:
+                logfire.error(f"Failed to set the roster of match {match_id}: {e}", exc_info=True)
+                await ctx.respond("❌ Failed to set the roster.", ephemeral=True)
+                return
+            embed, _ = await match_message(await asyncio.to_thread(get_match, match_id))
+            await ctx.respond("Roster saved.", embed=embed, ephemeral=True)
+            activity_log.post(ctx.guild, f"{ctx.author} set the roster of match #{match_id}")
+
+
+def setup(bot):
+    """Pycord calls to setup the cog."""
+    bot.add_cog(MatchCog(bot))  # add the cog to the bot
@@ -2,6 +2,7 @@ import discord
 import logfire
 from discord.ext import commands
 
+from src.bot.middleware import public_reply, skip_auto_defer
 from src.extras.roles_mgnt import BaseRole, check_user_roles
 from src.extras.untils import check_channel
 from src.forms.org_forms import CreateOrgForm
@@ -17,6 +18,7 @@ class OrgCog(commands.Cog):
     teams = discord.SlashCommandGroup("team", "Team management commands.")
 
     @clubs.command(name="create")
+    @skip_auto_defer
     async def create_club(self, ctx):
         """Create a new Club. PRES ENTER."""
         with logfire.span("CREATE CLUB"):
@@ -24,7 +26,7 @@ class OrgCog(commands.Cog):
                 ctx, discord_id=ctx.author.id, role_filter=BaseRole.REGISTERED
             )
             if not check_reg:
-                await ctx.response.send_message(
+                await ctx.respond(
                     f"Error: {msg}",
                     ephemeral=True,
                 )
@@ -33,7 +35,7 @@ class OrgCog(commands.Cog):
                 ctx, discord_id=ctx.author.id, role_filter=BaseRole.CLUB_MEMBER
             )
             if check_mem:
-                await ctx.response.send_message(
+                await ctx.respond(
                     "Error: You are already a member of a club. You cannot create a new club.",
                     ephemeral=True,
                 )
@@ -47,9 +49,10 @@ class OrgCog(commands.Cog):
                 await ctx.response.send_modal(create_form)
             except Exception as e:
                 logfire.error(f"Failed to create club: {e}", exc_info=True)
-                await ctx.response.send_message("❌ Failed to create club.", ephemeral=True)
+                await ctx.respond("❌ Failed to create club.", ephemeral=True)
 
     @teams.command(name="create")
+    @skip_auto_defer
     async def create_team(self, ctx):
         """Create a new Team. PRES ENTER."""
         org_type: str = "team"
@@ -59,7 +62,7 @@ class OrgCog(commands.Cog):
                     ctx, discord_id=ctx.author.id, role_filter=BaseRole.REGISTERED
                 )
                 if not check_reg:
-                    await ctx.response.send_message(
+                    await ctx.respond(
                         f"Error: {msg}",
                         ephemeral=True,
                     )
@@ -68,7 +71,7 @@ class OrgCog(commands.Cog):
                     ctx, discord_id=ctx.author.id, role_filter=BaseRole.CLUB_ADMIN
                 )
                 if check_mem:
-                    await ctx.response.send_message(
+                    await ctx.respond(
                         "Error: You must be a CLUB_ADMIN to create a team",
                         ephemeral=True,
                     )
@@ -77,9 +80,10 @@ class OrgCog(commands.Cog):
                 await ctx.response.send_modal(create_form)
             except Exception as e:
                 logfire.error(f"Failed to create {org_type.capitalize()}: {e}", exc_info=True)
-                await ctx.response.send_message(f"❌ Failed to create {org_type.capitalize()}.", ephemeral=True)
+                await ctx.respond(f"❌ Failed to create {org_type.capitalize()}.", ephemeral=True)
 
     @clubs.command(name="review_join_requets")
+    @public_reply
     async def review_join_requests(self, ctx):
         """Review join requests for the club."""
         with logfire.span("REVIEW JOIN REQUESTS"):
@@ -88,7 +92,7 @@ class OrgCog(commands.Cog):
                     ctx, discord_id=ctx.author.id, role_filter=BaseRole.REGISTERED
                 )
                 if not check_reg:
-                    await ctx.response.send_message(
+                    await ctx.respond(
                         f"Error: {msg}",
                         ephemeral=True,
                     )
@@ -97,15 +101,15 @@ class OrgCog(commands.Cog):
                     ctx, discord_id=ctx.author.id, role_filter=BaseRole.CLUB_ADMIN
                 )
                 if not check_mem:
-                    await ctx.response.send_message(
+                    await ctx.respond(
                         "Error: You must be a CLUB_ADMIN to review join requests.",
                         ephemeral=True,
                     )
                     return
-                await ctx.response.send_message("Review join requests.")
+                await ctx.respond("Review join requests.")
             except Exception as e:
                 logfire.error(f"Failed to review join requests: {e}", exc_info=True)
-                await ctx.response.send_message("❌ Failed to review join requests.", ephemeral=True)
+                await ctx.respond("❌ Failed to review join requests.", ephemeral=True)
 
 
 def setup(bot):
@@ -1,65 +1,147 @@
 """User related commands."""
 
+import asyncio
+
 import discord
 import logfire
 from discord import user_command
 from discord.ext import commands
 
-from src.database.db_models import Team, User
+from src.database.db_models import Club, User
+from src.database.org_index import club_index, team_index
+from src.database.user_index import user_index
+from src.extras.activity_log import activity_log
+from src.extras.log import get_logger, lazy
+from src.extras.profile_cache import profile_cache, render_profile
 from src.extras.roles_mgnt import BaseRole, check_user_roles
+from src.extras.search_index import IndexEntry, SearchHit
 from src.extras.vwr_exceptions import UserNotRegistered
+from src.extras.welcome_queue import welcome_queue
+from src.extras.zwift_client import zwift_client
+from src.forms.membership_forms import JoinRequestView, handle_join_decision
 from src.forms.rider_forms import RegistrationForm
 
+TOS_URL = "https://docs.google.com/document/d/1A_taMO8z1iPtLZr4s9KSMtpjwHvFuSNLZAhSVBkPkTk/edit?usp=sharing"
+PP_URL = "https://docs.google.com/document/d/1sG5ZKQVuKbKpVzJErriR9fo9aOJzAUDMER8Znqt6QuM/edit?usp=sharing"
+WEBSITE_URL = "https://sites.google.com/view/virtual-worlds-racing/home"
+log = get_logger("lookups")
+
+SEARCH_RESULTS = 10
+# A profile waits this long for ZwiftRacing. Without its fields the profile is only cached for PROFILE_RETRY_TTL.
+ZWIFTRACING_TIMEOUT = 1.0
+PROFILE_RETRY_TTL = 300.0
+
+INSTRUCTIONS = (
+    "Welcome to Virtual Worlds racing VWR\n"
+    "By registering, you agree to:\n"
+    f"- [Terms of Service, TOS.]({TOS_URL})\n"
+    f"- [Privacy Policy, PP.]({PP_URL})."
+    f"- [Website LINK]{WEBSITE_URL})"
+)
+
+
+def _request_join(ctx, club_id: int, team_id: int) -> User:
+    """Record the join request of the command's author, runs in a worker thread."""
+    user = User.get_or_none(User.discord_id == ctx.author.id)
+    if user is None:
+        raise UserNotRegistered("Discord user needs to register")
+    user.join_request(ctx, org_type="club", org_db_id=club_id)
+    user.join_request(ctx, org_type="team", org_db_id=team_id)
+    return user
+
+
+def _choices(hits: list[SearchHit]) -> list[discord.OptionChoice]:
+    """Autocomplete choices, the value is the database id."""
+    return [discord.OptionChoice(name=hit.entry.label, value=str(hit.entry.key)) for hit in hits]
+
+
+async def club_autocomplete(ctx: discord.AutocompleteContext) -> list[discord.OptionChoice]:
+    """Suggest active clubs matching what the user typed."""
+    return _choices(club_index.search(ctx.value))
+
+
+async def team_autocomplete(ctx: discord.AutocompleteContext) -> list[discord.OptionChoice]:
+    """Suggest active teams, limited to the selected club once one is picked."""
+    club = ctx.options.get("club")
+    where = (lambda e: e.data == int(club)) if club and str(club).isdigit() else None
+    return _choices(team_index.search(ctx.value, where=where))
+
 
 class UserCog(commands.Cog):
     """Rider related cogs."""
 
     def __init__(self, bot):  # this is a special method that is called when the cog is loaded
         self.bot = bot
+        self._registration: RegistrationView | None = None
 
     rider = discord.SlashCommandGroup("rider", "Rider management commands.")
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Register the persistent views once, so buttons posted before a restart keep working."""
+        if self._registration is None:
+            self._registration_view()
+            logfire.info("Persistent views registered.")
+
+    def _registration_view(self) -> "RegistrationView":
+        """The persistent registration view, added to the bot once and reused by every ``/rider register``."""
+        if self._registration is None:
+            self._registration = RegistrationView()
+            self.bot.add_view(self._registration)
+        return self._registration
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        """Route clicks on join request buttons, they carry their state in the custom_id."""
+        await handle_join_decision(interaction)
+
     async def rider_lookup(self, ctx, rider: discord.Member):
         """Look up a Rider in the user registration database."""
-        with logfire.span("RIDER LOOKUP"):
+        with log.span("RIDER LOOKUP", rider_id=rider.id):
             try:
-                logfire.info(f"Looking up rider: {rider}")
                 # Check author role
                 check, msg, roles = await check_user_roles(
                     ctx, discord_id=ctx.author.id, role_filter=BaseRole.REGISTERED
                 )
                 if not check:
-                    await ctx.response.send_message(
+                    await ctx.respond(
                         f"Error: {msg}",
                         ephemeral=True,
                     )
                     return
-                user_profile = User.lookup(discord_id=rider.id)
-                if user_profile:
-                    logfire.info(f"Found user: {user_profile}")
-                    embed = discord.Embed(title="Registration Info", color=discord.Color.blue())
-                    embed.add_field(name="Discord", value=rider.mention, inline=True)
-                    for k, v in user_profile.items():
-                        embed.add_field(name=k, value=v, inline=True)
-                    rider_obj = ctx.guild.get_member(rider.id)
-                    rider_roles = rider_obj.roles
-
-                    embed.add_field(name="Roles", value=str(list(role.name for role in rider_roles)), inline=True)
-                    await ctx.response.send_message(embed=embed, ephemeral=True)
+                embed = profile_cache.get(ctx.guild.id, rider.id)
+                if embed is None:
+                    generation = profile_cache.generation()
+                    user_profile = await User.lookup_async(rider.id)
+                    log.debug("Found user", profile=lazy(lambda: dict(user_profile)))
+                    racing = await zwift_client.zwiftracing_summary(user_profile["zwid"], timeout=ZWIFTRACING_TIMEOUT)
+                    payload = render_profile(
+                        {**user_profile, **(racing or {})}, ctx.guild.get_member(rider.id) or rider
+                    )
+                    ttl = PROFILE_RETRY_TTL if racing is None else None
+                    profile_cache.put(ctx.guild.id, rider.id, payload, generation, ttl=ttl)
+                    embed = discord.Embed.from_dict(payload)
+                await ctx.respond(embed=embed, ephemeral=True)
                 # else:
-                #     await ctx.response.send_message(
+                #     await ctx.respond(
                 #         "Rider not found in Rider registration database. They probably need to register",
                 #         ephemeral=True,
                 #     )
             except UserNotRegistered as e:
                 logfire.info(f"send message: Error: {rider} is not registered. They need to register. {e}")
-                await ctx.response.send_message(
+                await ctx.respond(
                     f"Error: {rider} is not registered. They need to register.",
                     ephemeral=True,
                 )
             except Exception as e:
                 logfire.error(f"Error looking up rider: {e}")
-                await ctx.response.send_message("Error looking up rider.", ephemeral=True)
+                await ctx.respond("Error looking up rider.", ephemeral=True)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        """Drop the cached profile when the member's roles change."""
+        if before.roles != after.roles:
+            profile_cache.invalidate(after.id, guild_id=after.guild.id)
 
     @commands.Cog.listener()  # we can add event listeners to our cog
     async def on_member_join(self, member):
@@ -70,7 +152,7 @@ class UserCog(commands.Cog):
         - See the Popular-Topics/Intents page for more info
         """
         logfire.info(f"{member} joined the server!")
-        await member.send('Welcome to the server! Please register using "register"')
+        welcome_queue.post(member)
 
     @user_command(name="profile", description="Get users profile.")
     async def rider_user_profile(self, ctx, user):
@@ -91,155 +173,141 @@ class UserCog(commands.Cog):
         """Register a new rider. Press  enter: Only works in the '#rider-admin' channel."""
         with logfire.span("RIDER REGISTER"):
             logfire.info(f"{ctx.author} is trying to register.")
-            TOS_URL = "https://docs.google.com/document/d/1A_taMO8z1iPtLZr4s9KSMtpjwHvFuSNLZAhSVBkPkTk/edit?usp=sharing"
-            PP_URL = "https://docs.google.com/document/d/1sG5ZKQVuKbKpVzJErriR9fo9aOJzAUDMER8Znqt6QuM/edit?usp=sharing"
-            WEBSITE_URL = "https://sites.google.com/view/virtual-worlds-racing/home"
-            INSTRUCTIONS = (
-                "Welcome to Virtual Worlds racing VWR\n"
-                "By registering, you agree to:\n"
-                f"- [Terms of Service, TOS.]({TOS_URL})\n"
-                f"- [Privacy Policy, PP.]({PP_URL})."
-                f"- [Website LINK]{WEBSITE_URL})"
-            )
             check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author, role_filter=BaseRole.REGISTERED)
             if check:  # The user is already registered
-                await ctx.response.send_message(
+                await ctx.respond(
                     f"Error: {ctx.author} is already registered.",
                     ephemeral=True,
                 )
+                return
             if ctx.channel.name not in ["welcome-and-rules", "bot-testing"]:
                 await ctx.respond("This command can only be used in the `#rider-admin` channel.", ephemeral=True)
                 logfire.warn(f"{ctx.author} tried to register outside of the rider-admin channel.")
                 return
 
-            reg_view = RegistrationView()
-            # await ctx.send(INSTRUCTIONS, view=reg_view, ephemeral=True)
-            await ctx.response.send_message(INSTRUCTIONS, view=reg_view, ephemeral=True)
-
-    @rider.command(name="join_club_and_team", description="Send a request to join a club.")
-    async def join_club(self, ctx):
-        """Send a request to join a club."""
-        logfire.span("JOIN CLUB and team")
-        check_reg, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.REGISTERED)
-        check_mem, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.CLUB_MEMBER)
-        if not check_reg:
-            await ctx.response.send_message(f"Error: {msg}", ephemeral=True)
+            # An ephemeral response is stored without a message id, under the same key as the persistent view, so
+            # it reuses that view. A new view would replace it, and stopping that copy would drop the handler.
+            await ctx.respond(INSTRUCTIONS, view=self._registration_view(), ephemeral=True)
+
+    @rider.command(name="search", description="Find riders by name, Discord name or Zwift ID.")
+    async def rider_search(
+        self, ctx, query: discord.Option(str, "Part of a name, Discord name or Zwift ID", min_length=2, max_length=100)
+    ):
+        """Search the registered riders. PRESS ENTER."""
+        check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.REGISTERED)
+        if not check:
+            await ctx.respond(f"Error: {msg}", ephemeral=True)
             return
-        # if check_mem:
-        #     await ctx.response.send_message("Error: You are already a member of a Club.", ephemeral=True)
-        #     return
-        try:
-            # Fetch all clubs and their teams (assuming your model provides 'club' and 'name')
-            club_team_map = {}
-            for c in Team.select().where(Team.active):
-                if c.club_id.name not in club_team_map:
-                    club_team_map[c.club_id.name] = []
-                club_team_map[c.club_id.name].append(c.name)
-
-            logfire.info(f"Got team club map, {len(club_team_map)} clubs.")
-            logfire.info(f"Got team club map, {club_team_map} clubs.")
-
-            # Step 1: Create a dropdown for Clubs
-            logfire.info("Creating Club Dropdown")
-            clubs = list(club_team_map.keys())
-
-            logfire.info(f"Got clubs: {len(clubs)}")
-            club_options = [
-                discord.SelectOption(label=club, value=club, description=f"Choose a club {club}") for club in clubs
-            ]
-            logfire.info(f"Got club options: len({club_options})")
-
-            class ClubDropdown(discord.ui.View):
-                def __init__(self):
-                    super().__init__()
-                    self.club_select = discord.ui.Select(
-                        placeholder="Select a club...",
-                        options=club_options,
-                    )
-                    self.club_select.callback = self.club_callback
-                    self.add_item(self.club_select)
-
-                async def club_callback(self, interaction: discord.Interaction):
-                    logfire.info(f"{ctx.author} selected club: {self.club_select.values[0]}")
-                    selected_club = self.club_select.values[0]
-
-                    # Step 2: After Club is selected, provide a dropdown for teams
-                    teams = club_team_map[selected_club]
-                    team_options = [
-                        discord.SelectOption(label=team, description=f"Team in {selected_club}") for team in teams
-                    ]
-                    logfire.info(f"Got team options: len({team_options})")
-
-                    class TeamDropdown(discord.ui.View):
-                        def __init__(self):
-                            super().__init__()
-                            self.team_select = discord.ui.Select(
-                                placeholder=f"Choose a team from {selected_club}...",
-                                options=team_options,
-                            )
-                            self.team_select.callback = self.team_callback
-                            self.add_item(self.team_select)
-
-                        async def team_callback(self, interaction: discord.Interaction):
-                            selected_team = self.team_select.values[0]
-                            logfire.info(f"{ctx.author} selected team: {selected_team}")
-                            # Now we need to lookup the team and club in the database
-                            selected_team = Team.get_or_none(Team.name == selected_team)
-                            selected_club = selected_team.club_id
-                            logfire.info(f"{interaction.user}, Selected team: {selected_team} in club: {selected_club}")
-                            user = User.get_or_none(User.discord_id == interaction.user.id)
-                            user.join_request(interaction.user, org_type="club", org_db_id=selected_club.id)
-                            user.join_request(interaction.user, org_type="team", org_db_id=selected_team.id)
-                            logfire.info("Join request sent.")
-
-                            await interaction.response.send_message(
-                                f"You have requested to join: Club `{selected_club.name}`, Team `{selected_team.name}`.",
-                                ephemeral=True,
-                            )
-                            # Log registration
-                            logfire.info(f"Logging registration for {interaction.user}")
-                            log_channel = discord.utils.get(interaction.guild.channels, name="activity_logs")
-                            if log_channel:
-                                await log_channel.send(
-                                    f"{interaction.user}, requested to join club: {selected_club.name} and team: {selected_team.name}"
-                                )
-
-                    await interaction.response.send_message(
-                        content=f"You selected the club: `{selected_club}`. Now select a team:",
-                        view=TeamDropdown(),
-                        ephemeral=True,
+        hits = user_index.search(query, limit=SEARCH_RESULTS)
+        if not hits:
+            await ctx.respond(f"No riders found for `{query}`.", ephemeral=True)
+            return
+        lines = [
+            f"**{hit.entry.label}** <@{hit.entry.key}> ({hit.entry.data[1]}), Zwift ID `{hit.entry.data[0]}`"
+            for hit in hits
+        ]
+        embed = discord.Embed(
+            title=f"Riders matching '{query}'", description="\n".join(lines), color=discord.Color.blue()
+        )
+        await ctx.respond(embed=embed, ephemeral=True)
+
+    @rider.command(name="post_registration", description="Post the registration instructions in this channel.")
+    async def post_registration(self, ctx):
+        """Post a permanent registration message, its button keeps working across restarts."""
+        with logfire.span("POST REGISTRATION"):
+            check, msg, roles = await check_user_roles(ctx, discord_id=ctx.author.id, role_filter=BaseRole.ADMIN)
+            if not check:
+                await ctx.respond(f"Error: {msg}", ephemeral=True)
+                return
+            view = RegistrationView()
+            await ctx.channel.send(INSTRUCTIONS, view=view)
+            # Stored under the message id. Clicks fall back to the persistent view, this copy is dropped from the store.
+            view.stop()
+            await ctx.respond("Registration instructions posted.", ephemeral=True)
+
+    @rider.command(name="join_club_and_team", description="Send a request to join a club and team.")
+    async def join_club(
+        self,
+        ctx,
+        club: discord.Option(str, "Start typing a club name.", autocomplete=club_autocomplete),
+        team: discord.Option(str, "Start typing a team name.", autocomplete=team_autocomplete),
+    ):
+        """Send a request to join a club and team."""
+        with logfire.span("JOIN CLUB and team"):
+            check_reg, msg, roles = await check_user_roles(
+                ctx, discord_id=ctx.author.id, role_filter=BaseRole.REGISTERED
+            )
+            if not check_reg:
+                await ctx.respond(f"Error: {msg}", ephemeral=True)
+                return
+            try:
+                selected_club = club_index.resolve(club)
+                selected_team = None
+                if selected_club is not None:
+                    selected_team = team_index.resolve(team, where=lambda e: e.data == selected_club.key)
+                if selected_team is None:
+                    await ctx.respond(
+                        "Error: Pick a club and one of its teams from the suggestions.", ephemeral=True
                     )
+                    return
+                logfire.info(f"{ctx.author} selected team: {selected_team.label} in club: {selected_club.label}")
+                user = await asyncio.to_thread(_request_join, ctx, selected_club.key, selected_team.key)
+                logfire.info("Join request sent.")
 
-            # Send the initial Club dropdown to the user
-            await ctx.response.send_message(
-                content="Please select a club to view its teams:",
-                view=ClubDropdown(),
-                ephemeral=True,
-            )
+                await ctx.respond(
+                    f"You have requested to join: Club `{selected_club.label}`, Team `{selected_team.label}`.",
+                    ephemeral=True,
+                )
+                activity_log.post(
+                    ctx.guild,
+                    f"{ctx.author}, requested to join club: {selected_club.label} and team: {selected_team.label}",
+                )
+                await self._post_join_request(ctx, user, selected_team)
+            except UserNotRegistered:
+                await ctx.respond("Error: You need to register first.", ephemeral=True)
+            except Exception as e:
+                logfire.error(f"Error in join_club command: {e}")
+                await ctx.respond("An error occurred while processing your request.", ephemeral=True)
+
+    async def _post_join_request(self, ctx, user: User, team: IndexEntry):
+        """Post the join request with Approve/Decline buttons in the club channel, or in #club-admin.
 
-        except Exception as e:
-            logfire.error(f"Error in join_club command: {e}")
-            await ctx.response.send_message("An error occurred while processing your request.", ephemeral=True)
+        The team is the choice resolved by the command, it may have left the index since.
+        """
+        club = await Club.lookup_async(user.club_id_id)
+        channel = ctx.guild.get_channel(club.discord_channel_id) if club.discord_channel_id else None
+        if channel is None:
+            channel = discord.utils.get(ctx.guild.text_channels, name="club-admin")
+        if channel is None:
+            logfire.warn(f"No channel to post the join request of {user.name} to club {club.name}")
+            return
+        view = JoinRequestView(ctx.author.id, club.id, team.key)
+        await channel.send(
+            f"{ctx.author.mention} ({user.name}) requests to join club `{club.name}`, team `{team.label}`.",
+            view=view,
+        )
+        # Clicks are routed by on_interaction from the custom_id, stopping the view drops it from the view store.
+        view.stop()
 
 
 class RegistrationView(discord.ui.View):
-    """A View that provides a button to show the Registration Form."""
+    """A persistent View that provides a button to show the Registration Form."""
 
     def __init__(self):
-        super().__init__(timeout=300)
+        super().__init__(timeout=None)
 
-    @discord.ui.button(label="Register Now", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="Register Now", style=discord.ButtonStyle.primary, custom_id="vwr:register:open")
     async def register_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         """Display the registration modal."""
         logfire.info(f"{interaction.user} clicked Register Now")
         modal = RegistrationForm()
         await interaction.response.send_modal(modal)
 
-    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.primary, custom_id="vwr:register:cancel")
     async def cancel_button(self, button: discord.ui.Button, interaction: discord.Interaction):
         """Do nothing."""
         logfire.info(f"{interaction.user} cancelled registration")
-        await interaction.response.send_message("Registration cancelled", ephemeral=True)
+        await interaction.respond("Registration cancelled", ephemeral=True)
 
 
 def setup(bot):
@@ -0,0 +1,240 @@
+"""Cold storage for the matches of past seasons.
+
+A season is a calendar year of match starts. ``archive_matches`` moves every match of the seasons before the last
+ARCHIVE_KEEP_SEASONS, with its results and records, into one append-only ``matches-<season>.jsonl.gz`` per season in
+ARCHIVE_DIR, then deletes the rows in batches. The hot tables only keep recent seasons, so their indexes stay small.
+
+Each batch is appended as its own gzip member, one JSON line per match (``{"match", "results", "records"}``).
+``index.json`` maps a match id to its file and the byte offset of its member, so reading an archived match
+decompresses one batch instead of the whole season. A batch is written, fsynced and indexed before its rows are
+deleted: a crash in between archives those matches again on the next run, the index points at the newest copy.
+
+``find_match`` and ``find_results`` read the database first and fall back to the archive, for callers that should
+not care where a match lives. Archived matches are read-only and have ``Match.archived`` set. The index is read
+again whenever ``index.json`` changes on disk, so archiving from another process is picked up.
+Run ``python -m src.database.archive`` to archive from the command line.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+import logfire
+from dotenv import load_dotenv
+
+from src.database.db_models import Match, MatchRecord, MatchResult, db
+
+load_dotenv()
+
+ARCHIVE_BATCH = 500
+INDEX_FILE = "index.json"
+
+
+@dataclass
+class ArchiveReport:
+    """Outcome of an archival run."""
+
+    cutoff: datetime
+    matches: int = 0
+    results: int = 0
+    records: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        """One line summary for Discord and the logs."""
+        return (
+            f"Archived {self.matches} matches from before {self.cutoff:%Y-%m-%d} with {self.results} results and "
+            f"{self.records} records in {self.seconds:.1f}s"
+        )
+
+
+def _season(row: dict) -> int:
+    started = row.get("start_datetime") or row["created_at"]
+    return started.year
+
+
+def _instance(model, row: dict):
+    """An unsaved model instance from an archived row, values converted like a database read."""
+    return model(**{name: model._meta.fields[name].python_value(value) for name, value in row.items()})
+
+
+class MatchArchive:
+    """The archive files in one directory and their index."""
+
+    def __init__(self, path: str, keep_seasons: int = 2):
+        self.path = path
+        self.keep_seasons = keep_seasons
+        self._lock = threading.RLock()
+        self._index: dict[int, tuple[str, int]] | None = None
+        self._index_mtime: int | None = None
+
+    @classmethod
+    def from_env(cls) -> "MatchArchive":
+        """Create an archive configured from ARCHIVE_DIR and ARCHIVE_KEEP_SEASONS."""
+        return cls(os.getenv("ARCHIVE_DIR", "archive"), int(os.getenv("ARCHIVE_KEEP_SEASONS", "2")))
+
+    def cutoff(self, now: datetime | None = None) -> datetime:
+        """Start of the oldest season that stays in the database."""
+        now = now or datetime.now()
+        return datetime(now.year - self.keep_seasons + 1, 1, 1)
+
+    @property
+    def index(self) -> dict[int, tuple[str, int]]:
+        """``match id -> (file name, member offset)``, read from disk on first use and whenever the file changed."""
+        with self._lock:
+            mtime = self._stat_index()
+            if self._index is None or mtime != self._index_mtime:
+                self._index = self._load_index()
+                self._index_mtime = mtime
+            return self._index
+
+    def _stat_index(self) -> int | None:
+        try:
+            return os.stat(os.path.join(self.path, INDEX_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_index(self) -> dict[int, tuple[str, int]]:
+        try:
+            with open(os.path.join(self.path, INDEX_FILE), encoding="utf-8") as f:
+                return {int(match_id): (name, offset) for match_id, (name, offset) in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def _save_index(self) -> None:
+        path = os.path.join(self.path, INDEX_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({str(match_id): list(location) for match_id, location in self.index.items()}, f)
+        os.replace(f"{path}.tmp", path)
+        self._index_mtime = self._stat_index()
+
+    def _append(self, season: int, entries: list[dict]) -> tuple[str, int]:
+        """Append entries as one gzip member, returns the file name and the member's offset."""
+        name = f"matches-{season}.jsonl.gz"
+        with open(os.path.join(self.path, name), "ab") as f:
+            offset = f.tell()
+            with gzip.GzipFile(fileobj=f, mode="wb") as member:
+                for entry in entries:
+                    member.write(json.dumps(entry, default=str).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return name, offset
+
+    def archive_matches(self, cutoff: datetime | None = None) -> ArchiveReport:
+        """Move the matches that started before ``cutoff`` to the archive. Blocking, run it in a thread.
+
+        Args:
+            cutoff: Defaults to the start of the oldest season that is kept, see ``cutoff``.
+
+        """
+        report = ArchiveReport(cutoff=cutoff or self.cutoff())
+        started = time.perf_counter()
+        os.makedirs(self.path, exist_ok=True)
+        old = (Match.start_datetime < report.cutoff) | (
+            Match.start_datetime.is_null() & (Match.created_at < report.cutoff)
+        )
+        with logfire.span("ARCHIVE MATCHES"):
+            while True:
+                # Archived rows are deleted, so every query starts from the oldest remaining match.
+                matches = list(Match.select().where(old).order_by(Match.id).limit(ARCHIVE_BATCH).dicts())
+                if not matches:
+                    break
+                self._archive_batch(matches, report)
+            report.seconds = time.perf_counter() - started
+            logfire.info(report.summary())
+        return report
+
+    def _archive_batch(self, matches: list[dict], report: ArchiveReport) -> None:
+        match_ids = [row["id"] for row in matches]
+        results = defaultdict(list)
+        for row in MatchResult.select().where(MatchResult.match_id.in_(match_ids)).dicts().iterator():
+            results[row["match_id"]].append(row)
+        records = defaultdict(list)
+        for row in MatchRecord.select().where(MatchRecord.match_id.in_(match_ids)).dicts().iterator():
+            records[row["match_id"]].append(row)
+
+        seasons = defaultdict(list)
+        for row in matches:
+            seasons[_season(row)].append({"match": row, "results": results[row["id"]], "records": records[row["id"]]})
+        with self._lock:
+            # Reading self.index picks up entries another process added since, so they are not overwritten.
+            index = self.index
+            for season, entries in seasons.items():
+                location = self._append(season, entries)
+                for entry in entries:
+                    index[entry["match"]["id"]] = location
+            self._save_index()
+
+        with db.atomic():
+            MatchRecord.delete().where(MatchRecord.match_id.in_(match_ids)).execute()
+            MatchResult.delete().where(MatchResult.match_id.in_(match_ids)).execute()
+            # Bulk delete, no cache_bus "match": only past matches are archived, nothing schedules them.
+            Match.delete().where(Match.id.in_(match_ids)).execute()
+        report.matches += len(match_ids)
+        report.results += sum(len(rows) for rows in results.values())
+        report.records += sum(len(rows) for rows in records.values())
+
+    def entry(self, match_id: int) -> dict[str, Any] | None:
+        """The archived ``{"match", "results", "records"}`` of a match, None if it is not archived."""
+        location = self.index.get(match_id)
+        if location is None:
+            return None
+        name, offset = location
+        with open(os.path.join(self.path, name), "rb") as f:
+            f.seek(offset)
+            with gzip.GzipFile(fileobj=f, mode="rb") as member:
+                for line in member:
+                    entry = json.loads(line)
+                    if entry["match"]["id"] == match_id:
+                        return entry
+        logfire.error(f"Match {match_id} is missing from archive {name} at offset {offset}")
+        return None
+
+    def match(self, match_id: int) -> Match | None:
+        """An archived match as an unsaved Match."""
+        entry = self.entry(match_id)
+        if entry is None:
+            return None
+        match = _instance(Match, entry["match"])
+        match.archived = True
+        return match
+
+    def results(self, match_id: int) -> list[MatchResult]:
+        """The results of an archived match as unsaved MatchResults."""
+        entry = self.entry(match_id)
+        return [_instance(MatchResult, row) for row in entry["results"]] if entry else []
+
+
+match_archive = MatchArchive.from_env()
+
+
+def find_match(match_id: int) -> Match | None:
+    """A match from the database, or from the archive once it was archived."""
+    return Match.get_or_none(Match.id == match_id) or match_archive.match(match_id)
+
+
+def find_results(match_id: int) -> list[MatchResult]:
+    """The results of a match, from the database or the archive."""
+    results = list(MatchResult.select().where(MatchResult.match_id == match_id))
+    return results or match_archive.results(match_id)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Archive the matches of past seasons.")
+    parser.add_argument("--keep-seasons", type=int, help="Seasons kept in the database, default ARCHIVE_KEEP_SEASONS.")
+    args = parser.parse_args(argv)
+    if args.keep_seasons is not None:
+        match_archive.keep_seasons = args.keep_seasons
+    print(match_archive.archive_matches().summary())
+
+
+if __name__ == "__main__":
+    main()
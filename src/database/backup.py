@@ -0,0 +1,189 @@
+"""Online backups of the SQLite database.
+
+Copying ``Peewee_SQLite.db`` while the bot writes can produce a corrupt copy. ``SqliteBackup`` uses SQLite's online
+backup API instead, on its own connection in a worker thread. It copies BACKUP_PAGES pages per step and sleeps
+BACKUP_STEP_SLEEP between steps, so the database lock is only held for a moment at a time and interactions keep
+being served. A write by the bot while a backup runs makes SQLite restart the copy. After MAX_RESTARTS restarts the
+copy is done in one step instead, which holds the read lock for the whole copy but always finishes.
+
+Snapshots are written to BACKUP_DIR as ``vwr-<timestamp>.db``, checked with ``PRAGMA quick_check`` and rotated so
+the newest BACKUP_KEEP remain. ``restore`` copies a snapshot into a new file, e.g. to test it. Postgres deployments
+have their own tooling, there this module does nothing.
+
+Run ``python -m src.database.backup`` to take a snapshot, ``--restore SNAPSHOT TARGET`` to restore one.
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+import logfire
+from dotenv import load_dotenv
+from peewee import SqliteDatabase
+
+from src.database.db_models import db
+
+load_dotenv()
+
+SNAPSHOT_PREFIX = "vwr-"
+MAX_RESTARTS = 3
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+@dataclass
+class BackupReport:
+    """Outcome of one backup."""
+
+    path: str
+    pages: int = 0
+    restarts: int = 0
+    single_step: bool = False
+    bytes: int = 0
+    seconds: float = 0.0
+    finished_at: float = 0.0
+
+    def summary(self) -> str:
+        """One line summary for Discord and the logs."""
+        mode = "single step" if self.single_step else f"{self.restarts} restarts"
+        return (
+            f"Backup {self.path}: {self.pages} pages, {self.bytes / 1024 / 1024:.1f} MiB in {self.seconds:.1f}s "
+            f"({mode})"
+        )
+
+
+class SqliteBackup:
+    """Take, rotate and restore snapshots of the SQLite database."""
+
+    def __init__(self, directory: str = "backups", keep: int = 7, pages: int = 256, step_sleep: float = 0.05):
+        self.directory = directory
+        self.keep = keep
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.last_report: BackupReport | None = None
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls) -> "SqliteBackup":
+        """Create a backup job configured from environment variables."""
+        return cls(
+            directory=os.getenv("BACKUP_DIR", "backups"),
+            keep=int(os.getenv("BACKUP_KEEP", "7")),
+            pages=int(os.getenv("BACKUP_PAGES", "256")),
+            step_sleep=float(os.getenv("BACKUP_STEP_SLEEP", "0.05")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """Only file-based SQLite databases are backed up here."""
+        return isinstance(db, SqliteDatabase) and db.database != ":memory:"
+
+    def snapshots(self) -> list[str]:
+        """Existing snapshots, oldest first."""
+        return sorted(glob.glob(os.path.join(self.directory, f"{SNAPSHOT_PREFIX}*.db")))
+
+    def backup(self) -> BackupReport:
+        """Take a snapshot and rotate the old ones. Blocking, run it in a thread.
+
+        Raises:
+            sqlite3.DatabaseError: The backup failed or the snapshot did not pass ``quick_check``.
+
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{datetime.now():%Y%m%d-%H%M%S}.db")
+        report = BackupReport(path)
+        started = time.perf_counter()
+        with logfire.span("SQLITE BACKUP"):
+            try:
+                self._copy(db.database, f"{path}.tmp", report)
+                os.replace(f"{path}.tmp", path)
+            except Exception:
+                self.failures += 1
+                if os.path.exists(f"{path}.tmp"):
+                    os.remove(f"{path}.tmp")
+                raise
+            report.bytes = os.path.getsize(path)
+            report.seconds = time.perf_counter() - started
+            report.finished_at = time.time()
+            self.last_report = report
+            self._rotate()
+            logfire.info(report.summary())
+        return report
+
+    def _copy(self, source_path: str, target_path: str, report: BackupReport | None = None) -> None:
+        report = report or BackupReport(target_path)
+        last_remaining = None
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal last_remaining
+            report.pages = total
+            if last_remaining is not None and remaining > last_remaining:
+                report.restarts += 1
+                if report.restarts >= MAX_RESTARTS:
+                    raise _TooManyRestarts
+            last_remaining = remaining
+            if remaining:
+                # sqlite3 only sleeps when a step hits a lock, pause here so writers get a turn between steps.
+                time.sleep(self.step_sleep)
+
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                source.backup(target, pages=self.pages, progress=progress)
+            except _TooManyRestarts:
+                # The database changes faster than the stepped copy, copy everything under one read lock.
+                report.single_step = True
+                source.backup(target, pages=-1)
+            (result,) = target.execute("PRAGMA quick_check").fetchone()
+            if result != "ok":
+                raise sqlite3.DatabaseError(f"Snapshot {target_path} failed quick_check: {result}")
+        finally:
+            target.close()
+            source.close()
+
+    def _rotate(self) -> None:
+        for path in self.snapshots()[: -self.keep] if self.keep > 0 else []:
+            os.remove(path)
+            logfire.info(f"Removed old backup {path}")
+
+    def restore(self, snapshot: str, target: str) -> str:
+        """Copy a snapshot into a new database file, which must not exist yet. Returns ``target``.
+
+        Raises:
+            FileExistsError: ``target`` exists, restoring never overwrites a database.
+
+        """
+        if os.path.exists(target):
+            raise FileExistsError(f"{target} exists, restore into a new file")
+        if not os.path.exists(snapshot):
+            raise FileNotFoundError(snapshot)
+        self._copy(snapshot, target)
+        logfire.info(f"Restored {snapshot} into {target}")
+        return target
+
+
+sqlite_backup = SqliteBackup.from_env()
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Back up the SQLite database, or restore a snapshot.")
+    parser.add_argument("--restore", nargs=2, metavar=("SNAPSHOT", "TARGET"), help="Restore into a new file.")
+    args = parser.parse_args(argv)
+    if args.restore:
+        print(f"Restored into {sqlite_backup.restore(*args.restore)}")
+    elif not sqlite_backup.enabled:
+        print("The database is not a SQLite file, nothing to back up.")
+    else:
+        print(sqlite_backup.backup().summary())
+
+
+if __name__ == "__main__":
+    main()
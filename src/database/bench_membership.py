@@ -0,0 +1,112 @@
+"""Benchmark ``Membership.get_user_membership`` against a local mongod.
+
+Compares the previous lookup, copied below as it was, with the ``$lookup`` aggregation. Both run in a scratch
+database that is dropped afterwards. The previous lookup was called with a Rider: it filtered on the discord id as a
+string (stored as an int, so it never matched) ``$or`` the unindexed ``rider_id``, then fetched the orgs in a second
+round trip. The query plans of both are printed, and the benchmark checks that both return the same orgs::
+
+    MONGO_URL=mongodb://localhost:27017 python -m src.database.bench_membership
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from beanie import init_beanie
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from src.database.db_models_mongo import Membership, MembType, Org, Rider
+
+BENCH_DB = "vwr_bench"
+
+
+async def previous_lookup(membership_type: set[MembType], discord_id: str, rider_id: str) -> list[Org]:
+    """The lookup before the aggregation, as it ran for a Rider."""
+    query_filter = {
+        "$or": [{"discord_id": discord_id}, {"rider_id": rider_id}],
+        "membership_type": {"$in": list(membership_type)},
+    }
+    org_ids = [org.org_id for org in await Membership.find(query_filter).to_list()]
+    org_ids = [ObjectId(org_id) for org_id in org_ids]
+    return await Org.find({"_id": {"$in": org_ids}}).to_list()
+
+
+def _plan(explain: dict) -> str:
+    text = str(explain)
+    return "IXSCAN" if "IXSCAN" in text and "COLLSCAN" not in text else "COLLSCAN"
+
+
+async def bench(riders: int, orgs: int, calls: int) -> None:
+    """Fill the scratch database and time both lookups."""
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    database = client[BENCH_DB]
+    await client.drop_database(BENCH_DB)
+    try:
+        await init_beanie(database=database, document_models=[Rider, Org, Membership])
+        org_ids = (
+            await database[Org.Settings.name].insert_many(
+                [{"org_type": "club", "name": f"club {i}", "discord_id": str(i), "zp_club_id": i} for i in range(orgs)]
+            )
+        ).inserted_ids
+        rider_ids = [str(ObjectId()) for _ in range(riders)]
+        now = datetime.now()
+        await database[Membership.Settings.name].insert_many(
+            [
+                {
+                    "membership_type": kind.value,
+                    "org_id": str(org_ids[(i * 7 + offset) % orgs]),
+                    "rider_id": rider_ids[i],
+                    "discord_id": 10**17 + i,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for i in range(riders)
+                for offset, kind in enumerate((MembType.CLUB_MEMBER, MembType.TEAM_MEMBER))
+            ]
+        )
+        types = {MembType.CLUB_MEMBER, MembType.TEAM_MEMBER}
+
+        old_filter = {
+            "$or": [{"discord_id": str(10**17)}, {"rider_id": rider_ids[0]}],
+            "membership_type": {"$in": [t.value for t in types]},
+        }
+        old_explain = await database[Membership.Settings.name].find(old_filter).explain()
+        pipeline = Membership.membership_pipeline(types, 10**17, rider_ids[0])
+        command = {"aggregate": Membership.Settings.name, "pipeline": pipeline, "cursor": {}}
+        new_explain = await database.command("explain", command, verbosity="queryPlanner")
+        print(f"Previous lookup plan: {_plan(old_explain)}, aggregation plan: {_plan(new_explain)}")
+
+        samples = [i * (riders // calls) for i in range(calls)]
+        for i in samples[:10]:
+            old = await previous_lookup(types, str(10**17 + i), rider_ids[i])
+            new = await Membership._get_user_membership(types, 10**17 + i, rider_ids[i])
+            assert sorted(org.id for org in old) == sorted(org.id for org in new), f"Different orgs for rider {i}"
+
+        cases = (
+            ("find $or + find $in", lambda i: previous_lookup(types, str(10**17 + i), rider_ids[i])),
+            ("one $lookup aggregation", lambda i: Membership._get_user_membership(types, 10**17 + i, rider_ids[i])),
+        )
+        for name, lookup in cases:
+            started = time.perf_counter()
+            for i in samples:
+                await lookup(i)
+            print(f"{name:<24} {(time.perf_counter() - started) / calls * 1e3:7.2f} ms per lookup")
+    finally:
+        await client.drop_database(BENCH_DB)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the membership lookup against a local mongod.")
+    parser.add_argument("--riders", type=int, default=20000, help="Riders, each with a club and a team membership.")
+    parser.add_argument("--orgs", type=int, default=2000, help="Orgs the memberships are spread over.")
+    parser.add_argument("--calls", type=int, default=500, help="Lookups timed per implementation.")
+    args = parser.parse_args(argv)
+    asyncio.run(bench(args.riders, args.orgs, args.calls))
+
+
+if __name__ == "__main__":
+    main()
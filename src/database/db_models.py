@@ -19,10 +19,14 @@ from peewee import (
     SqliteDatabase,
 )
 from playhouse.db_url import connect
+from playhouse.migrate import SchemaMigrator, migrate
 from playhouse.postgres_ext import JSONField
 from playhouse.shortcuts import model_to_dict
 from psycopg2 import OperationalError
 
+from src.extras import cache_bus
+from src.extras.log import get_logger
+from src.extras.singleflight import SingleFlight
 from src.extras.vwr_exceptions import (
     ClubNotFound,
     NoClubMembership,
@@ -62,6 +66,11 @@ def init_db():
 
 
 db = init_db()
+# Lookups run on most interactions, only a sample of them is logged.
+log = get_logger("lookups", sample_rate=0.25)
+# Concurrent identical lookups share one query, see ``lookup_async``.
+_user_lookups = SingleFlight("user_lookup")
+_org_lookups = SingleFlight("org_lookup")
 
 
 class BaseModel(Model):
@@ -90,6 +99,19 @@ class Club(BaseModel):
         """Override save to update timestamp."""
         self.updated_at = datetime.now()
         super().save(*args, **kwargs)
+        cache_bus.publish("club", self.id, self)
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete the club and drop it from the caches."""
+        club_id = self.id
+        result = super().delete_instance(*args, **kwargs)
+        cache_bus.publish("club", club_id)
+        return result
+
+    @classmethod
+    async def lookup_async(cls, club_id: int) -> "Club | None":
+        """Get a club by id without blocking the event loop, concurrent lookups of the same club share one query."""
+        return await _org_lookups.do(("club", club_id), cls.get_or_none, cls.id == club_id)
 
 
 class Team(BaseModel):
@@ -109,6 +131,19 @@ class Team(BaseModel):
         """Override save to update timestamp."""
         self.updated_at = datetime.now()
         super().save(*args, **kwargs)
+        cache_bus.publish("team", self.id, self)
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete the team and drop it from the caches."""
+        team_id = self.id
+        result = super().delete_instance(*args, **kwargs)
+        cache_bus.publish("team", team_id)
+        return result
+
+    @classmethod
+    async def lookup_async(cls, team_id: int) -> "Team | None":
+        """Get a team by id without blocking the event loop, concurrent lookups of the same team share one query."""
+        return await _org_lookups.do(("team", team_id), cls.get_or_none, cls.id == team_id)
 
     @property
     def members(self, as_dict: bool = False):
@@ -144,6 +179,7 @@ class User(BaseModel):
     team_id = ForeignKeyField(Team, backref="users", null=True, on_delete="SET NULL")
     team_approved = BooleanField(default=False)  # Is the user approved to join the team
     team_admin = BooleanField(default=False)
+    zwid_verified = BooleanField(default=False)  # The zwid showed up in a race result, see zwid_verification
     created_at = DateTimeField(default=datetime.now)
     updated_at = DateTimeField(default=datetime.now)
 
@@ -151,6 +187,8 @@ class User(BaseModel):
         """Override save to update timestamp."""
         self.updated_at = datetime.now()
         super().save(*args, **kwargs)
+        # Users are looked up by Discord id everywhere, so that is the cache key.
+        cache_bus.publish("user", self.discord_id, self)
 
     def create_club(
         self,
@@ -365,6 +403,40 @@ class User(BaseModel):
             logfire.error("Somthing went wrong with the approve request")
             return False
 
+    def review_join_request(self, discord_id: int, club_id: int, team_id: int | None, approve: bool) -> "User":
+        """Approve or decline a pending club (and team) join request, as an admin of that club.
+
+        Args:
+            discord_id: Discord ID of the user that requested to join
+            club_id: Club database ID of the request
+            team_id: Team database ID of the request, if any
+            approve: True to approve, False to decline
+
+        """
+        if not self.club_admin or self.club_id_id != club_id:
+            logfire.error(f"User {self.name} is not an admin of club {club_id}.")
+            raise NotAClubAdmin("User must be an admin of the club to review a join request.")
+        user = User.get_or_none(User.discord_id == discord_id)
+        if user is None:
+            logfire.error(f"User with Discord ID {discord_id} not found.")
+            raise UserNotRegistered("Discord user needs to register")
+        if user.club_id_id != club_id:
+            logfire.info(f"User {user.name} no longer requests to join club {club_id}.")
+            raise NoClubMembership(additional_message="Join request is no longer pending")
+        same_team = team_id is not None and user.team_id_id == team_id
+        if approve:
+            user.club_approved = True
+            user.team_approved = user.team_approved or same_team
+        else:
+            user.club_id = None
+            user.club_approved = False
+            if same_team:
+                user.team_id = None
+                user.team_approved = False
+        user.save()
+        logfire.info(f"User {user.name} join request {'approved' if approve else 'declined'} by {self.name}.")
+        return user
+
     @property
     def zp_url(self, markdown: bool = True):
         """Return the Zwift Power URL for the user."""
@@ -397,6 +469,7 @@ class User(BaseModel):
             "Is Club admin": self.club_admin,
             "Team": self.team_id.name if self.team_id else "No Team",
             "Is Team admin": self.team_admin,
+            "Zwift ID verified": self.zwid_verified,
             "Registered": self.created_at.date().isoformat(),
             "Updated": self.updated_at.date().isoformat(),
         }
@@ -404,13 +477,18 @@ class User(BaseModel):
     @classmethod
     def lookup(cls, discord_id: int):
         """Lookup a user by Discord ID."""
-        logfire.info(f"Looking up user with Discord ID {discord_id}")
+        log.info("Looking up user with Discord ID {discord_id}", discord_id=discord_id)
         user = User.get_or_none(discord_id=discord_id)
         if user is None:
             logfire.error(f"UserNotRegistered: User with Discord ID {discord_id} not found.")
             raise UserNotRegistered("Discord user needs to register")
         return user.profile
 
+    @classmethod
+    async def lookup_async(cls, discord_id: int):
+        """``lookup`` in a worker thread, concurrent lookups of the same user share one query."""
+        return await _user_lookups.do(discord_id, cls.lookup, discord_id)
+
 
 class Match(BaseModel):
     """Match model."""
@@ -429,13 +507,23 @@ class Match(BaseModel):
     roster_count_parity = IntegerField(null=True)
     roster_median_parity = IntegerField(null=True)
     roster_mean_parity = FloatField(null=True)
+    version = IntegerField(default=0)  # Bumped by every conditional update, see setup_match
     created_at = DateTimeField(default=datetime.now)
     updated_at = DateTimeField(default=datetime.now)
+    archived = False  # Not a column, True for matches read from the archive, see src.database.archive
 
     def save(self, *args, **kwargs):
         """Override save to update timestamp."""
         self.updated_at = datetime.now()
         super().save(*args, **kwargs)
+        cache_bus.publish("match", self.id, self)
+
+    def delete_instance(self, *args, **kwargs):
+        """Delete the match and tell the scheduler."""
+        match_id = self.id
+        result = super().delete_instance(*args, **kwargs)
+        cache_bus.publish("match", match_id)
+        return result
 
 
 class MatchResult(BaseModel):
@@ -475,12 +563,37 @@ class MatchRecord(BaseModel):
         super().save(*args, **kwargs)
 
 
+# Columns added after the first release, as (model, field name). create_tables does not add columns to existing tables.
+ADDED_COLUMNS = [(User, "zwid_verified"), (Match, "version")]
+
+
+def migrate_schema() -> list[str]:
+    """Add the columns in ADDED_COLUMNS that an existing database is missing.
+
+    Returns:
+        The added columns as ``table.column``.
+
+    """
+    migrator = SchemaMigrator.from_database(db)
+    added = []
+    for model, name in ADDED_COLUMNS:
+        table = model._meta.table_name
+        field = model._meta.fields[name]
+        if field.column_name not in {column.name for column in db.get_columns(table)}:
+            migrate(migrator.add_column(table, field.column_name, field))
+            added.append(f"{table}.{field.column_name}")
+    if added:
+        logfire.info(f"Migrated database, added columns: {added}")
+    return added
+
+
 # Initialize the database and create the tables
 def init_peewee_db():
     """Initialize the Peewee database."""
     try:
         db.connect()
-        db.create_tables([User, Club, Team])
+        db.create_tables([User, Club, Team, Match, MatchResult, MatchRecord])
+        migrate_schema()
         logfire.info("Database initialized and tables created.")
         db.close()
     except OperationalError as e:
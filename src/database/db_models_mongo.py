@@ -1,12 +1,17 @@
+import asyncio
 from datetime import datetime
 from enum import Enum
 from typing import Any, Literal, Optional
 
 import logfire
 from beanie import Document
-from bson import ObjectId
 from pydantic import Field
 from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from src.extras.singleflight import SingleFlight
+
+_membership_lookups = SingleFlight("membership_lookup")
 
 
 class MembType(Enum):  # NOQA
@@ -85,12 +90,12 @@ class Org(Document):
     async def new_org(
         cls, discord_id: int, org_type: Literal["club", "team"], name: str, zp_club_id: int | None = None
     ) -> tuple[Optional["Org"], NewOrgMessage]:
-        """Create a new club or team."""
+        """Create a new club or team, with the creator as its admin.
+
+        The org is inserted once, its unique name index reports duplicates, and the membership is inserted directly:
+        a new org cannot have one yet.
+        """
         with logfire.span("New Org"):
-            existing_org = await cls.find_one({"name": name})
-            if existing_org:
-                logfire.info(f"Org already exists: {existing_org}")
-                return (None, NewOrgMessage.DUPLICATE)
             try:
                 org = cls.model_validate(
                     {"org_type": org_type, "name": name, "discord_id": str(discord_id), "zp_club_id": zp_club_id}
@@ -98,23 +103,30 @@ class Org(Document):
             except Exception as e:
                 logfire.error(f"Failed to validate new org: {e}")
                 return None, NewOrgMessage.ERROR
-            rider = await Rider.find_one({"discord_id": discord_id})
-            mem_type: MembType = MembType.CLUB_ADMIN if org_type == "club" else MembType.TEAM_ADMIN
+            try:
+                rider, _ = await asyncio.gather(Rider.find_one({"discord_id": int(discord_id)}), org.insert())
+            except DuplicateKeyError as e:
+                if "name" in (e.details or {}).get("keyPattern", {}):
+                    logfire.info(f"Org already exists: {name}")
+                    return None, NewOrgMessage.DUPLICATE
+                logfire.error(f"Failed to create new org {name}: {e}")
+                return None, NewOrgMessage.ERROR
+            except Exception:
+                logfire.error("Failed to create new org", exc_info=True)
+                return None, NewOrgMessage.ERROR
+            logfire.info(f"New org saved: {org.id}")
 
-            #####
+            if rider is None:
+                logfire.notice(f"Rider {discord_id} not found, {name} has no admin")
+                return org, NewOrgMessage.SUCCESS
+            mem_type = MembType.CLUB_ADMIN if org_type == "club" else MembType.TEAM_ADMIN
             try:
-                await org.save()
-                logfire.info("New ORG SAVED")
-                new_org = await Org.find_one({"name": name})  # The name is unique
-                logfire.info("Retrieve new Org")
-
-                logfire.info(f"Add Membership for {rider} to {new_org}")
-                await Membership.add_remove_membership(
-                    action="add", rider=rider, org_id=str(new_org.id), membership_type=mem_type
-                )
+                await Membership(
+                    membership_type=mem_type, org_id=str(org.id), rider_id=str(rider.id), discord_id=rider.discord_id
+                ).insert()
                 return org, NewOrgMessage.SUCCESS
             except Exception:
-                logfire.error("Failed to creat new org and admin", exc_info=True)
+                logfire.error("Failed to add the admin of the new org", exc_info=True)
                 return None, NewOrgMessage.ERROR
 
     class Settings:  # NOQA
@@ -151,20 +163,44 @@ class Membership(Document):
         rider_id: str | None = None,
         rider: Rider | None = None,
     ) -> list[Org | None]:
-        """Find all clubs where the given user (discord_id or rider_id or Rider) is an admin."""
+        """Find all orgs where the given user (discord_id or rider_id or Rider) has one of the membership types.
+
+        Concurrent calls for the same user and membership types share one query.
+        """
+        if rider is not None:
+            discord_id = rider.discord_id
+            rider_id = str(rider.id)
+        discord_id = int(discord_id) if discord_id is not None else None
+        key = (frozenset(membership_type), discord_id, rider_id)
+        return await _membership_lookups.do(key, cls._get_user_membership, membership_type, discord_id, rider_id)
+
+    @staticmethod
+    def membership_pipeline(
+        membership_type: set[MembType], discord_id: int | None, rider_id: str | None
+    ) -> list[dict[str, Any]]:
+        """Aggregation from membership docs to the user's orgs.
+
+        Matching on ``membership_type`` and the int ``discord_id`` is a prefix of the ``unique_membership`` index.
+        ``org_id`` is stored as a string, it is converted so the ``$lookup`` runs on the orgs' ``_id`` index.
+        """
+        types = [t.value if isinstance(t, MembType) else t for t in membership_type]
+        user = {"discord_id": int(discord_id)} if discord_id is not None else {"rider_id": rider_id}
+        return [
+            {"$match": {"membership_type": {"$in": types}, **user}},
+            {"$project": {"_id": 0, "org_oid": {"$toObjectId": "$org_id"}}},
+            {"$lookup": {"from": Org.Settings.name, "localField": "org_oid", "foreignField": "_id", "as": "org"}},
+            {"$unwind": "$org"},
+            {"$replaceRoot": {"newRoot": "$org"}},
+        ]
+
+    @classmethod
+    async def _get_user_membership(
+        cls, membership_type: set[MembType], discord_id: int | None, rider_id: str | None
+    ) -> list[Org | None]:
         try:
-            if rider is not None:
-                discord_id = str(rider.discord_id)
-                rider_id = str(rider.id)
-            logfire.info(f"Get Membership Orgs for user: {membership_type}, {discord_id}, {rider_id}, {rider}")
-            query_filter = {
-                "$or": [{"discord_id": discord_id}, {"rider_id": rider_id}],
-                "membership_type": {"$in": list(membership_type)},
-            }
-            org_ids = [org.org_id for org in await cls.find(query_filter).to_list()]
-            org_ids = [ObjectId(org_id) for org_id in org_ids]
-            logfire.info(f"Membership Orgs: {org_ids}")
-            orgs = await Org.find({"_id": {"$in": org_ids}}).to_list()
+            logfire.info(f"Get Membership Orgs for user: {membership_type}, {discord_id}, {rider_id}")
+            pipeline = cls.membership_pipeline(membership_type, discord_id, rider_id)
+            orgs = await cls.aggregate(pipeline, projection_model=Org).to_list()
             logfire.info(f"Found user is a member if these orgs: {orgs}")
             return orgs
         except Exception as e:
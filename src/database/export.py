@@ -0,0 +1,144 @@
+"""Export users, clubs, teams and match results as gzip-compressed CSV or JSONL.
+
+Rows are streamed in primary key order, ``EXPORT_BATCH`` at a time, and written straight into the gzip stream, so
+memory stays flat whatever the table size. Each batch is a keyset query (``id > last id``) read with ``.iterator()``:
+psycopg2's default cursor buffers a whole result set client-side, batching bounds that on Postgres and SQLite alike.
+
+Used by ``/admin export`` and from the command line::
+
+    python -m src.database.export users teams --format jsonl --output-dir exports
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, BinaryIO
+
+from dotenv import load_dotenv
+
+from src.database.db_models import BaseModel, Club, MatchResult, Team, User
+
+load_dotenv()
+
+EXPORT_BATCH = 5000
+FORMATS = ("csv", "jsonl")
+TABLES: dict[str, type[BaseModel]] = {"users": User, "clubs": Club, "teams": Team, "results": MatchResult}
+
+
+@dataclass
+class ExportReport:
+    """Outcome of exporting one table."""
+
+    table: str
+    path: str
+    rows: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        """One line summary for Discord and the logs."""
+        return f"Exported {self.rows} {self.table} to {self.path} ({self.bytes / 1024:.0f} KiB) in {self.seconds:.1f}s"
+
+
+def stream_rows(model: type[BaseModel], batch: int = EXPORT_BATCH) -> Iterator[tuple]:
+    """Every row of a table as a tuple in ``_meta.sorted_fields`` order, read in primary key batches."""
+    fields = model._meta.sorted_fields
+    last_id = None
+    while True:
+        query = model.select(*fields).order_by(model.id).limit(batch)
+        if last_id is not None:
+            query = query.where(model.id > last_id)
+        count = 0
+        for row in query.tuples().iterator():
+            count += 1
+            last_id = row[0]
+            yield row
+        if count < batch:
+            return
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, dict | list):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _json_default(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def write_export(model: type[BaseModel], fmt: str, out: BinaryIO) -> int:
+    """Write a table to a binary stream as gzip-compressed CSV or JSONL.
+
+    Args:
+        model: The table to export.
+        fmt: ``csv`` or ``jsonl``.
+        out: Where the compressed bytes go, e.g. an open file.
+
+    Returns:
+        The number of rows written.
+
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, use one of {FORMATS}")
+    columns = [field.column_name for field in model._meta.sorted_fields]
+    rows = 0
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6) as compressed:
+        text = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+        if fmt == "csv":
+            writer = csv.writer(text)
+            writer.writerow(columns)
+            for row in stream_rows(model):
+                writer.writerow([_csv_value(value) for value in row])
+                rows += 1
+        else:
+            for row in stream_rows(model):
+                text.write(json.dumps(dict(zip(columns, row, strict=True)), default=_json_default))
+                text.write("\n")
+                rows += 1
+        text.flush()
+        text.detach()
+    return rows
+
+
+def export_table(table: str, fmt: str = "csv", output_dir: str | None = None) -> ExportReport:
+    """Export one table to a timestamped ``.csv.gz`` / ``.jsonl.gz`` file. Blocking, run it in a thread.
+
+    Args:
+        table: One of ``TABLES``.
+        fmt: ``csv`` or ``jsonl``.
+        output_dir: Directory for the file, created if needed. Defaults to EXPORT_DIR.
+
+    """
+    model = TABLES[table]
+    output_dir = output_dir or os.getenv("EXPORT_DIR", "exports")
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{table}-{datetime.now():%Y%m%d-%H%M%S}.{fmt}.gz")
+    started = time.perf_counter()
+    with open(path, "wb") as f:
+        rows = write_export(model, fmt, f)
+    return ExportReport(table, path, rows, os.path.getsize(path), time.perf_counter() - started)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Export VWR tables as gzip-compressed CSV or JSONL.")
+    parser.add_argument("tables", nargs="+", choices=sorted(TABLES), help="Tables to export.")
+    parser.add_argument("--format", choices=FORMATS, default="csv", help="Output format, default csv.")
+    parser.add_argument("--output-dir", help="Where to write the files, default EXPORT_DIR.")
+    args = parser.parse_args(argv)
+    for table in args.tables:
+        print(export_table(table, args.format, args.output_dir).summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Migrate the Mongo data layer (``db_models_mongo``) into the SQL tables.
+
+Riders become Users, orgs become Clubs or Teams, and memberships are folded into the users' ``club_id``/``team_id``
+and approval/admin flags. Each collection is streamed in ``_id`` order, ``batch`` documents at a time, and every batch
+is written in one transaction: ``insert_many`` for users and orgs, one UPDATE per distinct set of membership values.
+Rows that clash with an existing row (same discord id, a taken unique name, ...) are ignored and counted as skipped.
+After each batch the last ``_id`` is saved to MIGRATION_CHECKPOINT, so an interrupted migration continues where it
+stopped. The reported throughput is documents per second.
+
+The bulk writes bypass the models' ``save``, run the migration before starting the bot so the indexes load the new
+rows. pymongo is only imported when the migration runs. ``MongoMigration`` takes any pymongo-like database, so it
+can be tested against a local mongod or a ``mongomock.MongoClient()[name]``::
+
+    python -m src.database.mongo_migration --batch 1000
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+import logfire
+from dotenv import load_dotenv
+
+from src.database.db_models import Club, Team, User, db
+
+load_dotenv()
+
+MEMBERSHIP_VALUES: dict[str, Callable[[int], dict[str, Any]]] = {
+    "club_member": lambda org_id: {"club_id": org_id, "club_approved": True},
+    "club_admin": lambda org_id: {"club_id": org_id, "club_approved": True, "club_admin": True},
+    "team_member": lambda org_id: {"team_id": org_id, "team_approved": True},
+    "team_admin": lambda org_id: {"team_id": org_id, "team_approved": True, "team_admin": True},
+}
+
+
+@dataclass
+class CollectionStats:
+    """Progress of one collection."""
+
+    collection: str
+    read: int = 0
+    written: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Documents read per second."""
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        """One line summary for the logs."""
+        return (
+            f"{self.collection}: read {self.read}, wrote {self.written}, skipped {self.skipped} "
+            f"in {self.seconds:.1f}s ({self.rate:.0f} docs/s)"
+        )
+
+
+def _insert_ignoring(model, rows: list[dict]) -> int:
+    """Insert rows, ignoring those that clash with an existing row. Returns the number of rows inserted."""
+    query = model.insert_many(rows).on_conflict_ignore()
+    if db.returning_clause:
+        # Postgres: ON CONFLICT DO NOTHING only returns the inserted rows.
+        return len(list(query.returning(model.id).execute()))
+    return query.as_rowcount().execute()
+
+
+class Checkpoint:
+    """The last migrated ``_id`` per collection, saved as JSON."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.last_ids: dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.last_ids = json.load(f)
+
+    def save(self, collection: str, last_id: Any) -> None:
+        """Record a finished batch, the file is replaced atomically."""
+        self.last_ids[collection] = str(last_id)
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.last_ids, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def reset(self) -> None:
+        """Start over from the first document."""
+        self.last_ids = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _object_id(value: str) -> Any:
+    try:
+        from bson import ObjectId  # installed with pymongo
+    except ImportError:
+        return value
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def _timestamps(doc: dict) -> dict[str, datetime]:
+    # Every row of an insert_many needs the same columns.
+    now = datetime.now()
+    return {"created_at": doc.get("created_at") or now, "updated_at": doc.get("updated_at") or now}
+
+
+class MongoMigration:
+    """Stream the Mongo collections into the SQL tables."""
+
+    def __init__(self, mongo_db: Any, checkpoint_path: str = "mongo_migration.json", batch: int = 1000):
+        self.mongo_db = mongo_db
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.batch = batch
+        self.stats: dict[str, CollectionStats] = {}
+
+    @classmethod
+    def from_env(cls, batch: int = 1000) -> "MongoMigration":
+        """Connect to MONGO_URL / MONGO_DB, checkpoints go to MIGRATION_CHECKPOINT."""
+        try:
+            from pymongo import MongoClient
+        except ImportError as e:
+            raise RuntimeError("The Mongo migration needs pymongo, install it with `pip install pymongo`.") from e
+        client = MongoClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+        return cls(
+            client[os.getenv("MONGO_DB", "vwr")],
+            checkpoint_path=os.getenv("MIGRATION_CHECKPOINT", "mongo_migration.json"),
+            batch=batch,
+        )
+
+    def _batches(self, collection: str) -> Iterator[list[dict]]:
+        last_id = self.checkpoint.last_ids.get(collection)
+        query = {"_id": {"$gt": _object_id(last_id)}} if last_id is not None else {}
+        cursor = self.mongo_db[collection].find(query).sort("_id", 1).batch_size(self.batch)
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) == self.batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _migrate(self, collection: str, write: Callable[[list[dict], CollectionStats], None]) -> CollectionStats:
+        stats = self.stats[collection] = CollectionStats(collection)
+        started = time.perf_counter()
+        with logfire.span(f"MIGRATE {collection.upper()}"):
+            for docs in self._batches(collection):
+                with db.atomic():
+                    write(docs, stats)
+                stats.read += len(docs)
+                self.checkpoint.save(collection, docs[-1]["_id"])
+                stats.seconds = time.perf_counter() - started
+                logfire.info(f"Migrated {stats.summary()}")
+        stats.seconds = time.perf_counter() - started
+        return stats
+
+    def _write_riders(self, docs: list[dict], stats: CollectionStats) -> None:
+        rows = []
+        for doc in docs:
+            if not doc.get("zwid") or not doc.get("discord_id") or not doc.get("name"):
+                stats.skipped += 1
+                continue
+            rows.append(
+                {
+                    "name": doc["name"],
+                    "zwid": int(doc["zwid"]),
+                    "discord_id": int(doc["discord_id"]),
+                    "discord_name": doc.get("discord_name") or doc["name"],
+                    "tos": bool(doc.get("tos", False)),
+                    "active": bool(doc.get("active", True)),
+                    **_timestamps(doc),
+                }
+            )
+        if rows:
+            inserted = _insert_ignoring(User, rows)
+            stats.written += inserted
+            stats.skipped += len(rows) - inserted
+
+    def _write_orgs(self, docs: list[dict], stats: CollectionStats) -> None:
+        rows = {"club": [], "team": []}
+        for doc in docs:
+            org_type = doc.get("org_type")
+            if org_type not in rows or not doc.get("name") or not doc.get("discord_id"):
+                # Clubs and teams need the creator's discord id.
+                stats.skipped += 1
+                continue
+            row = {
+                "name": doc["name"],
+                "discord_id": str(doc["discord_id"]),
+                "active": bool(doc.get("active", True)),
+                "note": doc.get("note"),
+                **_timestamps(doc),
+            }
+            if org_type == "club":
+                row["zp_club_id"] = doc.get("zp_club_id")
+            rows[org_type].append(row)
+        for model, org_type in ((Club, "club"), (Team, "team")):
+            if rows[org_type]:
+                inserted = _insert_ignoring(model, rows[org_type])
+                stats.written += inserted
+                stats.skipped += len(rows[org_type]) - inserted
+
+    def _org_ids(self) -> dict[str, int]:
+        """``mongo org _id -> SQL id``, matched on the unique org name."""
+        sql_ids = {("club", name): id_ for id_, name in Club.select(Club.id, Club.name).tuples()}
+        sql_ids |= {("team", name): id_ for id_, name in Team.select(Team.id, Team.name).tuples()}
+        org_ids = {}
+        for doc in self.mongo_db["orgs"].find({}, {"_id": 1, "org_type": 1, "name": 1}):
+            sql_id = sql_ids.get((doc.get("org_type"), doc.get("name")))
+            if sql_id is not None:
+                org_ids[str(doc["_id"])] = sql_id
+        return org_ids
+
+    def _membership_writer(self) -> Callable[[list[dict], CollectionStats], None]:
+        org_ids = self._org_ids()
+
+        def write(docs: list[dict], stats: CollectionStats) -> None:
+            # Later memberships of the same kind win, like the last join did in Mongo.
+            per_user: dict[int, dict[str, Any]] = defaultdict(dict)
+            for doc in docs:
+                values = MEMBERSHIP_VALUES.get(str(doc.get("membership_type")))
+                org_id = org_ids.get(str(doc.get("org_id")))
+                if values is None or org_id is None or not doc.get("discord_id"):
+                    stats.skipped += 1
+                    continue
+                per_user[int(doc["discord_id"])].update(values(org_id))
+            groups: dict[tuple, list[int]] = defaultdict(list)
+            for discord_id, values in per_user.items():
+                groups[tuple(sorted(values.items()))].append(discord_id)
+            for values, discord_ids in groups.items():
+                stats.written += User.update(dict(values)).where(User.discord_id.in_(discord_ids)).execute()
+
+        return write
+
+    def run(self, restart: bool = False) -> list[CollectionStats]:
+        """Migrate riders, then orgs, then memberships. Blocking.
+
+        Args:
+            restart: Ignore the checkpoint and start from the first document of every collection.
+
+        """
+        if restart:
+            self.checkpoint.reset()
+        self._migrate("riders", self._write_riders)
+        self._migrate("orgs", self._write_orgs)
+        self._migrate("membership", self._membership_writer())
+        for stats in self.stats.values():
+            logfire.info(f"Migration finished, {stats.summary()}")
+        return list(self.stats.values())
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Migrate riders, orgs and memberships from Mongo to SQL.")
+    parser.add_argument("--batch", type=int, default=1000, help="Documents per batch and transaction.")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over.")
+    args = parser.parse_args(argv)
+    for stats in MongoMigration.from_env(batch=args.batch).run(restart=args.restart):
+        print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
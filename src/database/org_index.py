@@ -0,0 +1,59 @@
+"""In-memory club and team name indexes, used by autocomplete."""
+
+from collections.abc import Hashable
+
+import logfire
+
+from src.database.db_models import Club, Team
+from src.extras import cache_bus
+from src.extras.search_index import SearchIndex
+
+club_index = SearchIndex()
+team_index = SearchIndex()  # entry.data is the team's club id
+
+
+def load_org_indexes() -> None:
+    """Load all active clubs and teams, one streaming query each."""
+    with logfire.span("LOAD ORG INDEXES"):
+        club_index.load(
+            (club_id, name, (), None)
+            for club_id, name in Club.select(Club.id, Club.name).where(Club.active).tuples().iterator()
+        )
+        team_index.load(
+            (team_id, name, (), club_id)
+            for team_id, name, club_id in Team.select(Team.id, Team.name, Team.club_id)
+            .where(Team.active)
+            .tuples()
+            .iterator()
+        )
+        logfire.info(f"Indexed {len(club_index)} clubs and {len(team_index)} teams.")
+
+
+def _apply_club(club: Club | None, key: Hashable) -> None:
+    if club is None or not club.active:
+        club_index.remove(key)
+    else:
+        club_index.add(club.id, club.name)
+
+
+def _apply_team(team: Team | None, key: Hashable) -> None:
+    if team is None or not team.active:
+        team_index.remove(key)
+    else:
+        team_index.add(team.id, team.name, data=team.club_id_id)
+
+
+def _on_club_change(key: Hashable, club: Club | None) -> None:
+    cache_bus.apply_row(
+        ("club", key), club, lambda: Club.get_or_none(Club.id == key), lambda row: _apply_club(row, key)
+    )
+
+
+def _on_team_change(key: Hashable, team: Team | None) -> None:
+    cache_bus.apply_row(
+        ("team", key), team, lambda: Team.get_or_none(Team.id == key), lambda row: _apply_team(row, key)
+    )
+
+
+cache_bus.subscribe("club", _on_club_change)
+cache_bus.subscribe("team", _on_team_change)
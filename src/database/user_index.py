@@ -0,0 +1,42 @@
+"""In-memory rider search index over name, Discord name and Zwift ID, used by ``/rider search``."""
+
+from collections.abc import Hashable
+
+import logfire
+
+from src.database.db_models import User
+from src.extras import cache_bus
+from src.extras.search_index import SearchIndex
+
+user_index = SearchIndex()  # keyed by discord_id, entry.data is (zwid, discord_name)
+
+
+def load_user_index() -> None:
+    """Load all active riders with one streaming query."""
+    with logfire.span("LOAD USER INDEX"):
+        user_index.load(
+            (discord_id, name, (discord_name, zwid), (zwid, discord_name))
+            for discord_id, name, discord_name, zwid in User.select(
+                User.discord_id, User.name, User.discord_name, User.zwid
+            )
+            .where(User.active)
+            .tuples()
+            .iterator()
+        )
+        logfire.info(f"Indexed {len(user_index)} riders.")
+
+
+def _apply_user(user: User | None, key: Hashable) -> None:
+    if user is None or not user.active:
+        user_index.remove(key)
+    else:
+        user_index.add(user.discord_id, user.name, (user.discord_name, user.zwid), data=(user.zwid, user.discord_name))
+
+
+def _on_user_change(key: Hashable, user: User | None) -> None:
+    cache_bus.apply_row(
+        ("user", key), user, lambda: User.get_or_none(User.discord_id == key), lambda row: _apply_user(row, key)
+    )
+
+
+cache_bus.subscribe("user", _on_user_change)
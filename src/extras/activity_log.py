@@ -0,0 +1,284 @@
+"""Buffered writer for the activity_logs channel.
+
+Membership activity (registrations, new clubs/teams, join requests) is posted to the ``activity_logs`` channel.
+Sending one message per event gets throttled hard during a registration wave, so events are buffered in memory and
+flushed as combined embeds every few seconds, or as soon as the buffer reaches the flush size.
+If a flush fails the events that were not sent are appended to a spool file and replayed on the next flush. A guild
+whose flushes keep failing is retried with exponential backoff, up to MAX_RETRY_DELAY seconds apart.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass, field
+
+import discord
+import logfire
+from dotenv import load_dotenv
+
+from src.extras.guild_cache import GuildCache
+
+load_dotenv()
+
+ACTIVITY_LOG_CHANNEL = "activity_logs"
+# Discord limits, see https://discord.com/developers/docs/resources/message#embed-object-embed-limits
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBEDS_PER_MESSAGE = 10
+MESSAGE_CHARACTER_LIMIT = 6000
+EVENT_TEXT_LIMIT = 1000
+MAX_RETRY_DELAY = 300.0
+
+
+@dataclass
+class ActivityEvent:
+    """A single line for the activity log."""
+
+    guild_id: int
+    text: str
+    created_at: float = field(default_factory=time.time)
+
+    def render(self) -> str:
+        """Render the event as one line of an embed description."""
+        return f"<t:{int(self.created_at)}:T> {self.text[:EVENT_TEXT_LIMIT]}"
+
+
+@dataclass
+class ActivityLogStats:
+    """Counters for the activity log sink."""
+
+    queued: int = 0
+    sent: int = 0
+    messages: int = 0
+    dropped: int = 0
+    delayed: int = 0
+    spooled: int = 0
+    failed_flushes: int = 0
+    max_delay: float = 0.0
+
+
+class ActivityLogSink:
+    """Buffer activity events and flush them to the activity_logs channel of each guild."""
+
+    def __init__(
+        self,
+        flush_interval: float = 5.0,
+        flush_size: int = 50,
+        max_buffer: int = 5000,
+        max_spool: int = 50000,
+        delay_threshold: float | None = None,
+        spool_path: str = "activity_logs_spool.jsonl",
+    ):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_buffer = max_buffer
+        self.max_spool = max_spool
+        self.delay_threshold = delay_threshold if delay_threshold is not None else flush_interval * 3
+        self.spool_path = spool_path
+        self.stats = ActivityLogStats()
+        self._buffer: deque[ActivityEvent] = deque()
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._bot: discord.Client | None = None
+        self._channel_ids = GuildCache("activity_log_channels")
+        # guild_id -> (failed flushes in a row, monotonic time of the next attempt)
+        self._backoff: dict[int, tuple[int, float]] = {}
+
+    @classmethod
+    def from_env(cls) -> "ActivityLogSink":
+        """Create a sink configured from environment variables."""
+        return cls(
+            flush_interval=float(os.getenv("ACTIVITY_LOG_FLUSH_SECONDS", "5")),
+            flush_size=int(os.getenv("ACTIVITY_LOG_FLUSH_SIZE", "50")),
+            spool_path=os.getenv("ACTIVITY_LOG_SPOOL", "activity_logs_spool.jsonl"),
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of events waiting in memory."""
+        return len(self._buffer)
+
+    def start(self, bot: discord.Client) -> None:
+        """Start the background flush task, safe to call on every on_ready."""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="activity-log-flush")
+            logfire.info("Activity log sink started.")
+
+    async def stop(self) -> None:
+        """Stop the flush task and flush whatever is left."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def post(self, guild: discord.Guild | None, text: str) -> None:
+        """Queue a line for the guild's activity_logs channel. Never blocks and never raises.
+
+        Args:
+            guild: The guild the activity happened in.
+            text: The line to log, markdown is allowed.
+
+        """
+        if guild is None:
+            return
+        if len(self._buffer) >= self.max_buffer:
+            self.stats.dropped += 1
+            logfire.warn(f"Activity log buffer full, dropped event for guild {guild.id}")
+            return
+        self._buffer.append(ActivityEvent(guild_id=guild.id, text=text))
+        self.stats.queued += 1
+        if len(self._buffer) >= self.flush_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logfire.error(f"Activity log flush crashed: {e}", exc_info=True)
+
+    async def flush(self) -> None:
+        """Send all spooled and buffered events, spooling anything that could not be sent."""
+        async with self._lock:
+            events = self._read_spool()
+            while self._buffer:
+                events.append(self._buffer.popleft())
+            if not events:
+                return
+
+            by_guild: dict[int, list[ActivityEvent]] = defaultdict(list)
+            for event in events:
+                by_guild[event.guild_id].append(event)
+
+            unsent: list[ActivityEvent] = []
+            failed = False
+            now = time.monotonic()
+            for guild_id, guild_events in by_guild.items():
+                failures, retry_at = self._backoff.get(guild_id, (0, 0.0))
+                if retry_at > now:
+                    unsent.extend(guild_events)
+                    continue
+                try:
+                    await self._send(guild_id, guild_events)
+                    self._backoff.pop(guild_id, None)
+                except Exception as e:
+                    # _send removed the events it did send, only the rest is spooled.
+                    logfire.error(f"Failed to flush {len(guild_events)} activity events for guild {guild_id}: {e}")
+                    delay = min(self.flush_interval * 2 ** min(failures, 10), MAX_RETRY_DELAY)
+                    self._backoff[guild_id] = (failures + 1, time.monotonic() + delay)
+                    unsent.extend(guild_events)
+                    failed = True
+            if failed:
+                self.stats.failed_flushes += 1
+            self._write_spool(unsent)
+
+    async def _send(self, guild_id: int, events: list[ActivityEvent]) -> None:
+        """Send the events, removing each message's events from ``events`` once it is sent."""
+        channel = self._get_channel(guild_id)
+        if channel is None:
+            # Same as before the sink existed: no activity_logs channel, nothing is logged.
+            self.stats.dropped += len(events)
+            events.clear()
+            return
+        for embeds, count in self._pack(events):
+            await channel.send(embeds=embeds)
+            self.stats.messages += 1
+            now = time.time()
+            for event in events[:count]:
+                delay = now - event.created_at
+                self.stats.max_delay = max(self.stats.max_delay, delay)
+                if delay > self.delay_threshold:
+                    self.stats.delayed += 1
+            self.stats.sent += count
+            del events[:count]
+
+    def _get_channel(self, guild_id: int) -> discord.TextChannel | None:
+        if self._bot is None:
+            raise RuntimeError("Activity log sink has not been started.")
+        guild = self._bot.get_guild(guild_id)
+        if guild is None:
+            return None
+        channel_id = self._channel_ids.get(guild_id, ACTIVITY_LOG_CHANNEL)
+        channel = guild.get_channel(channel_id) if channel_id else None
+        if channel is None:
+            channel = discord.utils.get(guild.text_channels, name=ACTIVITY_LOG_CHANNEL)
+            if channel is not None:
+                self._channel_ids.set(guild_id, ACTIVITY_LOG_CHANNEL, channel.id)
+        return channel
+
+    @staticmethod
+    def _pack(events: list[ActivityEvent]) -> list[tuple[list[discord.Embed], int]]:
+        """Pack event lines into as few messages of embeds as Discord's limits allow.
+
+        Returns:
+            The embeds of each message and the number of events in it, in the order of ``events``.
+
+        """
+        descriptions: list[tuple[str, int]] = []
+        current, lines = "", 0
+        for event in events:
+            line = event.render()
+            if current and len(current) + len(line) + 1 > EMBED_DESCRIPTION_LIMIT:
+                descriptions.append((current, lines))
+                current, lines = "", 0
+            current = f"{current}\n{line}" if current else line
+            lines += 1
+        if current:
+            descriptions.append((current, lines))
+
+        messages: list[tuple[list[discord.Embed], int]] = []
+        embeds: list[discord.Embed] = []
+        size = count = 0
+        for description, lines in descriptions:
+            if embeds and (len(embeds) >= EMBEDS_PER_MESSAGE or size + len(description) > MESSAGE_CHARACTER_LIMIT):
+                messages.append((embeds, count))
+                embeds, size, count = [], 0, 0
+            embeds.append(discord.Embed(description=description, color=discord.Color.blue()))
+            size += len(description)
+            count += lines
+        if embeds:
+            messages.append((embeds, count))
+        return messages
+
+    def _read_spool(self) -> list[ActivityEvent]:
+        if not os.path.exists(self.spool_path):
+            return []
+        events = []
+        try:
+            with open(self.spool_path, encoding="utf-8") as f:
+                events.extend(ActivityEvent(**json.loads(line)) for line in f if line.strip())
+        except (OSError, ValueError, TypeError) as e:
+            logfire.error(f"Failed to read activity log spool {self.spool_path}: {e}")
+        return events
+
+    def _write_spool(self, events: list[ActivityEvent]) -> None:
+        """Replace the spool with the events that failed to send."""
+        if len(events) > self.max_spool:
+            self.stats.dropped += len(events) - self.max_spool
+            events = events[-self.max_spool :]
+        if not events:
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            return
+        tmp_path = f"{self.spool_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(asdict(event)) + "\n" for event in events)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.spool_path)
+            self.stats.spooled += len(events)
+            logfire.warn(f"Spooled {len(events)} activity events to {self.spool_path}")
+        except OSError as e:
+            self.stats.dropped += len(events)
+            logfire.error(f"Failed to spool {len(events)} activity events: {e}")
+
+
+activity_log = ActivityLogSink.from_env()
@@ -0,0 +1,99 @@
+"""Publish/subscribe for cache invalidation.
+
+Models publish a message when a row changes, caches subscribe to the kinds they hold.
+Handlers get the changed instance when the change happened in this process, or ``None`` and have to reload the row,
+with ``apply_row`` so the query does not block the event loop.
+When the bot runs as a cluster, local changes are also forwarded to the other workers, see ``src.bot.cluster``.
+"""
+
+import asyncio
+from collections import defaultdict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+import logfire
+
+Handler = Callable[[Hashable, Any | None], None]
+
+_subscribers: dict[str, list[Handler]] = defaultdict(list)
+_forwarder: Callable[[str, Hashable], None] | None = None
+# Reloads in flight, and the latest change per token so an older reload finishing last is dropped.
+_reloads: set[asyncio.Task] = set()
+_latest: dict[Hashable, int] = {}
+_changes = 0
+
+
+def subscribe(kind: str, handler: Handler) -> None:
+    """Call ``handler(key, instance)`` whenever a ``kind`` (user, club, team, ...) changes."""
+    if handler not in _subscribers[kind]:
+        _subscribers[kind].append(handler)
+
+
+def set_forwarder(forwarder: Callable[[str, Hashable], None] | None) -> None:
+    """Forward every local change to other processes with ``forwarder(kind, key)``."""
+    global _forwarder
+    _forwarder = forwarder
+
+
+def publish(kind: str, key: Hashable, instance: Any | None = None, remote: bool = False) -> None:
+    """Tell the subscribers that a row changed. Handler errors are logged, never raised to the writer.
+
+    Args:
+        kind: What changed: user, club, team, ...
+        key: The id of the row.
+        instance: The changed row, if the change happened in this process.
+        remote: The change came from another process and must not be forwarded again.
+
+    """
+    if not remote and _forwarder is not None:
+        try:
+            _forwarder(kind, key)
+        except Exception as e:
+            logfire.error(f"Failed to forward invalidation of {kind} {key}: {e}")
+    for handler in _subscribers.get(kind, ()):
+        try:
+            handler(key, instance)
+        except Exception as e:
+            logfire.error(f"Cache invalidation handler for {kind} {key} failed: {e}", exc_info=True)
+
+
+def apply_row(token: Hashable, instance: Any | None, load: Callable[[], Any], apply: Callable[[Any], None]) -> None:
+    """Hand a changed row to ``apply``, loading it with the blocking ``load`` when the change came without it.
+
+    On the event loop ``load`` runs in a worker thread and ``apply`` runs on the loop once it returns. Called from
+    a thread, both run inline. Of several changes with the same ``token`` only the latest is applied.
+
+    Args:
+        token: Identifies what is reloaded, e.g. ``("club", club_id)``.
+        instance: The row published with the change, None to load it.
+        load: Reads the row, or whatever ``apply`` needs.
+        apply: Updates the cache.
+
+    """
+    global _changes
+    if instance is not None:
+        # A reload still in flight read the row before this change.
+        _latest.pop(token, None)
+        apply(instance)
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _latest.pop(token, None)
+        apply(load())
+        return
+    _changes += 1
+    _latest[token] = _changes
+    task = loop.create_task(_reload(token, _changes, load, apply))
+    _reloads.add(task)
+    task.add_done_callback(_reloads.discard)
+
+
+async def _reload(token: Hashable, change: int, load: Callable[[], Any], apply: Callable[[Any], None]) -> None:
+    try:
+        row = await asyncio.to_thread(load)
+        if _latest.get(token) == change:
+            del _latest[token]
+            apply(row)
+    except Exception as e:
+        logfire.error(f"Failed to reload {token}: {e}", exc_info=True)
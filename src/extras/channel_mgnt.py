@@ -1,40 +1,249 @@
 """Utilities for managing categories and channels."""
 
+import asyncio
+import re
+from dataclasses import dataclass, field
 from typing import Literal
 
 import discord
 import logfire
 
+from src.database.db_models import Club, Team
+from src.extras.guild_cache import GuildCache
 
-async def create_on_guild(ctx, org_type: Literal["team", "club"], org_name: str) -> discord.TextChannel:
-    """Create a new club Category or Team Channel on the server."""
-    # Make sure we have categories Clubs and Teams
-    try:
-        if org_type == "club":
-            logfire.info("Get the category named 'CLUBS' in the server")
-            guild = ctx.guild
-            category = discord.utils.get(guild.categories, name="CLUBS")
-
-            logfire.info("Create Text channel under the 'CLUBS' category")
-            club_channel = await guild.create_text_channel(name=org_name, category=category)
-
-            logfire.info("Club channel created")
-            await ctx.respond(
-                f"✅ Club '{org_name}' has been created successfully! Check it out here: {club_channel.mention}"
-            )
-            return club_channel
-        elif org_type == "team":
-            logfire.info("Get the channel named 'TEAMS' in the server")
-            guild = ctx.guild
-            category = discord.utils.get(guild.categories, name="TEAMS")
-            logfire.info("Create Text channel under the 'TEAMS' category")
-            team_channel = await guild.create_text_channel(name=org_name, category=category)
-            logfire.info("Club channel created")
-            await ctx.respond(
-                f"✅ Team '{org_name}' has been created successfully! Check it out here: {team_channel.mention}"
-            )
-            return team_channel
-
-    except Exception as e:
-        logfire.error(f"Failed to create club: {e}")
-        await ctx.respond("❌ Failed to create club. An error occurred.", ephemeral=True)
+ORG_CATEGORIES = {"club": "CLUBS", "team": "TEAMS"}
+# Discord caps a guild at 250 roles and a category at 50 channels.
+GUILD_ROLE_LIMIT = 250
+CATEGORY_CHANNEL_LIMIT = 50
+
+# category name -> category id, per guild
+_category_ids = GuildCache("categories")
+
+
+def org_slug(org_name: str) -> str:
+    """Discord safe channel name part."""
+    return re.sub(r"[^a-z0-9_\-]", "-", org_name.lower())[:90]
+
+
+def org_channel_name(org_type: Literal["team", "club"], org_name: str) -> str:
+    """Channel name of a club or team, e.g. ``club-my-club``."""
+    return f"{org_type}-{org_slug(org_name)}"
+
+
+def org_role_name(org_type: Literal["team", "club"], org_name: str) -> str:
+    """Member role name of a club or team, e.g. ``CLUB_My Club_MEMBER``."""
+    return f"{org_type.upper()}_{org_name}_MEMBER"[:100]
+
+
+async def get_category(guild: discord.Guild, name: str, create: bool = False) -> discord.CategoryChannel | None:
+    """Get a category by name, the id is cached per guild so later calls skip the scan."""
+    category_id = _category_ids.get(guild.id, name)
+    category = guild.get_channel(category_id) if category_id else None
+    if category is None:
+        category = discord.utils.get(guild.categories, name=name)
+        if category is None and create:
+            logfire.info(f"Create the '{name}' category")
+            category = await guild.create_category(name)
+        if category is not None:
+            _category_ids.set(guild.id, name, category.id)
+    return category
+
+
+def org_category_name(org_type: Literal["team", "club"], number: int = 1) -> str:
+    """Name of the n-th category of a type, ``TEAMS``, ``TEAMS 2``, ``TEAMS 3``, ..."""
+    name = ORG_CATEGORIES[org_type]
+    return name if number == 1 else f"{name} {number}"
+
+
+async def org_categories(
+    guild: discord.Guild, org_type: Literal["team", "club"], needed: int = 1
+) -> list[discord.CategoryChannel]:
+    """Categories for ``needed`` new org channels, one entry per channel.
+
+    A full category spills into the next numbered one, which is created when it does not exist yet.
+    """
+    slots = []
+    number = 1
+    while len(slots) < needed:
+        category = await get_category(guild, org_category_name(org_type, number), create=True)
+        free = CATEGORY_CHANNEL_LIMIT - len(category.channels)
+        slots.extend([category] * max(0, min(free, needed - len(slots))))
+        number += 1
+    return slots
+
+
+async def create_org_role(guild: discord.Guild, org_type: Literal["team", "club"], org: Club | Team) -> discord.Role:
+    """Create the member role of a club or team."""
+    return await guild.create_role(
+        name=org_role_name(org_type, org.name), mentionable=True, reason=f"VWR {org_type} provisioning"
+    )
+
+
+async def create_org_channel(
+    guild: discord.Guild,
+    org_type: Literal["team", "club"],
+    org: Club | Team,
+    role: discord.Role,
+    parent_role: discord.Role | None = None,
+    category: discord.CategoryChannel | None = None,
+) -> discord.TextChannel:
+    """Create the private channel of a club or team, with its permission overwrites in the same request.
+
+    The channel is hidden for everyone, visible to the org role, and for a team also to its club's role. Without a
+    ``category`` the first org category with room is used.
+    """
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(view_channel=False),
+        guild.me: discord.PermissionOverwrite(view_channel=True, manage_channels=True),
+        role: discord.PermissionOverwrite(view_channel=True),
+    }
+    if parent_role is not None:
+        overwrites[parent_role] = discord.PermissionOverwrite(view_channel=True)
+    if category is None:
+        (category,) = await org_categories(guild, org_type)
+    return await guild.create_text_channel(
+        name=org_channel_name(org_type, org.name),
+        category=category,
+        overwrites=overwrites,
+        reason=f"VWR {org_type} provisioning",
+    )
+
+
+async def provision_org(
+    guild: discord.Guild,
+    org_type: Literal["team", "club"],
+    org: Club | Team,
+    parent_role: discord.Role | None = None,
+    category: discord.CategoryChannel | None = None,
+) -> tuple[discord.Role, discord.TextChannel]:
+    """Create the member role and the private channel of a club or team.
+
+    Existing role or channel ids on the org are reused. If the channel cannot be created, a role created here is
+    deleted again.
+
+    Args:
+        guild: The guild to provision on.
+        org_type: club or team.
+        org: The Club or Team row, it is not saved here.
+        parent_role: The club role of a team.
+        category: The category of the channel, by default the first org category with room.
+
+    Returns:
+        The role and the channel.
+
+    """
+    role = guild.get_role(org.discord_role_id) if org.discord_role_id else None
+    created_role = role is None
+    if role is None:
+        role = await create_org_role(guild, org_type, org)
+    channel = guild.get_channel(org.discord_channel_id) if org.discord_channel_id else None
+    if channel is None:
+        try:
+            channel = await create_org_channel(guild, org_type, org, role, parent_role, category)
+        except discord.HTTPException:
+            if created_role:
+                await role.delete(reason="VWR provisioning rollback")
+            raise
+    return role, channel
+
+
+@dataclass
+class ProvisionReport:
+    """Outcome of a bulk provisioning run."""
+
+    clubs: int = 0
+    teams: int = 0
+    failed: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        """One line summary for Discord and the logs."""
+        failed = f", failed: {', '.join(self.failed)}" if self.failed else ""
+        skipped = f", skipped at the {GUILD_ROLE_LIMIT} role limit: {', '.join(self.skipped)}" if self.skipped else ""
+        return f"Provisioned {self.clubs} clubs and {self.teams} teams in {self.seconds:.1f}s{failed}{skipped}"
+
+
+def _cap_new_roles(orgs: list[Club | Team], room: int) -> tuple[list[Club | Team], list[Club | Team]]:
+    """Split orgs into those that fit in ``room`` new roles and those that do not, in order."""
+    kept, skipped = [], []
+    for org in orgs:
+        if org.discord_role_id is None:
+            if room <= 0:
+                skipped.append(org)
+                continue
+            room -= 1
+        kept.append(org)
+    return kept, skipped
+
+
+async def provision_orgs(guild: discord.Guild, concurrency: int = 5) -> ProvisionReport:
+    """Create roles and channels for every active club and team that lacks them.
+
+    Clubs go first because team channels are shared with their club's role. Each phase runs concurrently under a
+    semaphore and writes the new ids back with one bulk update. The batch is capped at the guild's role limit, orgs
+    that do not fit are skipped and reported. Channels spill into ``TEAMS 2``, ``TEAMS 3``, ... once a category holds
+    50 channels.
+
+    Args:
+        guild: The guild to provision on.
+        concurrency: Maximum number of orgs provisioned at the same time.
+
+    """
+    report = ProvisionReport()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    semaphore = asyncio.Semaphore(concurrency)
+    missing = Club.discord_channel_id.is_null() | Club.discord_role_id.is_null()
+    clubs = list(Club.select().where(Club.active & missing))
+    teams = list(
+        Team.select().where(Team.active & (Team.discord_channel_id.is_null() | Team.discord_role_id.is_null()))
+    )
+    orgs, skipped = _cap_new_roles([*clubs, *teams], GUILD_ROLE_LIMIT - len(guild.roles))
+    if skipped:
+        report.skipped = [org.name for org in skipped]
+        logfire.warn(f"{len(skipped)} orgs skipped, {guild.name} would exceed the {GUILD_ROLE_LIMIT} role limit")
+    clubs = [org for org in orgs if isinstance(org, Club)]
+    teams = [org for org in orgs if isinstance(org, Team)]
+    # Categories are picked (and created) up front instead of racing in the workers.
+    categories = {}
+    for org_type, batch in (("club", clubs), ("team", teams)):
+        without_channel = [org for org in batch if org.discord_channel_id is None]
+        slots = await org_categories(guild, org_type, len(without_channel)) if without_channel else []
+        categories.update(zip((id(org) for org in without_channel), slots, strict=True))
+
+    async def provision(org_type, org, parent_role=None):
+        async with semaphore:
+            try:
+                role, channel = await provision_org(guild, org_type, org, parent_role, categories.get(id(org)))
+            except discord.HTTPException as e:
+                logfire.error(f"Failed to provision {org_type} {org.name}: {e}")
+                report.failed.append(org.name)
+                return None
+            org.discord_role_id = role.id
+            org.discord_channel_id = channel.id
+            return org
+
+    with logfire.span("PROVISION ORGS"):
+        done_clubs = [c for c in await asyncio.gather(*(provision("club", c) for c in clubs)) if c is not None]
+        if done_clubs:
+            Club.bulk_update(done_clubs, fields=[Club.discord_role_id, Club.discord_channel_id], batch_size=100)
+        report.clubs = len(done_clubs)
+
+        club_role_ids = dict(
+            Club.select(Club.id, Club.discord_role_id).where(Club.discord_role_id.is_null(False)).tuples()
+        )
+
+        def parent_role(team):
+            role_id = club_role_ids.get(team.club_id_id)
+            return guild.get_role(role_id) if role_id else None
+
+        done_teams = [
+            t for t in await asyncio.gather(*(provision("team", t, parent_role(t)) for t in teams)) if t is not None
+        ]
+        if done_teams:
+            Team.bulk_update(done_teams, fields=[Team.discord_role_id, Team.discord_channel_id], batch_size=100)
+        report.teams = len(done_teams)
+        report.seconds = loop.time() - started
+        logfire.info(report.summary())
+    return report
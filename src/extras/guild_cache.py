@@ -0,0 +1,102 @@
+"""Guild scoped caches, partitioned by the shard that owns the guild.
+
+Each shard only holds entries for its own guilds, so memory follows the guilds a process is connected to and a
+guild leaving (or a whole shard) can be dropped in one go.
+"""
+
+from collections.abc import Hashable
+from typing import Any
+
+_shard_count = 1
+_caches: list["GuildCache"] = []
+
+
+def shard_for(guild_id: int, shard_count: int | None = None) -> int:
+    """Shard that owns a guild, per Discord's sharding formula."""
+    return (guild_id >> 22) % (shard_count or _shard_count)
+
+
+def configure(shard_count: int) -> None:
+    """Set the shard count once it is known, existing entries are re-partitioned."""
+    global _shard_count
+    if shard_count == _shard_count:
+        return
+    _shard_count = max(1, shard_count)
+    for cache in _caches:
+        cache.repartition()
+
+
+def caches() -> list["GuildCache"]:
+    """Every guild cache, for the metrics endpoint."""
+    return list(_caches)
+
+
+def drop_guild(guild_id: int) -> None:
+    """Forget a guild in every cache, e.g. when the bot is removed from it."""
+    for cache in _caches:
+        cache.drop_guild(guild_id)
+
+
+def drop_shard(shard_id: int) -> None:
+    """Forget every guild of a shard in every cache."""
+    for cache in _caches:
+        cache.drop_shard(shard_id)
+
+
+class GuildCache:
+    """``guild_id -> key -> value`` cache, stored per shard."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._shards: dict[int, dict[int, dict[Hashable, Any]]] = {}
+        _caches.append(self)
+
+    def guild(self, guild_id: int) -> dict[Hashable, Any]:
+        """The (mutable) entries of one guild."""
+        return self._shards.setdefault(shard_for(guild_id), {}).setdefault(guild_id, {})
+
+    def get(self, guild_id: int, key: Hashable, default: Any = None) -> Any:
+        """Get a value for a guild."""
+        guilds = self._shards.get(shard_for(guild_id))
+        if guilds is None or guild_id not in guilds or key not in guilds[guild_id]:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return guilds[guild_id][key]
+
+    def set(self, guild_id: int, key: Hashable, value: Any) -> None:
+        """Set a value for a guild."""
+        self.guild(guild_id)[key] = value
+
+    def drop_guild(self, guild_id: int) -> None:
+        """Remove all entries of a guild."""
+        guilds = self._shards.get(shard_for(guild_id))
+        if guilds is not None:
+            guilds.pop(guild_id, None)
+
+    def drop_shard(self, shard_id: int) -> None:
+        """Remove all entries of a shard."""
+        self._shards.pop(shard_id, None)
+
+    def drop_key(self, key: Hashable) -> None:
+        """Remove a key from every guild."""
+        for guilds in self._shards.values():
+            for entries in guilds.values():
+                entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove everything."""
+        self._shards = {}
+
+    def repartition(self) -> None:
+        """Move entries to their shard after the shard count changed."""
+        guilds = [item for shard in self._shards.values() for item in shard.items()]
+        self._shards = {}
+        for guild_id, entries in guilds:
+            self._shards.setdefault(shard_for(guild_id), {})[guild_id] = entries
+
+    def sizes(self) -> dict[int, int]:
+        """Number of entries per shard."""
+        return {shard_id: sum(len(e) for e in guilds.values()) for shard_id, guilds in self._shards.items()}
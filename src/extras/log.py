@@ -0,0 +1,177 @@
+"""Logging facade over logfire: structured, lazy and sampled.
+
+``logfire.info(f"...")`` formats its message even when the record is dropped, and reprs of guild objects
+(``member.roles``, whole user dicts) are not cheap. With the facade the message is a template, the values are
+attributes, and nothing is formatted unless the record is emitted::
+
+    log = get_logger("roles", sample_rate=0.1)
+    log.info("Roles of {discord_id}", discord_id=discord_id, roles=lazy(lambda: [r.name for r in member.roles]))
+
+Sampling is decided once per span: records inside an unsampled span are skipped, including nested spans. Records
+outside any span are sampled one by one with their logger's rate. Warnings and errors are never sampled. LOG_LEVEL
+sets the minimum level (default info).
+
+Run ``python -m src.extras.log`` for a benchmark against eager f-strings.
+"""
+
+import contextlib
+import os
+import random
+from collections.abc import Callable, Iterator
+from contextvars import ContextVar
+from typing import Any
+
+import logfire
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEVELS = {"trace": 1, "debug": 5, "info": 9, "notice": 10, "warn": 13, "error": 17, "fatal": 21}
+# Records at or above this level ignore sampling.
+ALWAYS_LEVEL = LEVELS["warn"]
+
+_min_level = LEVELS.get(os.getenv("LOG_LEVEL", "info").lower(), LEVELS["info"])
+# None outside any span, then the logger's own rate decides per record.
+_sampled: ContextVar[bool | None] = ContextVar("log_sampled", default=None)
+
+
+class lazy:
+    """An attribute computed only when the record is emitted."""
+
+    __slots__ = ("func",)
+
+    def __init__(self, func: Callable[[], Any]):
+        self.func = func
+
+
+def set_level(level: str) -> None:
+    """Change the minimum level at runtime."""
+    global _min_level
+    _min_level = LEVELS[level]
+
+
+def _roll(rate: float) -> bool:
+    return rate >= 1.0 or random.random() < rate
+
+
+def _resolve(attributes: dict[str, Any]) -> dict[str, Any]:
+    for key, value in attributes.items():
+        if isinstance(value, lazy):
+            try:
+                attributes[key] = value.func()
+            except Exception as e:
+                attributes[key] = f"<failed: {e}>"
+    return attributes
+
+
+class Logger:
+    """A named logger, records are tagged with the name."""
+
+    def __init__(self, name: str, sample_rate: float = 1.0):
+        self.name = name
+        self.sample_rate = sample_rate
+        self._tags = [name]
+
+    def enabled(self, level: str) -> bool:
+        """Whether a record of this level can be emitted here, check before building expensive attributes.
+
+        Outside a span a record can still be sampled out when it is logged.
+        """
+        number = LEVELS[level]
+        return number >= _min_level and (number >= ALWAYS_LEVEL or _sampled.get() is not False)
+
+    def _log(self, level: str, template: str, attributes: dict[str, Any], exc_info: bool = False) -> None:
+        if not self.enabled(level):
+            return
+        if LEVELS[level] < ALWAYS_LEVEL and _sampled.get() is None and not _roll(self.sample_rate):
+            return
+        logfire.log(level, template, attributes=_resolve(attributes), tags=self._tags, exc_info=exc_info)
+
+    def debug(self, template: str, /, **attributes: Any) -> None:
+        """Log at debug level."""
+        self._log("debug", template, attributes)
+
+    def info(self, template: str, /, **attributes: Any) -> None:
+        """Log at info level."""
+        self._log("info", template, attributes)
+
+    def warn(self, template: str, /, **attributes: Any) -> None:
+        """Log at warn level, never sampled."""
+        self._log("warn", template, attributes)
+
+    def error(self, template: str, /, exc_info: bool = False, **attributes: Any) -> None:
+        """Log at error level, never sampled."""
+        self._log("error", template, attributes, exc_info=exc_info)
+
+    @contextlib.contextmanager
+    def span(self, template: str, /, sample_rate: float | None = None, **attributes: Any) -> Iterator[None]:
+        """A logfire span, sampled with ``sample_rate`` (default: the logger's rate).
+
+        A span inside an unsampled span is never sampled, so a sampled out interaction costs nothing end to end.
+        """
+        rate = self.sample_rate if sample_rate is None else sample_rate
+        sampled = _sampled.get() is not False and _roll(rate) and LEVELS["info"] >= _min_level
+        token = _sampled.set(sampled)
+        try:
+            if not sampled:
+                yield
+                return
+            with logfire.span(template, _tags=self._tags, **_resolve(attributes)):
+                yield
+        finally:
+            _sampled.reset(token)
+
+
+_loggers: dict[str, Logger] = {}
+
+
+def get_logger(name: str, sample_rate: float | None = None) -> Logger:
+    """The logger for ``name``. Rates come from ``sample_rate`` or LOG_SAMPLE_<NAME> (default 1, log everything)."""
+    if name not in _loggers:
+        env_rate = os.getenv(f"LOG_SAMPLE_{name.upper()}")
+        rate = float(env_rate) if env_rate else sample_rate if sample_rate is not None else 1.0
+        _loggers[name] = Logger(name, sample_rate=rate)
+    return _loggers[name]
+
+
+if __name__ == "__main__":
+    import timeit
+
+    logfire.configure(send_to_logfire=False, console=False)
+
+    class _Role:
+        def __init__(self, i):
+            self.id = 10**17 + i
+            self.name = f"role-{i}"
+
+        def __repr__(self):
+            return f"<Role id={self.id} name={self.name!r}>"
+
+    roles = [_Role(i) for i in range(40)]
+    user = {f"field_{i}": f"value {i}" * 4 for i in range(15)}
+    bench_log = get_logger("bench", sample_rate=0.01)
+
+    def eager():
+        """Three formatted lines per interaction."""
+        # What check_user_roles and User.lookup used to do: three formatted lines per interaction.
+        logfire.info(f"Checking server roles for {123}, with {'REGISTERED'}")
+        logfire.info(f"discord_id: member has roles: {roles}")
+        logfire.info(f"Found user: {user}")
+
+    def facade_sampled():
+        """The same lines through the facade, 1% of the spans kept."""
+        with bench_log.span("interaction"):
+            bench_log.info("Checking server roles for {discord_id}", discord_id=123, role_filter="REGISTERED")
+            bench_log.info("Member roles", roles=lazy(lambda: [r.name for r in roles]))
+            bench_log.info("Found user", user=lazy(lambda: user))
+
+    def facade_debug():
+        """Lines below the log level, nothing is formatted."""
+        bench_log.debug("Member roles", roles=lazy(lambda: [r.name for r in roles]))
+        bench_log.debug("Found user", user=lazy(lambda: user))
+
+    n = 2000
+    cases = (("eager f-strings", eager), ("facade, 1% sampled", facade_sampled), ("facade, debug", facade_debug))
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=n, repeat=3)) / n
+        print(f"{name:<20} {seconds * 1e6:8.1f} us per interaction")
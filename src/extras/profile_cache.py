@@ -0,0 +1,220 @@
+"""Pre-rendered rider profile embeds.
+
+``/rider profile`` used to build its embed field by field on every request. Profiles are now rendered once per
+guild and member, cached as embed dicts, and dropped when the user's row changes (cache_bus "user"), their roles
+change (``on_member_update``) or their club or team changes. A cache hit only turns the dict back into an Embed.
+
+The cache holds at most PROFILE_CACHE_SIZE embeds, least recently used go first, and an embed older than
+PROFILE_CACHE_TTL seconds is rendered again.
+
+Run ``python -m src.extras.profile_cache`` for a benchmark of the rendering cost (a hit also skips the DB lookup).
+"""
+
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from typing import Any
+
+import discord
+from dotenv import load_dotenv
+
+from src.database.db_models import User
+from src.extras import cache_bus
+from src.extras.guild_cache import GuildCache
+
+load_dotenv()
+
+PROFILE_TITLE = "Registration Info"
+FIELD_VALUE_LIMIT = 1024
+
+
+def render_profile(profile: dict[str, Any], member: discord.Member) -> dict:
+    """Render a profile embed as a dict, ready for ``discord.Embed.from_dict``.
+
+    Args:
+        profile: ``User.profile`` of the rider.
+        member: The rider in the guild the profile is shown in, for the mention and the roles.
+
+    Returns:
+        The embed payload.
+
+    """
+    fields = [{"name": "Discord", "value": member.mention, "inline": True}]
+    fields.extend({"name": name, "value": str(value), "inline": True} for name, value in profile.items())
+    roles = ", ".join(role.name for role in getattr(member, "roles", ()) if not role.is_default()) or "None"
+    fields.append({"name": "Roles", "value": roles[:FIELD_VALUE_LIMIT], "inline": True})
+    return {"type": "rich", "title": PROFILE_TITLE, "color": discord.Color.blue().value, "fields": fields}
+
+
+class ProfileCache:
+    """``guild_id -> discord_id -> embed dict``, bounded in size and age."""
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._embeds = GuildCache("profile_embeds")
+        # (guild_id, discord_id) -> monotonic time it expires, least recently used first.
+        self._lru: OrderedDict[tuple[int, int], float] = OrderedDict()
+        # discord_id -> guilds it is cached in, so a user is invalidated without a scan.
+        self._guilds: dict[int, set[int]] = {}
+        # Bumped on every invalidation. A render that started before its user's last invalidation is not stored.
+        self._generation = 0
+        self._invalidated: OrderedDict[int, int] = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "ProfileCache":
+        """Create a cache bounded by PROFILE_CACHE_SIZE entries and PROFILE_CACHE_TTL seconds."""
+        return cls(
+            max_entries=int(os.getenv("PROFILE_CACHE_SIZE", "5000")),
+            ttl=float(os.getenv("PROFILE_CACHE_TTL", "3600")),
+        )
+
+    def __len__(self) -> int:
+        """Number of cached embeds."""
+        return len(self._lru)
+
+    def get(self, guild_id: int, discord_id: int) -> discord.Embed | None:
+        """The cached embed, or None. Hits and misses are counted by the GuildCache."""
+        key = (guild_id, discord_id)
+        expires = self._lru.get(key)
+        if expires is not None:
+            if time.monotonic() > expires:
+                self._drop(key)
+            else:
+                self._lru.move_to_end(key)
+        payload = self._embeds.get(guild_id, discord_id)
+        return discord.Embed.from_dict(payload) if payload is not None else None
+
+    def generation(self) -> int:
+        """Take before loading the profile, pass to ``put``."""
+        return self._generation
+
+    def put(self, guild_id: int, discord_id: int, payload: dict, generation: int, ttl: float | None = None) -> None:
+        """Store a rendered profile, unless the user changed while it was rendered.
+
+        Args:
+            guild_id: The guild the profile was rendered for.
+            discord_id: The rider.
+            payload: The rendered embed.
+            generation: ``generation()`` taken before the profile was loaded.
+            ttl: Seconds the profile is kept, shorter than the cache's TTL for an incomplete profile.
+
+        """
+        if self._invalidated.get(discord_id, 0) > generation:
+            return
+        key = (guild_id, discord_id)
+        self._embeds.set(guild_id, discord_id, payload)
+        self._lru[key] = time.monotonic() + min(self.ttl, ttl if ttl is not None else self.ttl)
+        self._lru.move_to_end(key)
+        self._guilds.setdefault(discord_id, set()).add(guild_id)
+        while len(self._lru) > self.max_entries:
+            self._drop(next(iter(self._lru)))
+
+    def _drop(self, key: tuple[int, int]) -> None:
+        guild_id, discord_id = key
+        self._lru.pop(key, None)
+        self._embeds.guild(guild_id).pop(discord_id, None)
+        guilds = self._guilds.get(discord_id)
+        if guilds is not None:
+            guilds.discard(guild_id)
+            if not guilds:
+                del self._guilds[discord_id]
+
+    def invalidate(self, discord_id: int, guild_id: int | None = None) -> None:
+        """Drop a user's profile in one guild, or in every guild."""
+        self._generation += 1
+        self._invalidated[discord_id] = self._generation
+        self._invalidated.move_to_end(discord_id)
+        while len(self._invalidated) > self.max_entries:
+            self._invalidated.popitem(last=False)
+        guilds = [guild_id] if guild_id is not None else list(self._guilds.get(discord_id, ()))
+        for guild in guilds:
+            self._drop((guild, discord_id))
+
+    def invalidate_many(self, discord_ids: Iterable[int]) -> None:
+        """Drop the profiles of several users in every guild."""
+        for discord_id in discord_ids:
+            self.invalidate(discord_id)
+
+    def cached_users(self) -> int:
+        """Number of users with at least one cached profile."""
+        return len(self._guilds)
+
+    def clear(self) -> None:
+        """Drop every profile."""
+        for discord_id in list(self._guilds):
+            self.invalidate(discord_id)
+
+
+profile_cache = ProfileCache.from_env()
+
+
+def _on_user_change(key: Hashable, user: Any | None) -> None:
+    profile_cache.invalidate(int(key))
+
+
+def _members(field: Any, key: Hashable) -> list[int]:
+    return [d for (d,) in User.select(User.discord_id).where(field == key).tuples()]
+
+
+def _on_club_change(key: Hashable, club: Any | None) -> None:
+    # Profiles show the club name, only its members' profiles are dropped. The members are always read, the instance
+    # only tells that the club changed.
+    if profile_cache.cached_users():
+        cache_bus.apply_row(
+            ("profile club", key), None, lambda: _members(User.club_id, key), profile_cache.invalidate_many
+        )
+
+
+def _on_team_change(key: Hashable, team: Any | None) -> None:
+    if profile_cache.cached_users():
+        cache_bus.apply_row(
+            ("profile team", key), None, lambda: _members(User.team_id, key), profile_cache.invalidate_many
+        )
+
+
+cache_bus.subscribe("user", _on_user_change)
+cache_bus.subscribe("club", _on_club_change)
+cache_bus.subscribe("team", _on_team_change)
+
+
+if __name__ == "__main__":
+    import timeit
+    from types import SimpleNamespace
+
+    roles = [SimpleNamespace(name=f"role-{i}", is_default=lambda: False) for i in range(30)]
+    member = SimpleNamespace(id=1, mention="<@1>", roles=roles)
+    profile = {
+        "Name": "Jon Hansen",
+        "zwid": 1234567,
+        "ZR Profile": "[View Profile](https://www.zwiftracing.app/riders/1234567)",
+        "ZP Profile": "[View Profile](https://zwiftpower.com/profile.php?z=1234567)",
+        "Discord ID": 1,
+        "Discord Name": "jon",
+        "TOS": True,
+        "Active": True,
+        "Club": "Some Club",
+        "Is Club admin": False,
+        "Team": "Some Team",
+        "Is Team admin": False,
+        "Registered": "2024-01-01",
+        "Updated": "2024-06-01",
+    }
+
+    def before():
+        """Build the embed field by field, as ``/rider profile`` did on every request."""
+        embed = discord.Embed(title=PROFILE_TITLE, color=discord.Color.blue())
+        embed.add_field(name="Discord", value=member.mention, inline=True)
+        for k, v in profile.items():
+            embed.add_field(name=k, value=v, inline=True)
+        embed.add_field(name="Roles", value=str(list(role.name for role in member.roles)), inline=True)
+        return embed
+
+    cache = ProfileCache()
+    cache.put(0, member.id, render_profile(profile, member), cache.generation())
+
+    n = 20000
+    for name, func in (("build per request", before), ("cache hit", lambda: cache.get(0, member.id))):
+        seconds = min(timeit.repeat(func, number=n, repeat=3)) / n
+        print(f"{name:<18} {seconds * 1e6:6.1f} us per profile")
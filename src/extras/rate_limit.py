@@ -0,0 +1,37 @@
+"""Client side rate limiting for bulk Discord REST work."""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second with bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: int | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if available right now, without waiting."""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Wait until the tokens are available and take them. Waiters are served in order."""
+        async with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
@@ -0,0 +1,46 @@
+"""Retry transient REST failures, Discord's by default."""
+
+import asyncio
+import random
+from collections.abc import Awaitable, Callable
+
+import discord
+import logfire
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Server errors and timeouts are worth retrying, 4xx errors (Forbidden, NotFound, ...) are not."""
+    if isinstance(exc, discord.DiscordServerError | asyncio.TimeoutError):
+        return True
+    return isinstance(exc, discord.HTTPException) and exc.status >= 500
+
+
+async def retry[T](
+    factory: Callable[[], Awaitable[T]],
+    attempts: int = 3,
+    base_delay: float = 0.5,
+    what: str = "request",
+    transient: Callable[[BaseException], bool] = is_transient,
+) -> T:
+    """Await ``factory()``, retrying transient failures with exponential backoff and jitter.
+
+    Args:
+        factory: Creates a fresh awaitable for every attempt.
+        attempts: Maximum number of attempts.
+        base_delay: Delay before the first retry, doubled on each retry.
+        what: Description for the logs.
+        transient: Decides which exceptions are retried, Discord errors by default.
+
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await factory()
+        except Exception as e:
+            if attempt == attempts or not transient(e):
+                raise
+            delay = base_delay * 2 ** (attempt - 1) * (1 + random.random() / 2)
+            # Honour a server's Retry-After when the exception carries one.
+            delay = max(delay, getattr(e, "retry_after", None) or 0)
+            logfire.warn(f"{what} failed ({e}), retry {attempt}/{attempts - 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")
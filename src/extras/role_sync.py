@@ -0,0 +1,267 @@
+"""Reconcile Discord roles with the membership state in the database.
+
+The database (``User`` club/team membership, admin flags and approvals) is the source of truth.
+Both sides are loaded in bulk, the minimal diff is computed per member and applied with a single role edit per
+member, under a token bucket so a big guild does not trip Discord's rate limits.
+Progress of full runs is checkpointed by member id, so an interrupted run resumes where it stopped, and only counts
+as completed (from the time it first started) once it covered every member. Incremental runs look at every changed
+user, whatever the cursor. Members whose role edit failed are kept in the checkpoint and retried first by the next
+run, incremental or not.
+"""
+
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import discord
+import logfire
+from dotenv import load_dotenv
+
+from src.database.db_models import Club, Team, User
+from src.extras.rate_limit import TokenBucket
+from src.extras.roles_mgnt import BaseRole
+
+load_dotenv()
+
+# ADMIN is handed out by server admins, never by the bot.
+MANAGED_BASE_ROLES = (
+    BaseRole.REGISTERED,
+    BaseRole.CLUB_MEMBER,
+    BaseRole.CLUB_ADMIN,
+    BaseRole.TEAM_MEMBER,
+    BaseRole.TEAM_ADMIN,
+)
+CHECKPOINT_EVERY = 500
+
+
+@dataclass
+class RoleSyncReport:
+    """Outcome of a reconciliation run."""
+
+    guild_id: int
+    incremental: bool
+    dry_run: bool
+    scanned: int = 0
+    changed: int = 0
+    roles_added: int = 0
+    roles_removed: int = 0
+    failed: int = 0
+    retried: int = 0
+    resumed_from: int = 0
+    seconds: float = 0.0
+    failures: list[int] = field(default_factory=list)
+
+    def summary(self) -> str:
+        """One line summary for Discord and the logs."""
+        mode = "incremental" if self.incremental else "full"
+        prefix = "[dry run] " if self.dry_run else ""
+        return (
+            f"{prefix}Role sync ({mode}): scanned {self.scanned} members, changed {self.changed}, "
+            f"+{self.roles_added}/-{self.roles_removed} roles, {self.retried} retried, {self.failed} failed "
+            f"in {self.seconds:.1f}s"
+        )
+
+
+def desired_base_roles(
+    active: bool,
+    club_id: int | None,
+    club_approved: bool,
+    club_admin: bool,
+    team_id: int | None,
+    team_approved: bool,
+    team_admin: bool,
+) -> set[BaseRole]:
+    """Base roles a user should hold according to the database."""
+    roles = set()
+    if active:
+        roles.add(BaseRole.REGISTERED)
+    if club_id is not None and (club_approved or club_admin):
+        roles.add(BaseRole.CLUB_MEMBER)
+        if club_admin:
+            roles.add(BaseRole.CLUB_ADMIN)
+    if team_id is not None and (team_approved or team_admin):
+        roles.add(BaseRole.TEAM_MEMBER)
+        if team_admin:
+            roles.add(BaseRole.TEAM_ADMIN)
+    return roles
+
+
+class RoleReconciler:
+    """Compute and apply role diffs for a guild."""
+
+    def __init__(self, rate: float = 5.0, checkpoint_path: str = "role_sync_checkpoint.json"):
+        self.bucket = TokenBucket(rate=rate, capacity=max(1, int(rate * 2)))
+        self.checkpoint_path = checkpoint_path
+
+    @classmethod
+    def from_env(cls) -> "RoleReconciler":
+        """Create a reconciler configured from ROLE_SYNC_RATE (edits per second) and ROLE_SYNC_CHECKPOINT.
+
+        Cluster workers sync different guilds at the same time, each keeps its own checkpoint file.
+        """
+        checkpoint_path = os.getenv("ROLE_SYNC_CHECKPOINT", "role_sync_checkpoint.json")
+        if os.getenv("VWR_CLUSTER_SOCKET") is not None:
+            root, ext = os.path.splitext(checkpoint_path)
+            checkpoint_path = f"{root}.worker{os.getenv('VWR_WORKER_ID', '0')}{ext}"
+        return cls(rate=float(os.getenv("ROLE_SYNC_RATE", "5")), checkpoint_path=checkpoint_path)
+
+    def _load_checkpoints(self) -> dict:
+        if not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logfire.error(f"Failed to read role sync checkpoint: {e}")
+            return {}
+
+    def _save_checkpoint(self, guild_id: int, **values) -> None:
+        checkpoints = self._load_checkpoints()
+        checkpoints.setdefault(str(guild_id), {}).update(values)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoints, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    @staticmethod
+    def _desired_role_ids(
+        guild: discord.Guild, since: datetime | None, retry: set[int] = frozenset()
+    ) -> tuple[dict[int, set[int]], set[int]]:
+        """Load the database side in bulk: desired role ids per discord id, and every role id the bot manages.
+
+        Args:
+            guild: The guild whose roles are synced.
+            since: Only load users changed after this, None loads everyone.
+            retry: Discord ids loaded whatever ``since`` is, the members whose last edit failed.
+
+        """
+        base_ids = {}
+        for base_role in MANAGED_BASE_ROLES:
+            role = discord.utils.get(guild.roles, name=base_role.value)
+            if role is not None:
+                base_ids[base_role] = role.id
+            else:
+                logfire.warn(f"Role {base_role.value} does not exist in {guild.name}, it is not synced.")
+        club_roles = dict(
+            Club.select(Club.id, Club.discord_role_id).where(Club.discord_role_id.is_null(False)).tuples()
+        )
+        team_roles = dict(
+            Team.select(Team.id, Team.discord_role_id).where(Team.discord_role_id.is_null(False)).tuples()
+        )
+        managed = set(base_ids.values()) | set(club_roles.values()) | set(team_roles.values())
+
+        query = User.select(
+            User.discord_id,
+            User.active,
+            User.club_id,
+            User.club_approved,
+            User.club_admin,
+            User.team_id,
+            User.team_approved,
+            User.team_admin,
+        )
+        if since is not None:
+            changed = User.updated_at > since
+            query = query.where(changed | User.discord_id.in_(list(retry)) if retry else changed)
+        desired = {}
+        for discord_id, active, club_id, club_approved, club_admin, team_id, team_approved, team_admin in (
+            query.tuples().iterator()
+        ):
+            bases = desired_base_roles(active, club_id, club_approved, club_admin, team_id, team_approved, team_admin)
+            role_ids = {base_ids[b] for b in bases if b in base_ids}
+            if BaseRole.CLUB_MEMBER in bases and club_id in club_roles:
+                role_ids.add(club_roles[club_id])
+            if BaseRole.TEAM_MEMBER in bases and team_id in team_roles:
+                role_ids.add(team_roles[team_id])
+            desired[discord_id] = role_ids
+        return desired, managed
+
+    async def run(self, guild: discord.Guild, incremental: bool = False, dry_run: bool = False) -> RoleSyncReport:
+        """Reconcile the roles of every member of the guild, resuming from the last checkpoint.
+
+        Args:
+            guild: The guild to reconcile.
+            incremental: Only look at users whose row changed since the last completed run.
+            dry_run: Compute and report the diff without editing any roles.
+
+        """
+        report = RoleSyncReport(guild_id=guild.id, incremental=incremental, dry_run=dry_run)
+        started = time.perf_counter()
+        started_at = datetime.now()
+        with logfire.span("ROLE SYNC"):
+            checkpoint = self._load_checkpoints().get(str(guild.id), {})
+            last_completed = checkpoint.get("last_completed")
+            since = datetime.fromisoformat(last_completed) if incremental and last_completed else None
+            # The cursor belongs to an interrupted full run, an incremental run must not skip changed users below it.
+            cursor = 0 if dry_run or since is not None else checkpoint.get("cursor", 0)
+            # A resumed full run has covered every member since the segment that started from the first member.
+            run_started = (cursor and checkpoint.get("run_started")) or started_at.isoformat()
+            retry = set(checkpoint.get("retry", []))
+            report.resumed_from = cursor
+
+            if not guild.chunked:
+                await guild.chunk()
+            desired, managed = self._desired_role_ids(guild, since, retry)
+            if since is not None:
+                members = [m for m in (guild.get_member(d) for d in desired) if m is not None]
+            else:
+                members = guild.members
+            members = [m for m in members if not m.bot]
+            # Members whose edit failed last time go first, whatever the cursor.
+            retried = sorted((m for m in members if m.id in retry), key=lambda m: m.id)
+            members = retried + sorted((m for m in members if m.id > cursor and m.id not in retry), key=lambda m: m.id)
+            report.retried = len(retried)
+            logfire.info(
+                f"Role sync of {guild.name}: {len(members)} members to scan, {len(retried)} retried, "
+                f"resuming after {cursor}"
+            )
+
+            for member in members:
+                report.scanned += 1
+                current = {role.id for role in member.roles if not role.is_default()}
+                target = desired.get(member.id, set())
+                to_add = target - current
+                to_remove = (current & managed) - target
+                if to_add or to_remove:
+                    report.changed += 1
+                    report.roles_added += len(to_add)
+                    report.roles_removed += len(to_remove)
+                    if not dry_run:
+                        await self._apply(guild, member, to_add, to_remove, report)
+                if not dry_run and report.scanned % CHECKPOINT_EVERY == 0 and report.scanned > len(retried):
+                    progress = {} if since is not None else {"cursor": member.id, "run_started": run_started}
+                    self._save_checkpoint(guild.id, retry=sorted(retry | set(report.failures)), **progress)
+
+            if not dry_run:
+                # A completed full run starts over from the first member next time, only its failures are retried.
+                # An incremental run leaves the cursor of an interrupted full run alone.
+                progress = {} if since is not None else {"cursor": 0, "run_started": None}
+                self._save_checkpoint(guild.id, last_completed=run_started, retry=sorted(report.failures), **progress)
+            report.seconds = time.perf_counter() - started
+            logfire.info(report.summary())
+            return report
+
+    async def _apply(
+        self,
+        guild: discord.Guild,
+        member: discord.Member,
+        to_add: set[int],
+        to_remove: set[int],
+        report: RoleSyncReport,
+    ) -> None:
+        """Apply the diff in one request, to the roles the member holds once the rate limit lets the edit through."""
+        await self.bucket.acquire()
+        # Roles granted or removed while waiting (by an admin, join_club, ...) are kept.
+        current = {role.id for role in member.roles if not role.is_default()}
+        roles = [guild.get_role(role_id) for role_id in (current - to_remove) | to_add]
+        try:
+            await member.edit(roles=[r for r in roles if r is not None], reason="VWR role sync")
+        except discord.HTTPException as e:
+            report.failed += 1
+            report.failures.append(member.id)
+            logfire.error(f"Role sync failed for {member} ({member.id}): {e}")
+
+
+role_reconciler = RoleReconciler.from_env()
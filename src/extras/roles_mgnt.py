@@ -10,6 +10,11 @@ import discord.ext.commands
 import logfire
 from discord import Role
 
+from src.extras.log import get_logger, lazy
+
+# Role checks run on every command, only a sample of them is logged.
+log = get_logger("roles", sample_rate=0.1)
+
 
 class BaseRole(Enum):
     """Filter terms to search roles."""
@@ -64,20 +69,26 @@ async def check_user_roles(
         role_filter (BaseRole): The role name to search for.
 
     """
-    logfire.info(f"Checking server roles for {discord_id}, with {role_filter}")
-    try:
-        member = ctx.guild.get_member(discord_id)
-        logfire.info(f"discord_id: {member} has roles: {member.roles}")
-        filtered_roles = [role for role in member.roles if role.name == role_filter.value]
-        logfire.info(f"Filtered roles: {filtered_roles}")
-        if filtered_roles:
-            return True, f"{member} has a matching role.", filtered_roles
-        else:
-            return False, f"{member} does not have required server role.", filtered_roles
-
-    except Exception as exc:
-        logfire.error(f"An error occurred: {exc}")
-        return False, f"Failed to check server roles. {role_filter}", None
+    # One sampling decision for all records of the check.
+    with log.span("CHECK USER ROLES", discord_id=discord_id):
+        log.info(
+            "Checking server roles for {discord_id}, with {role_filter}",
+            discord_id=discord_id,
+            role_filter=role_filter,
+        )
+        try:
+            member = ctx.guild.get_member(discord_id)
+            log.debug("Member roles", discord_id=discord_id, roles=lazy(lambda: [role.name for role in member.roles]))
+            filtered_roles = [role for role in member.roles if role.name == role_filter.value]
+            log.info("Matched {count} roles", count=len(filtered_roles))
+            if filtered_roles:
+                return True, f"{member} has a matching role.", filtered_roles
+            else:
+                return False, f"{member} does not have required server role.", filtered_roles
+
+        except Exception as exc:
+            logfire.error(f"An error occurred: {exc}")
+            return False, f"Failed to check server roles. {role_filter}", None
 
 
 async def add_base_role(
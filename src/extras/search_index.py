@@ -0,0 +1,215 @@
+"""In-memory prefix and trigram search index.
+
+Used for autocomplete and search, so a keystroke never touches the database.
+Terms are kept in a sorted list for prefix lookups (bisect) and in a trigram posting map for fuzzy matches.
+Keys must be orderable, in practice they are database or Discord IDs.
+"""
+
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from collections.abc import Callable, Hashable, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+_SPLIT = re.compile(r"[\s_\-./]+")
+
+EXACT_SCORE = 4.0
+PREFIX_SCORE = 3.0
+WORD_PREFIX_SCORE = 2.0
+MIN_TRIGRAM_SIMILARITY = 0.5
+# Bound the work of very short queries on big indexes, we only ever return a page of results.
+PREFIX_SCAN_FACTOR = 4
+MAX_POSTING = 2000
+
+
+@dataclass(slots=True)
+class IndexEntry:
+    """An indexed item."""
+
+    key: Hashable
+    label: str
+    terms: tuple[str, ...]
+    data: Any = None
+
+
+@dataclass(slots=True)
+class SearchHit:
+    """A search result with its rank score."""
+
+    entry: IndexEntry
+    score: float
+
+
+def normalize(text: str) -> str:
+    """Casefold and collapse whitespace."""
+    return " ".join(str(text).casefold().split())
+
+
+def trigrams(term: str) -> set[str]:
+    """Padded trigrams of a term, so short terms and word starts still match."""
+    padded = f"  {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Prefix and trigram index over one or more text fields per key."""
+
+    def __init__(self):
+        self._entries: dict[Hashable, IndexEntry] = {}
+        self._prefix: list[tuple[str, Hashable]] = []
+        self._trigrams: dict[str, set[Hashable]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        """Number of indexed keys."""
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether a key is indexed."""
+        return key in self._entries
+
+    def get(self, key: Hashable) -> IndexEntry | None:
+        """Return the entry for a key."""
+        return self._entries.get(key)
+
+    def clear(self) -> None:
+        """Remove everything."""
+        self._entries.clear()
+        self._prefix.clear()
+        self._trigrams.clear()
+
+    def add(self, key: Hashable, label: str, texts: Iterable[str | int | None] = (), data: Any = None) -> None:
+        """Add or replace an item.
+
+        Args:
+            key: Unique key, e.g. the database id.
+            label: Text shown to the user, it is always indexed.
+            texts: Extra fields to index for the same key.
+            data: Anything the caller wants back with the hit.
+
+        """
+        self.remove(key)
+        terms = {normalize(label)}
+        terms.update(normalize(t) for t in texts if t is not None and str(t).strip())
+        terms.discard("")
+        entry = IndexEntry(key=key, label=label, terms=tuple(sorted(terms)), data=data)
+        self._entries[key] = entry
+        for token in self._tokens(entry.terms):
+            insort(self._prefix, (token, key))
+        for term in entry.terms:
+            for gram in trigrams(term):
+                self._trigrams[gram].add(key)
+
+    def load(self, items: Iterable[tuple[Hashable, str, Iterable[str | int | None], Any]]) -> None:
+        """Replace the contents with ``(key, label, texts, data)`` items, sorting the prefix list once."""
+        self.clear()
+        for key, label, texts, data in items:
+            terms = {normalize(label)}
+            terms.update(normalize(t) for t in texts if t is not None and str(t).strip())
+            terms.discard("")
+            entry = IndexEntry(key=key, label=label, terms=tuple(sorted(terms)), data=data)
+            self._entries[key] = entry
+            self._prefix.extend((token, key) for token in self._tokens(entry.terms))
+            for term in entry.terms:
+                for gram in trigrams(term):
+                    self._trigrams[gram].add(key)
+        self._prefix.sort()
+
+    def remove(self, key: Hashable) -> None:
+        """Remove an item, unknown keys are ignored."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for token in self._tokens(entry.terms):
+            i = bisect_left(self._prefix, (token, key))
+            if i < len(self._prefix) and self._prefix[i] == (token, key):
+                del self._prefix[i]
+        for term in entry.terms:
+            for gram in trigrams(term):
+                posting = self._trigrams.get(gram)
+                if posting is not None:
+                    posting.discard(key)
+                    if not posting:
+                        del self._trigrams[gram]
+
+    def resolve(self, value: str, where: Callable[[IndexEntry], bool] | None = None) -> IndexEntry | None:
+        """Resolve an autocomplete value (the key) or a typed name to an entry.
+
+        Args:
+            value: The submitted option value.
+            where: Optional filter, an entry it rejects is not resolved.
+
+        """
+        entry = self.get(int(value)) if value.isdigit() else None
+        if entry is None:
+            hits = self.search(value, limit=1, where=where)
+            entry = hits[0].entry if hits and hits[0].score == EXACT_SCORE else None
+        if entry is not None and where is not None and not where(entry):
+            return None
+        return entry
+
+    def search(
+        self, query: str, limit: int = 25, where: Callable[[IndexEntry], bool] | None = None
+    ) -> list[SearchHit]:
+        """Return the best matches for the query, best first.
+
+        Exact matches rank above prefix matches, then word prefix matches, then trigram similarity.
+
+        Args:
+            query: What the user typed so far.
+            limit: Maximum number of hits.
+            where: Optional filter on the entries.
+
+        """
+        q = normalize(query)
+        scores: dict[Hashable, float] = {}
+        scan_budget = limit * PREFIX_SCAN_FACTOR
+        i = bisect_left(self._prefix, (q,))
+        while i < len(self._prefix) and scan_budget > 0:
+            token, key = self._prefix[i]
+            if not token.startswith(q):
+                break
+            i += 1
+            entry = self._entries[key]
+            if where is not None and not where(entry):
+                continue
+            scan_budget -= 1
+            score = (EXACT_SCORE if token == q else PREFIX_SCORE) if token in entry.terms else WORD_PREFIX_SCORE
+            if score > scores.get(key, 0):
+                scores[key] = score
+
+        # Numbers (zwid, Discord IDs) only make sense as exact or prefix matches.
+        if len(scores) < limit and len(q) >= 3 and not q.isdigit():
+            self._trigram_candidates(q, scores, where)
+
+        best = heapq.nsmallest(limit, scores.items(), key=lambda kv: (-kv[1], self._entries[kv[0]].label.casefold()))
+        return [SearchHit(self._entries[key], score) for key, score in best]
+
+    def _trigram_candidates(
+        self, q: str, scores: dict[Hashable, float], where: Callable[[IndexEntry], bool] | None
+    ) -> None:
+        # Very common trigrams say little and cost a lot, so they are left out of the vote.
+        postings = [p for p in (self._trigrams.get(g) for g in trigrams(q)) if p and len(p) <= MAX_POSTING]
+        if not postings:
+            return
+        counts: dict[Hashable, int] = defaultdict(int)
+        for posting in postings:
+            for key in posting:
+                counts[key] += 1
+        for key, count in counts.items():
+            similarity = count / len(postings)
+            if similarity < MIN_TRIGRAM_SIMILARITY or key in scores:
+                continue
+            if where is not None and not where(self._entries[key]):
+                continue
+            scores[key] = similarity
+
+    @staticmethod
+    def _tokens(terms: Iterable[str]) -> set[str]:
+        """Full terms plus each word of them, for prefix and word prefix lookups."""
+        tokens = set()
+        for term in terms:
+            tokens.add(term)
+            tokens.update(t for t in _SPLIT.split(term) if t)
+        return tokens
@@ -0,0 +1,87 @@
+"""Coalesce identical concurrent lookups into one call.
+
+Before a race many captains look up the same riders within seconds. With a ``SingleFlight`` the first caller for a
+key runs the lookup and everyone asking for the same key while it is in flight awaits the same result (or
+exception). Nothing is cached: once the call finishes, the next caller runs it again.
+
+Blocking functions (peewee queries) are run with ``asyncio.to_thread``, coroutine functions are awaited directly.
+"""
+
+import asyncio
+import inspect
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass
+class SingleFlightStats:
+    """Counters for one SingleFlight."""
+
+    calls: int = 0
+    executed: int = 0
+    coalesced: int = 0
+    errors: int = 0
+
+    @property
+    def coalesced_ratio(self) -> float:
+        """Fraction of calls that shared another call's result."""
+        return self.coalesced / self.calls if self.calls else 0.0
+
+
+_flights: list["SingleFlight"] = []
+
+
+def flights() -> list["SingleFlight"]:
+    """Every SingleFlight, for the admin stats and the metrics endpoint."""
+    return list(_flights)
+
+
+class SingleFlight:
+    """Share one in-flight call per key."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = SingleFlightStats()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        _flights.append(self)
+
+    @property
+    def inflight(self) -> int:
+        """Number of calls running right now."""
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run ``func(*args, **kwargs)``, or join the call already running for ``key``.
+
+        Args:
+            key: Identifies the lookup, callers with equal keys share the result.
+            func: A blocking function or a coroutine function.
+            *args: Passed to ``func``.
+            **kwargs: Passed to ``func``.
+
+        Returns:
+            What ``func`` returned, exceptions are raised to every caller.
+
+        """
+        self.stats.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats.coalesced += 1
+        else:
+            task = asyncio.get_running_loop().create_task(self._run(key, func, args, kwargs))
+            self._inflight[key] = task
+        # Shielded: a caller being cancelled must not cancel the call for the others.
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        self.stats.executed += 1
+        try:
+            if inspect.iscoroutinefunction(func):
+                return await func(*args, **kwargs)
+            return await asyncio.to_thread(func, *args, **kwargs)
+        except Exception:
+            self.stats.errors += 1
+            raise
+        finally:
+            del self._inflight[key]
@@ -0,0 +1,60 @@
+"""Tests for the sampling of the logging facade."""
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+import logfire
+
+from src.extras import log as log_module
+from src.extras.roles_mgnt import BaseRole, check_user_roles
+
+
+def _capture(monkeypatch) -> list:
+    """Record every emitted record instead of sending it to logfire."""
+    emitted = []
+    monkeypatch.setattr(logfire, "log", lambda level, template, **kwargs: emitted.append((level, template)))
+    return emitted
+
+
+def test_records_outside_spans_are_sampled(monkeypatch):
+    """A record logged outside any span is sampled with its logger's rate."""
+    emitted = _capture(monkeypatch)
+    random.seed(1)
+    logger = log_module.Logger("test", sample_rate=0.25)
+    for i in range(4000):
+        logger.info("Looking up {discord_id}", discord_id=i)
+    assert 0.22 < len(emitted) / 4000 < 0.28
+
+
+def test_warnings_are_never_sampled(monkeypatch):
+    """Warnings and errors are emitted whatever the rate."""
+    emitted = _capture(monkeypatch)
+    logger = log_module.Logger("test", sample_rate=0.0)
+    logger.info("dropped")
+    logger.warn("kept")
+    logger.error("kept")
+    assert [level for level, _ in emitted] == ["warn", "error"]
+
+
+def test_about_ten_percent_of_role_checks_emit(monkeypatch):
+    """check_user_roles logs with the "roles" rate of 0.1, all records of one check together."""
+    emitted = _capture(monkeypatch)
+    random.seed(2)
+    member = SimpleNamespace(roles=[SimpleNamespace(name="REGISTERED")])
+    ctx = SimpleNamespace(guild=SimpleNamespace(get_member=lambda discord_id: member))
+
+    async def run(calls: int) -> int:
+        emitting = 0
+        for i in range(calls):
+            before = len(emitted)
+            found, _, _ = await check_user_roles(ctx, discord_id=i, role_filter=BaseRole.REGISTERED)
+            assert found
+            emitting += len(emitted) > before
+        return emitting
+
+    calls = 4000
+    emitting = asyncio.run(run(calls))
+    assert 0.08 < emitting / calls < 0.12
+    # Both info records of a sampled check are emitted.
+    assert len(emitted) == 2 * emitting
@@ -0,0 +1,134 @@
+"""Tests for the Zwift client against a local stub server."""
+
+import asyncio
+from collections import Counter
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.extras.zwift_client import ZwiftClient
+
+RIDER = {"riderId": 1, "name": "Jon", "race": {"current": {"rating": 1502.4, "mixed": {"category": "Sapphire"}}}}
+
+
+def _stub_app(hits: Counter) -> web.Application:
+    """ZwiftRacing stand-in: rider 1 exists, 2 does not, 3 fails once, 4 fails after the first answer, 5 is slow."""
+
+    async def rider(request: web.Request) -> web.Response:
+        zwid = int(request.match_info["zwid"])
+        hits[zwid] += 1
+        await asyncio.sleep(0.01)
+        if zwid == 2:
+            return web.json_response({"message": "not found"}, status=404)
+        if zwid == 3 and hits[zwid] == 1:
+            return web.Response(status=503, headers={"Retry-After": "0"})
+        if zwid == 4 and hits[zwid] > 1:
+            return web.Response(status=500)
+        if zwid == 5:
+            await asyncio.sleep(0.5)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.json_response({**RIDER, "riderId": zwid}, headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/public/riders/{zwid}", rider)
+    return app
+
+
+def _run(tmp_path, scenario, **client_kwargs) -> Counter:
+    """Run ``scenario(client)`` against the stub server, returns the requests it received per zwid."""
+    hits = Counter()
+
+    async def main():
+        async with TestServer(_stub_app(hits)) as server:
+            client = ZwiftClient(zwiftracing_url=str(server.make_url("")), cache_dir=str(tmp_path), **client_kwargs)
+            try:
+                await scenario(client)
+            finally:
+                await client.close()
+
+    asyncio.run(main())
+    return hits
+
+
+def test_profile_is_fetched_once_within_the_ttl(tmp_path):
+    """Repeated and concurrent lookups of one rider cost a single request."""
+
+    async def scenario(client):
+        first = await asyncio.gather(*(client.zwiftracing_rider(1) for _ in range(5)))
+        assert all(data["riderId"] == 1 for data in first)
+        assert (await client.zwiftracing_rider(1))["riderId"] == 1
+        assert client.stats.requests == 1
+
+    assert _run(tmp_path, scenario)[1] == 1
+
+
+def test_stale_profile_is_revalidated_with_its_etag(tmp_path):
+    """After the TTL an unchanged profile is answered with a 304 and served from the cache."""
+
+    async def scenario(client):
+        await client.zwiftracing_rider(1)
+        assert (await client.zwiftracing_rider(1))["riderId"] == 1
+        assert client.stats.not_modified == 1
+
+    assert _run(tmp_path, scenario, ttl=0)[1] == 2
+
+
+def test_not_found_and_transient_errors(tmp_path):
+    """A 404 is cached as None, a 503 is retried."""
+
+    async def scenario(client):
+        assert await client.zwiftracing_rider(2) is None
+        assert await client.zwiftracing_rider(2) is None
+        assert (await client.zwiftracing_rider(3))["riderId"] == 3
+
+    hits = _run(tmp_path, scenario)
+    assert hits[2] == 1
+    assert hits[3] == 2
+
+
+def test_stale_copy_is_served_while_the_site_fails(tmp_path):
+    """After the TTL a failing site answers with the cached copy instead of an error."""
+
+    async def scenario(client):
+        await client.zwiftracing_rider(4)
+        assert (await client.zwiftracing_rider(4))["riderId"] == 4
+        assert client.stats.stale == 1
+
+    assert _run(tmp_path, scenario, ttl=0, attempts=1)[4] == 2
+
+
+def test_memory_cache_is_bounded(tmp_path):
+    """Only the most recently used responses stay in memory, the rest are read back from disk."""
+
+    async def scenario(client):
+        await client.fetch_roster(range(10, 20))
+        assert len(client.cache) == 3
+        roster = await client.fetch_roster(range(10, 20))
+        assert all(roster[zwid]["riderId"] == zwid for zwid in range(10, 20))
+        assert client.stats.requests == 10
+
+    _run(tmp_path, scenario, cache_entries=3)
+
+
+def test_zwiftracing_summary(tmp_path):
+    """Category and rating for the profile embed, None when ZwiftRacing cannot be reached."""
+
+    async def scenario(client):
+        assert await client.zwiftracing_summary(1) == {"ZR Category": "Sapphire", "ZR Rating": 1502}
+        assert await client.zwiftracing_summary(2) == {}
+        # Too slow for the profile, the fetch carries on and fills the cache.
+        assert await client.zwiftracing_summary(5, timeout=0.1) is None
+        await asyncio.sleep(0.6)
+        assert await client.zwiftracing_summary(5, timeout=0.1) == {"ZR Category": "Sapphire", "ZR Rating": 1502}
+
+    _run(tmp_path, scenario)
+
+    async def unreachable():
+        client = ZwiftClient(zwiftracing_url="http://127.0.0.1:9", cache_dir=str(tmp_path / "down"), attempts=1)
+        try:
+            assert await client.zwiftracing_summary(1) is None
+        finally:
+            await client.close()
+
+    asyncio.run(unreachable())
@@ -68,3 +68,33 @@ class UserAlreadyOnTeam(Exception):
     """Exception raised when a user already a member of a team."""
 
     pass
+
+
+class ZwiftApiError(Exception):
+    """Exception raised when ZwiftPower or ZwiftRacing answers with an error."""
+
+    def __init__(self, url: str, status: int, retry_after: float | None = None):
+        """Remember the failed request, ``retry_after`` is the server's Retry-After in seconds."""
+        super().__init__(url, status, retry_after)
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+    def __str__(self):
+        """The status and the URL, for the logs."""
+        return f"HTTP {self.status} from {self.url}"
+
+
+class MatchNotFound(Exception):
+    """Exception raised when a Match id not found"""
+
+    pass
+
+
+class MatchConflict(Exception):
+    """Exception raised when a match changed after the captain loaded it."""
+
+    def __init__(self, match_id: int):
+        """Remember which match changed."""
+        super().__init__(f"Match {match_id} was changed by someone else")
+        self.match_id = match_id
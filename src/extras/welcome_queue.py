@@ -0,0 +1,201 @@
+"""Background queue for welcome DMs.
+
+New members used to be DMed inline from ``on_member_join``. A raid or a big announcement brings hundreds of joins a
+minute, the DMs hit the rate limit and members with closed DMs raise ``Forbidden`` on the event loop.
+Joins are now queued (bounded, deduplicated) and DMed by a background task at a fixed rate. Members that could not be
+DMed are mentioned in batches in the welcome channel instead.
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+import discord
+import logfire
+from dotenv import load_dotenv
+
+from src.extras.guild_cache import GuildCache
+from src.extras.rate_limit import TokenBucket
+
+load_dotenv()
+
+WELCOME_CHANNEL = "welcome-and-rules"
+WELCOME_MESSAGE = 'Welcome to the server! Please register using "register"'
+FALLBACK_MESSAGE = "Welcome! We could not DM you, please register using `/rider register`:"
+MESSAGE_CHARACTER_LIMIT = 2000
+# A member that leaves and joins again within this window is not welcomed twice.
+DEDUP_SECONDS = 3600
+
+
+@dataclass
+class WelcomeStats:
+    """Counters for the welcome queue."""
+
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    dropped: int = 0
+    duplicates: int = 0
+    fallback_mentions: int = 0
+    fallback_messages: int = 0
+
+
+class WelcomeQueue:
+    """DM new members from a bounded, rate limited queue, falling back to a mention in the welcome channel."""
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: int = 5,
+        max_queue: int = 1000,
+        fallback_interval: float = 30.0,
+    ):
+        self.fallback_interval = fallback_interval
+        self.stats = WelcomeStats()
+        self._bucket = TokenBucket(rate, burst)
+        self._queue: asyncio.Queue[tuple[int, int]] = asyncio.Queue(maxsize=max_queue)
+        self._pending: set[tuple[int, int]] = set()
+        self._welcomed: dict[tuple[int, int], float] = {}
+        self._fallback: dict[int, list[int]] = defaultdict(list)
+        self._tasks: list[asyncio.Task] = []
+        self._bot: discord.Client | None = None
+        self._channel_ids = GuildCache("welcome_channels")
+
+    @classmethod
+    def from_env(cls) -> "WelcomeQueue":
+        """Create a queue configured from environment variables."""
+        return cls(
+            rate=float(os.getenv("WELCOME_DM_RATE", "1")),
+            burst=int(os.getenv("WELCOME_DM_BURST", "5")),
+            max_queue=int(os.getenv("WELCOME_QUEUE_SIZE", "1000")),
+            fallback_interval=float(os.getenv("WELCOME_FALLBACK_SECONDS", "30")),
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of members waiting for their DM."""
+        return self._queue.qsize()
+
+    def start(self, bot: discord.Client) -> None:
+        """Start the background tasks, safe to call on every on_ready."""
+        self._bot = bot
+        if self._tasks and not any(task.done() for task in self._tasks):
+            return
+        for task in self._tasks:
+            task.cancel()
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._run(), name="welcome-dm"),
+            loop.create_task(self._run_fallback(), name="welcome-fallback"),
+        ]
+        logfire.info("Welcome queue started.")
+
+    def post(self, member: discord.Member) -> None:
+        """Queue a welcome for a member. Never blocks and never raises.
+
+        Args:
+            member: The member that joined.
+
+        """
+        key = (member.guild.id, member.id)
+        now = time.monotonic()
+        if key in self._pending or now - self._welcomed.get(key, -DEDUP_SECONDS) < DEDUP_SECONDS:
+            self.stats.duplicates += 1
+            return
+        try:
+            self._queue.put_nowait(key)
+        except asyncio.QueueFull:
+            # Still welcome them, just not by DM.
+            self.stats.dropped += 1
+            self._fallback[member.guild.id].append(member.id)
+            return
+        self._pending.add(key)
+        self.stats.queued += 1
+
+    async def _run(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._bucket.acquire()
+                await self._welcome(*key)
+            except Exception as e:
+                logfire.error(f"Welcome DM for {key} crashed: {e}", exc_info=True)
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
+
+    async def _welcome(self, guild_id: int, member_id: int) -> None:
+        guild = self._bot.get_guild(guild_id) if self._bot else None
+        member = guild.get_member(member_id) if guild else None
+        if member is None:
+            # Left again before it was their turn.
+            return
+        try:
+            await member.send(WELCOME_MESSAGE)
+            self.stats.sent += 1
+        except (discord.Forbidden, discord.HTTPException) as e:
+            self.stats.failed += 1
+            logfire.info(f"Could not DM {member}, will mention them in #{WELCOME_CHANNEL}: {e}")
+            self._fallback[guild_id].append(member_id)
+        self._remember((guild_id, member_id))
+
+    def _remember(self, key: tuple[int, int]) -> None:
+        now = time.monotonic()
+        self._welcomed[key] = now
+        if len(self._welcomed) > 10 * self._queue.maxsize:
+            self._welcomed = {k: t for k, t in self._welcomed.items() if now - t < DEDUP_SECONDS}
+
+    async def _run_fallback(self) -> None:
+        while True:
+            await asyncio.sleep(self.fallback_interval)
+            try:
+                await self.flush_fallback()
+            except Exception as e:
+                logfire.error(f"Welcome fallback flush crashed: {e}", exc_info=True)
+
+    async def flush_fallback(self) -> None:
+        """Mention every member that could not be DMed in their guild's welcome channel."""
+        pending, self._fallback = self._fallback, defaultdict(list)
+        for guild_id, member_ids in pending.items():
+            channel = self._get_channel(guild_id)
+            if channel is None:
+                continue
+            for content in self._pack(member_ids):
+                try:
+                    await self._bucket.acquire()
+                    await channel.send(content, allowed_mentions=discord.AllowedMentions(users=True))
+                    self.stats.fallback_messages += 1
+                except (discord.Forbidden, discord.HTTPException) as e:
+                    logfire.error(f"Failed to post welcome mentions in guild {guild_id}: {e}")
+            self.stats.fallback_mentions += len(member_ids)
+
+    def _get_channel(self, guild_id: int) -> discord.TextChannel | None:
+        guild = self._bot.get_guild(guild_id) if self._bot else None
+        if guild is None:
+            return None
+        channel_id = self._channel_ids.get(guild_id, WELCOME_CHANNEL)
+        channel = guild.get_channel(channel_id) if channel_id else None
+        if channel is None:
+            channel = discord.utils.get(guild.text_channels, name=WELCOME_CHANNEL)
+            if channel is not None:
+                self._channel_ids.set(guild_id, WELCOME_CHANNEL, channel.id)
+        return channel
+
+    @staticmethod
+    def _pack(member_ids: list[int]) -> list[str]:
+        """Fit the mentions into as few messages as possible."""
+        messages, current = [], FALLBACK_MESSAGE
+        for member_id in dict.fromkeys(member_ids):
+            mention = f" <@{member_id}>"
+            if len(current) + len(mention) > MESSAGE_CHARACTER_LIMIT:
+                messages.append(current)
+                current = FALLBACK_MESSAGE
+            current += mention
+        if current != FALLBACK_MESSAGE:
+            messages.append(current)
+        return messages
+
+
+welcome_queue = WelcomeQueue.from_env()
@@ -0,0 +1,270 @@
+"""Verify riders' Zwift IDs against the race results we store.
+
+A zwid counts as verified once it shows up in the results of a match (``MatchRecord.zwift_results`` or
+``MatchRecord.zp_view``) while its owner was on one of the match rosters, or in a match without roster data.
+Matches that are no longer in the database (archived or deleted) prove nothing either way.
+
+The job keeps a ``zwid -> match ids`` index. The first run streams every MatchRecord once. Later runs only read
+records added since the last run, and the index and cursor are saved to ZWID_INDEX_PATH in between.
+Verified users are updated in bulk. A zwid that raced in a match where its owner was not on the roster, while a
+rostered rider's own zwid is missing from the results, is reported as a conflict: someone raced on another
+account's zwid, or registered the wrong one. Every zwid of a new record is checked, verified ones included, and a
+conflict is reported once, by the run that reads the record.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import Any
+
+import logfire
+from dotenv import load_dotenv
+
+from src.database.db_models import Match, MatchRecord, User, db
+from src.extras import cache_bus
+
+load_dotenv()
+
+CHECKPOINT_EVERY = 1000
+UPDATE_BATCH = 500
+
+
+@dataclass
+class ZwidConflict:
+    """A zwid that raced in place of the rostered riders."""
+
+    zwid: int
+    owner_discord_id: int
+    match_id: int
+    unmatched_discord_ids: list[int]
+
+
+@dataclass
+class VerificationReport:
+    """Outcome of a verification run."""
+
+    full: bool
+    records: int = 0
+    zwids_indexed: int = 0
+    checked: int = 0
+    verified: list[int] = field(default_factory=list)  # discord ids
+    conflicts: list[ZwidConflict] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        """One line summary for Discord and the logs."""
+        mode = "full" if self.full else "incremental"
+        return (
+            f"Zwid verification ({mode}): read {self.records} match records, {self.zwids_indexed} zwids indexed, "
+            f"checked {self.checked} riders, verified {len(self.verified)}, {len(self.conflicts)} conflicts "
+            f"in {self.seconds:.1f}s"
+        )
+
+
+def _as_zwid(value: Any) -> int | None:
+    try:
+        zwid = int(value)
+    except (TypeError, ValueError):
+        return None
+    return zwid if zwid > 0 else None
+
+
+def extract_zwids(zwift_results: Any, zp_view: Any) -> set[int]:
+    """Zwift IDs in a record's payloads.
+
+    ``zwift_results`` is Zwift's event results (a list, or ``{"entries": [...]}``) with ``profileId`` per entry.
+    ``zp_view`` is ZwiftPower's results view (``{"data": [...]}``) with ``zwid`` per row.
+    """
+    zwids = set()
+    entries = zwift_results.get("entries", []) if isinstance(zwift_results, dict) else zwift_results or []
+    for entry in entries:
+        if isinstance(entry, dict):
+            zwid = _as_zwid(entry.get("profileId") or entry.get("profileData", {}).get("id"))
+            if zwid:
+                zwids.add(zwid)
+    rows = zp_view.get("data", []) if isinstance(zp_view, dict) else zp_view or []
+    for row in rows:
+        if isinstance(row, dict):
+            zwid = _as_zwid(row.get("zwid"))
+            if zwid:
+                zwids.add(zwid)
+    return zwids
+
+
+def roster_discord_ids(roster: Any) -> set[int]:
+    """Discord ids in a match roster, a list of ids or of ``{"discord_id": ...}`` dicts."""
+    ids = set()
+    for entry in roster or []:
+        value = entry.get("discord_id") if isinstance(entry, dict) else entry
+        discord_id = _as_zwid(value)
+        if discord_id:
+            ids.add(discord_id)
+    return ids
+
+
+class ZwidIndex:
+    """``zwid -> match ids`` with the id of the last MatchRecord read."""
+
+    def __init__(self, cursor: int = 0, matches: dict[int, set[int]] | None = None):
+        self.cursor = cursor
+        self.matches: dict[int, set[int]] = defaultdict(set, matches or {})
+
+    def __len__(self) -> int:
+        """Number of indexed zwids."""
+        return len(self.matches)
+
+    def add_record(self, record_id: int, match_id: int, zwids: Iterable[int]) -> None:
+        """Index the zwids of one record."""
+        for zwid in zwids:
+            self.matches[zwid].add(match_id)
+        self.cursor = max(self.cursor, record_id)
+
+    def save(self, path: str) -> None:
+        """Write the index atomically."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"cursor": self.cursor, "matches": {str(z): sorted(m) for z, m in self.matches.items()}}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ZwidIndex":
+        """Read a saved index, an empty one if there is none."""
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            return cls(state["cursor"], {int(z): set(m) for z, m in state["matches"].items()})
+        except (OSError, ValueError, KeyError) as e:
+            logfire.error(f"Failed to read the zwid index {path}, rebuilding it: {e}")
+            return cls()
+
+
+def _stream_records(cursor: int) -> Iterator[tuple[int, int, Any, Any]]:
+    return (
+        MatchRecord.select(MatchRecord.id, MatchRecord.match_id, MatchRecord.zwift_results, MatchRecord.zp_view)
+        .where(MatchRecord.id > cursor)
+        .order_by(MatchRecord.id)
+        .tuples()
+        .iterator()
+    )
+
+
+class ZwidVerifier:
+    """Build the zwid index and mark users verified."""
+
+    def __init__(self, index_path: str = "zwid_index.json"):
+        self.index_path = index_path
+
+    @classmethod
+    def from_env(cls) -> "ZwidVerifier":
+        """Create a verifier configured from ZWID_INDEX_PATH."""
+        return cls(index_path=os.getenv("ZWID_INDEX_PATH", "zwid_index.json"))
+
+    def run(self, full: bool = False) -> VerificationReport:
+        """Index new match records and verify the riders that appear in them. Blocking, run it in a thread.
+
+        Args:
+            full: Rebuild the index from the first record instead of continuing from the saved cursor.
+
+        """
+        report = VerificationReport(full=full)
+        started = time.perf_counter()
+        with logfire.span("ZWID VERIFICATION"):
+            index = ZwidIndex.load(self.index_path)
+            # Conflicts are only reported for records the previous runs have not read, a full rebuild included.
+            last_cursor = index.cursor
+            if full:
+                index = ZwidIndex()
+            new_matches = set()
+            for record_id, match_id, zwift_results, zp_view in _stream_records(index.cursor):
+                index.add_record(record_id, match_id, extract_zwids(zwift_results, zp_view))
+                if record_id > last_cursor:
+                    new_matches.add(match_id)
+                report.records += 1
+                if report.records % CHECKPOINT_EVERY == 0:
+                    index.save(self.index_path)
+            index.save(self.index_path)
+            report.zwids_indexed = len(index)
+
+            self._verify(index, report, new_matches)
+            report.seconds = time.perf_counter() - started
+            logfire.info(report.summary())
+            return report
+
+    def _verify(self, index: ZwidIndex, report: VerificationReport, new_matches: set[int]) -> None:
+        candidates = {
+            zwid: (user_id, discord_id)
+            for user_id, discord_id, zwid in User.select(User.id, User.discord_id, User.zwid)
+            .where(~User.zwid_verified)
+            .tuples()
+            .iterator()
+            if zwid in index.matches
+        }
+        report.checked = len(candidates)
+        match_ids = set(new_matches).union(*(index.matches[zwid] for zwid in candidates))
+        if not match_ids:
+            return
+
+        rosters = {}
+        for match_id, roster_1, roster_2 in (
+            Match.select(Match.id, Match.team_1_roster, Match.team_2_roster)
+            .where(Match.id.in_(list(match_ids)))
+            .tuples()
+            .iterator()
+        ):
+            rosters[match_id] = roster_discord_ids(roster_1) | roster_discord_ids(roster_2)
+        zwid_by_discord = dict(User.select(User.discord_id, User.zwid).tuples()) if rosters else {}
+        zwids_by_match: dict[int, set[int]] = defaultdict(set)
+        for zwid, matches in index.matches.items():
+            for match_id in matches & rosters.keys():
+                zwids_by_match[match_id].add(zwid)
+
+        verified_ids = []
+        for zwid, (user_id, discord_id) in candidates.items():
+            # Matches no longer in the database are skipped, without a roster they prove nothing.
+            roster_hits = [rosters[match_id] for match_id in index.matches[zwid] if match_id in rosters]
+            if any(not roster or discord_id in roster for roster in roster_hits):
+                verified_ids.append(user_id)
+                report.verified.append(discord_id)
+
+        # Every zwid in the new records is checked, verified ones too: anyone can race on a verified zwid.
+        discord_by_zwid = {zwid: discord_id for discord_id, zwid in zwid_by_discord.items()}
+        for match_id in sorted(new_matches & rosters.keys()):
+            roster = rosters[match_id]
+            raced = zwids_by_match[match_id]
+            unmatched = sorted(d for d in roster if zwid_by_discord.get(d) not in raced)
+            if not unmatched:
+                continue
+            for zwid in sorted(raced):
+                owner = discord_by_zwid.get(zwid)
+                if owner is not None and owner not in roster:
+                    report.conflicts.append(ZwidConflict(zwid, owner, match_id, unmatched))
+
+        with db.atomic():
+            for start in range(0, len(verified_ids), UPDATE_BATCH):
+                batch = verified_ids[start : start + UPDATE_BATCH]
+                User.update(zwid_verified=True).where(User.id.in_(batch)).execute()
+
+    @staticmethod
+    def _load_users(discord_ids: list[int]) -> list[User]:
+        users = []
+        for start in range(0, len(discord_ids), UPDATE_BATCH):
+            users.extend(User.select().where(User.discord_id.in_(discord_ids[start : start + UPDATE_BATCH])))
+        return users
+
+    async def run_async(self, full: bool = False) -> VerificationReport:
+        """``run`` in a worker thread, then tell the caches about the verified users."""
+        report = await asyncio.to_thread(self.run, full)
+        # Bulk updates bypass User.save, so publish here, on the loop. The rows are read in a worker thread, the
+        # subscribers would otherwise each query the database on the loop.
+        for user in await asyncio.to_thread(self._load_users, report.verified):
+            cache_bus.publish("user", user.discord_id, user)
+        return report
+
+
+zwid_verifier = ZwidVerifier.from_env()
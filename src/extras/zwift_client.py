@@ -0,0 +1,290 @@
+"""Client for ZwiftPower and ZwiftRacing rider data.
+
+One pooled aiohttp session, a cap on concurrent requests, retries with backoff for 429/5xx and timeouts, and an
+on-disk response cache, whose most recently used entries are also kept in memory. Within the TTL a profile is served
+from the cache without a request. After the TTL the request is revalidated with its ETag/Last-Modified, so an
+unchanged profile costs a 304. When the site keeps failing, an outdated cached copy is served instead of an error.
+Concurrent requests for the same URL share one fetch.
+
+The base URLs come from ZWIFTPOWER_BASE_URL and ZWIFTRACING_BASE_URL, so tests can point them at a local stub server.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+
+import aiohttp
+import logfire
+from dotenv import load_dotenv
+
+from src.extras.retry import retry
+from src.extras.singleflight import SingleFlight
+from src.extras.vwr_exceptions import ZwiftApiError
+
+load_dotenv()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 60.0
+
+
+@dataclass
+class CachedResponse:
+    """A cached response body and its validators."""
+
+    url: str
+    fetched_at: float
+    body: Any
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+@dataclass
+class ZwiftClientStats:
+    """Counters for the Zwift client."""
+
+    requests: int = 0
+    cache_hits: int = 0
+    not_modified: int = 0
+    not_found: int = 0
+    errors: int = 0
+    stale: int = 0
+
+
+class ResponseCache:
+    """JSON responses on disk, one file per URL, with an in-memory copy of the ``max_entries`` most recently used."""
+
+    def __init__(self, path: str, max_entries: int = 2000):
+        self.path = path
+        self.max_entries = max_entries
+        self._memory: OrderedDict[str, CachedResponse] = OrderedDict()
+
+    def __len__(self) -> int:
+        """Number of responses held in memory."""
+        return len(self._memory)
+
+    def _remember(self, entry: CachedResponse) -> None:
+        self._memory[entry.url] = entry
+        self._memory.move_to_end(entry.url)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _file(self, url: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def get(self, url: str) -> CachedResponse | None:
+        """The cached response, fresh or not."""
+        if url in self._memory:
+            self._memory.move_to_end(url)
+            return self._memory[url]
+        try:
+            with open(self._file(url), encoding="utf-8") as f:
+                entry = CachedResponse(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logfire.warn(f"Ignoring unreadable cache entry for {url}: {e}")
+            return None
+        self._remember(entry)
+        return entry
+
+    def put(self, entry: CachedResponse) -> None:
+        """Store a response, the file is replaced atomically."""
+        self._remember(entry)
+        path = self._file(entry.url)
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(entry.__dict__, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logfire.error(f"Failed to cache {entry.url}: {e}")
+
+
+def _transient(exc: BaseException) -> bool:
+    if isinstance(exc, ZwiftApiError):
+        return exc.status in RETRY_STATUSES
+    return isinstance(exc, aiohttp.ClientConnectionError | aiohttp.ServerTimeoutError | TimeoutError)
+
+
+class ZwiftClient:
+    """Fetch rider data from ZwiftPower and ZwiftRacing."""
+
+    def __init__(
+        self,
+        zwiftpower_url: str = "https://zwiftpower.com",
+        zwiftracing_url: str = "https://zwift-ranking.herokuapp.com",
+        cache_dir: str = ".zwift_cache",
+        cache_entries: int = 2000,
+        ttl: float = 6 * 3600,
+        concurrency: int = 4,
+        timeout: float = 15.0,
+        attempts: int = 3,
+    ):
+        self.zwiftpower_url = zwiftpower_url.rstrip("/")
+        self.zwiftracing_url = zwiftracing_url.rstrip("/")
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.attempts = attempts
+        self.stats = ZwiftClientStats()
+        self.cache = ResponseCache(cache_dir, cache_entries)
+        self._flight = SingleFlight("zwift_fetch")
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: aiohttp.ClientSession | None = None
+
+    @classmethod
+    def from_env(cls) -> "ZwiftClient":
+        """Create a client configured from environment variables."""
+        return cls(
+            zwiftpower_url=os.getenv("ZWIFTPOWER_BASE_URL", "https://zwiftpower.com"),
+            zwiftracing_url=os.getenv("ZWIFTRACING_BASE_URL", "https://zwift-ranking.herokuapp.com"),
+            cache_dir=os.getenv("ZWIFT_CACHE_DIR", ".zwift_cache"),
+            cache_entries=int(os.getenv("ZWIFT_CACHE_ENTRIES", "2000")),
+            ttl=float(os.getenv("ZWIFT_CACHE_TTL", str(6 * 3600))),
+            concurrency=int(os.getenv("ZWIFT_HTTP_CONCURRENCY", "4")),
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Accept": "application/json", "User-Agent": "VWR-Discord-Bot"},
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the connection pool."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_json(self, url: str) -> Any | None:
+        """GET a JSON document through the cache. Returns None for 404.
+
+        Raises:
+            ZwiftApiError: The server kept failing or answered with another error status, and nothing was cached.
+
+        """
+        entry = self.cache.get(url)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl:
+            self.stats.cache_hits += 1
+            return entry.body
+        return await self._flight.do(url, self._fetch, url)
+
+    async def _fetch(self, url: str) -> Any | None:
+        # Another caller may have refreshed the entry while we waited for the flight.
+        entry = self.cache.get(url)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl:
+            self.stats.cache_hits += 1
+            return entry.body
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        try:
+            return await retry(
+                lambda: self._request(url, headers, entry), self.attempts, what=f"GET {url}", transient=_transient
+            )
+        except Exception as e:
+            self.stats.errors += 1
+            if entry is None:
+                raise
+            # Rider data changes slowly, an outdated answer beats none while the site is down.
+            self.stats.stale += 1
+            logfire.warn(f"Serving a stale copy of {url}: {e}")
+            return entry.body
+
+    async def _request(self, url: str, headers: dict[str, str], entry: CachedResponse | None) -> Any | None:
+        async with self._semaphore:
+            self.stats.requests += 1
+            async with self._get_session().get(url, headers=headers) as response:
+                if response.status == 304 and entry is not None:
+                    self.stats.not_modified += 1
+                    entry.fetched_at = time.time()
+                    self.cache.put(entry)
+                    return entry.body
+                if response.status == 404:
+                    # Cached as well, unknown riders are looked up as often as known ones.
+                    self.stats.not_found += 1
+                    self.cache.put(CachedResponse(url=url, fetched_at=time.time(), body=None))
+                    return None
+                if response.status != 200:
+                    retry_after = response.headers.get("Retry-After")
+                    wait = min(float(retry_after), MAX_RETRY_AFTER) if retry_after and retry_after.isdigit() else None
+                    raise ZwiftApiError(url, response.status, wait)
+                body = await response.json(content_type=None)
+                self.cache.put(
+                    CachedResponse(
+                        url=url,
+                        fetched_at=time.time(),
+                        body=body,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+                )
+                return body
+
+    async def zwiftpower_profile(self, zwid: int) -> dict | None:
+        """ZwiftPower profile and race history of a rider."""
+        return await self.get_json(f"{self.zwiftpower_url}/cache3/profile/{int(zwid)}_all.json")
+
+    async def zwiftracing_rider(self, zwid: int) -> dict | None:
+        """ZwiftRacing rider data: category, rating and recent races."""
+        return await self.get_json(f"{self.zwiftracing_url}/public/riders/{int(zwid)}")
+
+    async def zwiftracing_summary(self, zwid: int, timeout: float | None = None) -> dict[str, Any] | None:
+        """Category and rating of a rider for the profile embed.
+
+        Args:
+            zwid: Zwift ID of the rider.
+            timeout: Seconds to wait for the answer. A fetch that takes longer keeps running and fills the cache.
+
+        Returns:
+            The fields to show, empty for riders ZwiftRacing does not know, None when it could not be reached in time.
+
+        """
+        try:
+            data = await asyncio.wait_for(self.zwiftracing_rider(zwid), timeout)
+        except (ZwiftApiError, aiohttp.ClientError, TimeoutError) as e:
+            logfire.warn(f"Failed to fetch zwiftracing data for {zwid}: {e}")
+            return None
+        current = (data or {}).get("race", {}).get("current", {})
+        summary = {}
+        if current.get("mixed", {}).get("category"):
+            summary["ZR Category"] = current["mixed"]["category"]
+        if current.get("rating") is not None:
+            summary["ZR Rating"] = round(current["rating"])
+        return summary
+
+    async def fetch_roster(self, zwids: Iterable[int], source: str = "zwiftracing") -> dict[int, dict | None]:
+        """Fetch a whole roster, at most ``concurrency`` requests at a time.
+
+        Args:
+            zwids: Zwift IDs of the riders.
+            source: ``zwiftracing`` or ``zwiftpower``.
+
+        Returns:
+            ``zwid -> data``, None for riders that were not found or could not be fetched.
+
+        """
+        fetch = self.zwiftpower_profile if source == "zwiftpower" else self.zwiftracing_rider
+        zwids = list(dict.fromkeys(int(zwid) for zwid in zwids))
+        results = await asyncio.gather(*(fetch(zwid) for zwid in zwids), return_exceptions=True)
+        roster = {}
+        for zwid, result in zip(zwids, results, strict=True):
+            if isinstance(result, Exception):
+                logfire.warn(f"Failed to fetch {source} data for {zwid}: {result}")
+                result = None
+            roster[zwid] = result
+        return roster
+
+
+zwift_client = ZwiftClient.from_env()
@@ -0,0 +1,136 @@
+"""Match embed and the persistent Accept button.
+
+The button carries the match id and the version the captain was shown in its custom_id. Accepting writes against
+that version, so a match that changed after the message was posted is shown again instead of being accepted blindly.
+Clicks are routed by ``handle_match_accept`` from an ``on_interaction`` listener.
+"""
+
+import asyncio
+
+import discord
+import logfire
+
+from src.bot.middleware import interaction_callback
+from src.database.db_models import Match, Team
+from src.extras.activity_log import activity_log
+from src.extras.vwr_exceptions import MatchConflict, MatchNotFound
+from src.match.setup_match import accept_match, captain_team, get_match, start_timestamp, team_side
+
+MATCH_PREFIX = "vwr:match"
+
+
+def match_custom_id(action: str, match_id: int, version: int) -> str:
+    """Build the custom_id of a match button."""
+    return f"{MATCH_PREFIX}:{action}:{match_id}:{version}"
+
+
+def parse_match_custom_id(custom_id: str) -> tuple[str, int, int] | None:
+    """Return ``(action, match_id, version)`` or None if this is not a match button."""
+    if not custom_id.startswith(f"{MATCH_PREFIX}:"):
+        return None
+    try:
+        action, match_id, version = custom_id.removeprefix(f"{MATCH_PREFIX}:").split(":")
+        return action, int(match_id), int(version)
+    except ValueError:
+        logfire.warn(f"Malformed match custom_id: {custom_id}")
+        return None
+
+
+def _roster(roster: list | None) -> str:
+    return " ".join(f"<@{discord_id}>" for discord_id in roster or []) or "Not set"
+
+
+def match_embed(match: Match, team_1: Team | None, team_2: Team | None) -> discord.Embed:
+    """Show a match with both rosters and who accepted it."""
+    names = [team.name if team else "?" for team in (team_1, team_2)]
+    embed = discord.Embed(title=f"Match #{match.id}: {names[0]} vs {names[1]}", color=discord.Color.blue())
+    if match.start_datetime:
+        start = start_timestamp(match.start_datetime)
+        embed.add_field(name="Start", value=f"<t:{start}:F> (<t:{start}:R>)", inline=False)
+    if match.course_name:
+        laps = f", {match.laps} laps" if match.laps else ""
+        embed.add_field(name="Course", value=f"{match.course_name}{laps}", inline=False)
+    for name, roster, accepted in (
+        (names[0], match.team_1_roster, match.team_1_accepted),
+        (names[1], match.team_2_roster, match.team_2_accepted),
+    ):
+        embed.add_field(name=f"{name} {'✅' if accepted else '⏳'}", value=_roster(roster), inline=True)
+    if match.race_link:
+        embed.add_field(name="Race link", value=match.race_link, inline=False)
+    embed.set_footer(text=f"Version {match.version}")
+    return embed
+
+
+async def match_message(match: Match) -> tuple[discord.Embed, "MatchView | None"]:
+    """Embed for a match, and an Accept button while a team has not accepted it yet. Archived matches get no button."""
+    team_1, team_2 = await asyncio.gather(Team.lookup_async(match.team_id_1_id), Team.lookup_async(match.team_id_2_id))
+    accepted = match.team_1_accepted and match.team_2_accepted
+    view = None if match.archived or accepted else MatchView(match.id, match.version)
+    return match_embed(match, team_1, team_2), view
+
+
+class MatchView(discord.ui.View):
+    """Accept button for a match, posted for the team captains."""
+
+    def __init__(self, match_id: int, version: int):
+        super().__init__(timeout=None)
+        self.add_item(
+            discord.ui.Button(
+                label="Accept",
+                style=discord.ButtonStyle.success,
+                custom_id=match_custom_id("accept", match_id, version),
+            )
+        )
+
+
+async def handle_match_accept(interaction: discord.Interaction) -> bool:
+    """Handle a click on a match Accept button. Returns False if the interaction is not ours."""
+    if interaction.type != discord.InteractionType.component or not interaction.data:
+        return False
+    parsed = parse_match_custom_id(interaction.data.get("custom_id", ""))
+    if parsed is None or parsed[0] != "accept":
+        return False
+    _, match_id, version = parsed
+    await _accept_clicked(interaction, match_id, version)
+    return True
+
+
+@interaction_callback("match_accept")
+async def _accept_clicked(interaction: discord.Interaction, match_id: int, version: int) -> None:
+    with logfire.span("MATCH ACCEPT"):
+        try:
+            team_id = await asyncio.to_thread(captain_team, interaction.user.id)
+            match = await asyncio.to_thread(get_match, match_id)
+            side = team_side(match, team_id) if team_id else None
+            if side is None:
+                await interaction.respond("❌ Only a team captain of this match can accept it.", ephemeral=True)
+                return
+            if getattr(match, f"team_{side}_accepted"):
+                await interaction.respond("Your team has already accepted this match.", ephemeral=True)
+                return
+            await accept_match(match_id, side, team_id, version)
+        except MatchNotFound:
+            await interaction.response.edit_message(content="This match no longer exists.", embed=None, view=None)
+            return
+        except MatchConflict:
+            # Someone changed the match after this message was posted, show what is current now.
+            match = await asyncio.to_thread(get_match, match_id)
+            embed, view = await match_message(match)
+            await interaction.response.edit_message(embed=embed, view=view)
+            if view is not None:
+                view.stop()
+            await interaction.followup.send(
+                "⚠️ The match changed since this message was posted. Check it and accept again.", ephemeral=True
+            )
+            return
+        except Exception as e:
+            logfire.error(f"Failed to accept match {match_id}: {e}", exc_info=True)
+            await interaction.respond("❌ Failed to accept the match.", ephemeral=True)
+            return
+
+        embed, view = await match_message(await asyncio.to_thread(get_match, match_id))
+        await interaction.response.edit_message(embed=embed, view=view)
+        # Clicks are routed by handle_match_accept from the custom_id, the view is not kept in the view store.
+        if view is not None:
+            view.stop()
+        activity_log.post(interaction.guild, f"{interaction.user} accepted match #{match_id}")
@@ -1 +1,99 @@
+"""Persistent views for club and team join requests.
 
+The request is carried in the button custom_id, so the buttons keep working after a restart or deploy without the
+view being re-created. Clicks are routed by ``handle_join_decision`` from an ``on_interaction`` listener, so a posted
+view is stopped right away instead of being kept in the client's view store.
+"""
+
+import discord
+import logfire
+
+from src.bot.middleware import interaction_callback
+from src.database.db_models import User
+from src.extras.activity_log import activity_log
+from src.extras.roles_mgnt import BaseRole, add_base_role
+from src.extras.vwr_exceptions import NoClubMembership, NotAClubAdmin, UserNotRegistered
+
+JOIN_PREFIX = "vwr:join"
+
+
+def join_custom_id(action: str, discord_id: int, club_id: int, team_id: int | None) -> str:
+    """Build the custom_id of a join request button, at most 100 characters."""
+    return f"{JOIN_PREFIX}:{action}:{discord_id}:{club_id}:{team_id or 0}"
+
+
+def parse_join_custom_id(custom_id: str) -> tuple[str, int, int, int | None] | None:
+    """Return ``(action, discord_id, club_id, team_id)`` or None if this is not a join request button."""
+    if not custom_id.startswith(f"{JOIN_PREFIX}:"):
+        return None
+    try:
+        action, discord_id, club_id, team_id = custom_id.removeprefix(f"{JOIN_PREFIX}:").split(":")
+        return action, int(discord_id), int(club_id), int(team_id) or None
+    except ValueError:
+        logfire.warn(f"Malformed join request custom_id: {custom_id}")
+        return None
+
+
+class JoinRequestView(discord.ui.View):
+    """Approve and Decline buttons for a join request, posted for the club admins."""
+
+    def __init__(self, discord_id: int, club_id: int, team_id: int | None):
+        super().__init__(timeout=None)
+        self.add_item(
+            discord.ui.Button(
+                label="Approve",
+                style=discord.ButtonStyle.success,
+                custom_id=join_custom_id("approve", discord_id, club_id, team_id),
+            )
+        )
+        self.add_item(
+            discord.ui.Button(
+                label="Decline",
+                style=discord.ButtonStyle.danger,
+                custom_id=join_custom_id("decline", discord_id, club_id, team_id),
+            )
+        )
+
+
+async def handle_join_decision(interaction: discord.Interaction) -> bool:
+    """Handle a click on a join request button. Returns False if the interaction is not ours."""
+    if interaction.type != discord.InteractionType.component or not interaction.data:
+        return False
+    parsed = parse_join_custom_id(interaction.data.get("custom_id", ""))
+    if parsed is None:
+        return False
+    await _review_join_request(interaction, *parsed)
+    return True
+
+
+@interaction_callback("join_request_decision")
+async def _review_join_request(
+    interaction: discord.Interaction, action: str, discord_id: int, club_id: int, team_id: int | None
+) -> None:
+    approve = action == "approve"
+    with logfire.span("JOIN REQUEST DECISION"):
+        try:
+            approver = User.get_or_none(User.discord_id == interaction.user.id)
+            if approver is None:
+                raise UserNotRegistered("Discord user needs to register")
+            user = approver.review_join_request(discord_id, club_id=club_id, team_id=team_id, approve=approve)
+        except (NotAClubAdmin, UserNotRegistered):
+            await interaction.respond("❌ Only an admin of this club can review its join requests.", ephemeral=True)
+            return
+        except NoClubMembership:
+            await interaction.response.edit_message(content="This join request is no longer pending.", view=None)
+            return
+        except Exception as e:
+            logfire.error(f"Failed to {action} the join request of {discord_id}: {e}", exc_info=True)
+            await interaction.respond("❌ Failed to review the join request.", ephemeral=True)
+            return
+
+        verdict = "approved" if approve else "declined"
+        await interaction.response.edit_message(
+            content=f"<@{discord_id}>'s join request was {verdict} by {interaction.user.mention}.", view=None
+        )
+        if approve:
+            await add_base_role(interaction, discord_id, BaseRole.CLUB_MEMBER)
+            if user.team_approved:
+                await add_base_role(interaction, discord_id, BaseRole.TEAM_MEMBER)
+        activity_log.post(interaction.guild, f"{interaction.user} {verdict} the join request of {user.name}")
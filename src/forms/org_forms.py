@@ -1,12 +1,49 @@
-import re
+"""Forms to create clubs and teams."""
+
+import asyncio
+from collections.abc import Awaitable, Callable
 
 import discord
 import logfire
+from peewee import IntegrityError
+
+from src.bot.middleware import interaction_callback
+from src.database.db_models import Club, Team, User
+from src.extras.activity_log import activity_log
+from src.extras.channel_mgnt import create_org_channel, create_org_role, org_role_name
+from src.extras.retry import retry
+from src.extras.roles_mgnt import BaseRole
+from src.extras.vwr_exceptions import NoClubMembership, NotAClubAdmin
+
+ORG_BASE_ROLES = {
+    "club": (BaseRole.CLUB_MEMBER, BaseRole.CLUB_ADMIN),
+    "team": (BaseRole.TEAM_MEMBER, BaseRole.TEAM_ADMIN),
+}
+# User fields changed by create_club/create_team, restored on rollback.
+ROLLBACK_FIELDS = ("club_id", "club_admin", "team_id", "team_admin", "team_approved")
+
+
+async def _find_role(guild: discord.Guild, name: str) -> discord.Role | None:
+    return discord.utils.get(await guild.fetch_roles(), name=name)
 
-from src.database.db_models import User
-from src.extras.channel_mgnt import create_on_guild
-from src.extras.roles_mgnt import BaseRole, add_base_role
-from src.extras.vwr_exceptions import UserNotRegistered
+
+async def _create_once[T](create: Callable[[], Awaitable[T]], find: Callable[[], Awaitable[T | None]], what: str) -> T:
+    """Retry a create that is not idempotent.
+
+    A 5xx can arrive after Discord already created the object, so every retry first looks for it with ``find`` and
+    only creates it when it is not there.
+    """
+    attempted = False
+
+    async def attempt() -> T:
+        nonlocal attempted
+        if attempted and (found := await find()) is not None:
+            logfire.info(f"{what}: found what the failed attempt created")
+            return found
+        attempted = True
+        return await create()
+
+    return await retry(attempt, what=what)
 
 
 class CreateOrgForm(discord.ui.Modal):
@@ -55,59 +92,118 @@ class CreateOrgForm(discord.ui.Modal):
             self.discord_server_id = None
             self.website = None
 
+    @interaction_callback("create_org_form")
     async def callback(self, interaction: discord.Interaction):
-        """Process the registration form."""
-        logfire.info(f"Processing registration form for {interaction.user}")
+        """Create the club or team, then its role, channel and the creator's roles.
 
-        # Get the user requesting
-        user = User.get_or_none(User.discord_id == interaction.user.id)
-        try:
-            zp_id = self.zp_club_id.value if self.zp_club_id is not None else None
-            logfire.info(f"Creating {self.org_type} object")
-            if self.org_type == "club":
-                new_org = user.create_club(
-                    club_name=self.name.value,
-                    zp_club_id=zp_id,
+        The interaction is acknowledged right away and answered with one followup once everything is done.
+        Independent Discord calls run concurrently, transient failures are retried, and if the role or channel
+        cannot be created the new org is rolled back.
+        """
+        with logfire.span(f"CREATE {self.org_type.upper()} PIPELINE"):
+            await interaction.response.defer(ephemeral=True)
+            logfire.info(f"Processing create {self.org_type} form for {interaction.user}")
+
+            user = User.get_or_none(User.discord_id == interaction.user.id)
+            if user is None:
+                await interaction.followup.send("❌ You must be registered to create a Club or Team", ephemeral=True)
+                return
+            previous = {field: getattr(user, field) for field in ROLLBACK_FIELDS}
+            try:
+                logfire.info(f"Creating {self.org_type} object")
+                if self.org_type == "club":
+                    zp_id = self.zp_club_id.value if self.zp_club_id is not None else None
+                    new_org = user.create_club(club_name=self.name.value, zp_club_id=zp_id or None)
+                    parent_role = None
+                else:
+                    new_org = user.create_team(team_name=self.name.value, join=True)
+                    club = new_org.club_id
+                    parent_role = interaction.guild.get_role(club.discord_role_id) if club.discord_role_id else None
+            except IntegrityError as e:
+                logfire.error(f"Failed to create {self.org_type}: {e}")
+                await interaction.followup.send(
+                    f"❌ A {self.org_type} named '{self.name.value}' (or with that id) already exists.", ephemeral=True
+                )
+                return
+            except (NoClubMembership, NotAClubAdmin) as e:
+                logfire.error(f"Failed to create {self.org_type}: {e}")
+                await interaction.followup.send("❌ You must be a club admin to create a team.", ephemeral=True)
+                return
+            except Exception as e:
+                logfire.error(f"Failed to create {self.org_type}: {e}", exc_info=True)
+                await interaction.followup.send(
+                    f"❌ Failed to create {self.org_type}. Unknown error.\n{e!s}", ephemeral=True
                 )
-            elif self.org_type == "team":
-                new_org = user.create_team(
-                    team_name=self.name.value,
+                return
+
+            try:
+                channel = await self._provision(interaction, new_org, parent_role)
+            except Exception as e:
+                logfire.error(f"Failed to set up {self.org_type} {new_org.name}, rolling back: {e}", exc_info=True)
+                self._rollback_db(user, new_org, previous)
+                await interaction.followup.send(
+                    f"❌ Failed to create the {self.org_type} channel and role, nothing was created.\n{e!s}",
+                    ephemeral=True,
                 )
-        except UserNotRegistered as e: # Double-check the user is registered in the db
-            logfire.error(f"Failed to create {self.org_type}: {e}")
-            await interaction.respond(
-                f"❌ User '{self.name.value}' must be registered to create a Club or Team", ephemeral=True
+                return
+
+            activity_log.post(interaction.guild, f"{interaction.user} created {self.org_type} '{new_org.name}'")
+            await interaction.followup.send(
+                f"✅ {self.org_type.upper()} '{new_org.name}' successfully created! "
+                f"Check it out here: {channel.mention}",
+                ephemeral=True,
             )
-        except Exception as e:
-            logfire.error(f"Failed to create {self.org_type}: {e}")
-            await interaction.respond(f"❌ Failed to create {self.org_type}. Unknown error.\n{e!s}", ephemeral=True)
 
-        await interaction.respond(f"{self.org_type.upper()} '{self.name.value}' successfully created!", ephemeral=True)
+    async def _provision(
+        self, interaction: discord.Interaction, new_org: Club | Team, parent_role: discord.Role | None
+    ) -> discord.TextChannel:
+        """Create the org role, then its channel and the creator's roles at the same time."""
+        guild = interaction.guild
+        member = guild.get_member(interaction.user.id)
+        base_roles = [discord.utils.get(guild.roles, name=r.value) for r in ORG_BASE_ROLES[self.org_type]]
+        # Only the base roles the creator did not have yet are taken away again on rollback.
+        new_base_roles = [r for r in base_roles if r is not None and r not in member.roles]
+        role_name = org_role_name(self.org_type, new_org.name)
+        role = await _create_once(
+            lambda: create_org_role(guild, self.org_type, new_org),
+            lambda: _find_role(guild, role_name),
+            what="create role",
+        )
+        channel_result, roles_result = await asyncio.gather(
+            retry(lambda: create_org_channel(guild, self.org_type, new_org, role, parent_role), what="create channel"),
+            retry(lambda: member.add_roles(*new_base_roles, role), what="add creator roles"),
+            return_exceptions=True,
+        )
+        if isinstance(channel_result, BaseException):
+            await self._rollback_discord(role, member, new_base_roles)
+            raise channel_result
+        if isinstance(roles_result, BaseException):
+            # The org exists, the role sync job will hand out the missing roles.
+            logfire.error(f"Failed to give {interaction.user} the {self.org_type} roles: {roles_result}")
+        new_org.discord_role_id = role.id
+        new_org.discord_channel_id = channel_result.id
+        new_org.save()
+        return channel_result
 
-        # Setup channels and roles
+    @staticmethod
+    async def _rollback_discord(role: discord.Role, member: discord.Member, base_roles: list[discord.Role]) -> None:
+        """Delete the org role again, which also takes it off the creator, and remove the base roles given to them."""
         try:
-            logfire.info(f"Create {self.name.value} channel in {self.org_type}")
-            org_name = re.sub(r"[^a-z0-9_\-]", "-", self.name.value.lower())
-            # Truncate name if it's too long (Discord limit is 100 characters)
-            org_name = org_name[:100]
-            new_channel = await create_on_guild(self.ctx, self.org_type, org_name)
-            # Give the user the role of CLUB_MEMBER and CLUB_ADMIN
-            if self.org_type == "club":
-                await add_base_role(interaction, interaction.user.id, BaseRole.CLUB_MEMBER)
-                await add_base_role(interaction, interaction.user.id, BaseRole.CLUB_ADMIN)
-                logfire.info(f"Added {BaseRole.CLUB_MEMBER} and {BaseRole.CLUB_ADMIN} to {interaction.user}")
-            if self.org_type == "team":
-                await add_base_role(interaction, interaction.user.id, BaseRole.TEAM_MEMBER)
-                await add_base_role(interaction, interaction.user.id, BaseRole.TEAM_ADMIN)
-                logfire.info(f"Added {BaseRole.TEAM_MEMBER} and {BaseRole.TEAM_ADMIN} to {interaction.user}")
-
-            logfire.info(f"Logging registration for {interaction.user}")
-            log_channel = discord.utils.get(interaction.guild.channels, name="activity_logs")
-            if log_channel:
-                await log_channel.send(f"{interaction.user} created {self.org_type} '{new_channel.name}'")
-        except Exception as e:
-            logfire.error(f"General error, Failed to create {self.org_type.upper()} channel: {e}", exc_info=True)
-            # raise e
-            await interaction.respond(
-                f"❌ Failed to create {self.org_type.upper()} channel. Unknown error.\n{e!s}", ephemeral=True
-            )
+            await role.delete(reason="VWR create rollback")
+        except discord.HTTPException as e:
+            logfire.error(f"Failed to delete role {role.name} during rollback: {e}")
+        if not base_roles:
+            return
+        try:
+            await member.remove_roles(*base_roles, reason="VWR create rollback")
+        except discord.HTTPException as e:
+            # The role sync job takes them away later.
+            logfire.error(f"Failed to remove the base roles of {member} during rollback: {e}")
+
+    @staticmethod
+    def _rollback_db(user: User, new_org: Club | Team, previous: dict) -> None:
+        """Delete the org row and restore the creator's membership."""
+        for field, value in previous.items():
+            setattr(user, field, value)
+        user.save()
+        new_org.delete_instance()
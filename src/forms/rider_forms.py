@@ -1,9 +1,14 @@
 import discord
 import logfire
 
+from src.bot.middleware import interaction_callback
 from src.database.db_models import User
+from src.extras.activity_log import activity_log
+from src.extras.log import get_logger
 from src.extras.roles_mgnt import BaseRole, add_base_role
 
+log = get_logger("registration")
+
 
 class RegistrationForm(discord.ui.Modal):
     """Registration form."""
@@ -30,13 +35,14 @@ class RegistrationForm(discord.ui.Modal):
         )
         self.add_item(self.tos)
 
+    @interaction_callback("registration_form")
     async def callback(self, interaction: discord.Interaction):
         """Process the registration form."""
         with logfire.span("Creating new Rider/User"):
             logfire.info(f"Processing registration form for {interaction.user}")
             try:
                 if self.tos.value.lower() != "yes":
-                    await interaction.response.send_message(
+                    await interaction.respond(
                         "❌ You must agree to the TOS. and PP. to register. Please try again or go away ;-)",
                         ephemeral=True,
                     )
@@ -50,7 +56,7 @@ class RegistrationForm(discord.ui.Modal):
                 # NOTE: We don't need to do this because we check on the slah command for the role
                 existing_discord = User.get_or_none(User.discord_id == interaction.user.id)
                 if existing_discord:
-                    await interaction.response.send_message(
+                    await interaction.respond(
                         "❌ You are already registered a Contact an admin if there are problems", ephemeral=True
                     )
                     logfire.warn(f"{interaction.user} tried to register again.")
@@ -58,21 +64,22 @@ class RegistrationForm(discord.ui.Modal):
 
                 existing_zwid = User.get_or_none(User.zwid == zwid_int)
                 if existing_zwid:
-                    await interaction.response.send_message(
+                    await interaction.respond(
                         "❌ Zwift ID is already registered! Contact an admin if there are problems", ephemeral=True
                     )
                     logfire.warn(f"{interaction.user} tried to register with an existing Zwift ID.")
+                    return
 
                 existing_name = User.get_or_none(User.name == self.name.value)
                 if existing_name:
-                    await interaction.response.send_message(
+                    await interaction.respond(
                         "❌ Name is already registered! Contact an admin if there are problems", ephemeral=True
                     )
                     logfire.warn(f"{interaction.user} tried to register a existing name again.")
                     return
             except Exception as e:
                 logfire.error(f"Failed to check for user already exists: {e}")
-                await interaction.response.send_message("❌ Failed to check for user already exists", ephemeral=True)
+                await interaction.respond("❌ Failed to check for user already exists", ephemeral=True)
                 return
 
             try:
@@ -86,7 +93,7 @@ class RegistrationForm(discord.ui.Modal):
                     tos=tos,
                     active=True,
                 )
-                logfire.info(f"Creating User object with:\n {user_def}")
+                log.debug("Creating User object", user_def=user_def)
                 user = User.create(
                     discord_id=interaction.user.id,
                     discord_name=str(interaction.user),
@@ -102,20 +109,21 @@ class RegistrationForm(discord.ui.Modal):
                 embed = discord.Embed(title="✅ Registration Successful!", color=discord.Color.green())
                 embed.add_field(name="Name", value=self.name.value, inline=True)
                 embed.add_field(name="Zwift ID", value=self.zwid.value, inline=True)
-                await interaction.response.send_message(embed=embed, ephemeral=True)
+                await interaction.respond(embed=embed, ephemeral=True)
 
                 # Log registration
                 logfire.info(f"Logging registration for {interaction.user}")
-                log_channel = discord.utils.get(interaction.guild.channels, name="activity_logs")
-                if log_channel:
-                    await log_channel.send(embed=embed)
+                activity_log.post(
+                    interaction.guild,
+                    f"✅ {interaction.user.mention} registered as **{self.name.value}**, Zwift ID `{self.zwid.value}`",
+                )
 
             except ValueError:
-                await interaction.response.send_message("❌ Zwift ID be a valid number.", ephemeral=True)
+                await interaction.respond("❌ Zwift ID be a valid number.", ephemeral=True)
                 logfire.error(f"{interaction.user} entered an invalid Zwift ID.")
 
             except Exception as e:
-                await interaction.response.send_message(f"❌ Failed to register user: {user_def}.", ephemeral=True)
-                logfire.error(f"Failed to register user: {user_def}\n {e}", exc_info=True)
+                await interaction.respond(f"❌ Failed to register user: {user_def}.", ephemeral=True)
+                log.error("Failed to register user: {error}", error=str(e), user_def=user_def, exc_info=True)
 
             logfire.info(f"Registration complete for {interaction.user}")
@@ -0,0 +1,199 @@
+"""Reminders and start announcements for upcoming matches.
+
+Every upcoming match has one heap entry per reminder offset (MATCH_REMINDER_OFFSETS, default 24h, 1h and 10m) plus
+its start. A single task sleeps until the earliest entry is due, so nothing polls the database.
+
+A changed match gets fresh entries in O(log n). Its old entries stay in the heap and are skipped when they come up,
+because they carry an outdated version. On startup only future matches are loaded. Changes arrive through
+cache_bus "match", which ``Match.save`` publishes.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import os
+import re
+import time
+from collections.abc import Hashable
+from dataclasses import dataclass
+from datetime import datetime
+
+import discord
+import logfire
+from dotenv import load_dotenv
+
+from src.database.db_models import Match, Team
+from src.extras import cache_bus
+from src.match.setup_match import start_timestamp, utc_now
+
+load_dotenv()
+
+_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+
+
+def parse_offsets(text: str) -> list[int]:
+    """Parse ``"24h,1h,10m"`` into seconds, largest first."""
+    offsets = set()
+    for part in text.split(","):
+        match = re.fullmatch(r"\s*(\d+)\s*([dhms])\s*", part)
+        if match is None:
+            if part.strip():
+                logfire.warn(f"Ignoring invalid match reminder offset {part!r}")
+            continue
+        offsets.add(int(match.group(1)) * _UNITS[match.group(2)])
+    return sorted(offsets, reverse=True)
+
+
+def describe_offset(seconds: int) -> str:
+    """``3600`` -> ``1h``."""
+    for unit, size in _UNITS.items():
+        if seconds % size == 0:
+            return f"{seconds // size}{unit}"
+    return f"{seconds}s"
+
+
+@dataclass
+class ScheduledMatch:
+    """What the scheduler needs to announce a match."""
+
+    match_id: int
+    team_ids: tuple[int, int]
+    start: datetime
+    race_link: str | None = None
+    version: int = 0
+
+
+@dataclass
+class SchedulerStats:
+    """Counters for the match scheduler."""
+
+    scheduled: int = 0
+    fired: int = 0
+    stale: int = 0
+    failed: int = 0
+
+
+class MatchScheduler:
+    """Fire match reminders from a heap of (time, entry) pairs."""
+
+    def __init__(self, offsets: list[int]):
+        self.offsets = offsets
+        self.stats = SchedulerStats()
+        self._heap: list[tuple[float, int, int, int, int]] = []  # (fire_at, seq, match_id, version, offset)
+        self._matches: dict[int, ScheduledMatch] = {}
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._bot: discord.Client | None = None
+
+    @classmethod
+    def from_env(cls) -> "MatchScheduler":
+        """Create a scheduler with the offsets from MATCH_REMINDER_OFFSETS."""
+        return cls(parse_offsets(os.getenv("MATCH_REMINDER_OFFSETS", "24h,1h,10m")))
+
+    @property
+    def depth(self) -> int:
+        """Heap entries, stale ones included."""
+        return len(self._heap)
+
+    def start(self, bot: discord.Client) -> None:
+        """Load the future matches and start the timer task, safe to call on every on_ready."""
+        self._bot = bot
+        if self._task is not None and not self._task.done():
+            return
+        self.load()
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="match-scheduler")
+        logfire.info(f"Match scheduler started with {len(self._matches)} upcoming matches.")
+
+    def load(self) -> None:
+        """Schedule every match that has not started yet, one streaming query."""
+        self._heap.clear()
+        self._matches.clear()
+        query = (
+            Match.select(Match.id, Match.team_id_1, Match.team_id_2, Match.start_datetime, Match.race_link)
+            .where(Match.start_datetime > utc_now())
+            .tuples()
+            .iterator()
+        )
+        for match_id, team_1, team_2, start, race_link in query:
+            self.schedule(ScheduledMatch(match_id, (team_1, team_2), start, race_link))
+
+    def schedule(self, match: ScheduledMatch) -> None:
+        """Add or reschedule a match, its previous entries become stale."""
+        # Versions are never reused, also not after a cancel, so old entries can never match a new schedule.
+        self._seq += 1
+        match.version = self._seq
+        self._matches[match.match_id] = match
+        start = start_timestamp(match.start)
+        now = time.time()
+        earliest = self._heap[0][0] if self._heap else float("inf")
+        for offset in (*self.offsets, 0):
+            fire_at = start - offset
+            if fire_at <= now:
+                continue
+            self._seq += 1
+            heapq.heappush(self._heap, (fire_at, self._seq, match.match_id, match.version, offset))
+            self.stats.scheduled += 1
+            if fire_at < earliest:
+                self._wakeup.set()
+
+    def cancel(self, match_id: int) -> None:
+        """Forget a match, its entries are skipped when they come up."""
+        self._matches.pop(match_id, None)
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            if timeout is None or timeout > 0:
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                continue
+            _, _, match_id, version, offset = heapq.heappop(self._heap)
+            match = self._matches.get(match_id)
+            if match is None or match.version != version:
+                self.stats.stale += 1
+                continue
+            if offset == 0:
+                self._matches.pop(match_id, None)
+            try:
+                await self._announce(match, offset)
+                self.stats.fired += 1
+            except Exception as e:
+                self.stats.failed += 1
+                logfire.error(f"Failed to announce match {match_id} ({describe_offset(offset)}): {e}", exc_info=True)
+
+    async def _announce(self, match: ScheduledMatch, offset: int) -> None:
+        teams = [await Team.lookup_async(team_id) for team_id in match.team_ids]
+        names = " vs ".join(f"**{team.name}**" if team else "?" for team in teams)
+        starts = f"<t:{start_timestamp(match.start)}:R>"
+        text = f"🏁 {names} starts now!" if offset == 0 else f"⏰ Reminder: {names} starts {starts}."
+        if match.race_link:
+            text += f"\n{match.race_link}"
+        for team in teams:
+            channel = self._bot.get_channel(team.discord_channel_id) if team and team.discord_channel_id else None
+            # In a cluster only the worker connected to the guild sees the channel, so each reminder is sent once.
+            if channel is not None:
+                await channel.send(text)
+
+
+match_scheduler = MatchScheduler.from_env()
+
+
+def _schedule_row(key: Hashable, match: Match | None) -> None:
+    if match is None or match.start_datetime is None or match.start_datetime <= utc_now():
+        match_scheduler.cancel(key)
+        return
+    match_scheduler.schedule(
+        ScheduledMatch(match.id, (match.team_id_1_id, match.team_id_2_id), match.start_datetime, match.race_link)
+    )
+
+
+def _on_match_change(key: Hashable, match: Match | None) -> None:
+    # Deletes and changes made by other workers come without the row, it is loaded off the loop.
+    cache_bus.apply_row(
+        ("match", key), match, lambda: Match.get_or_none(Match.id == key), lambda row: _schedule_row(key, row)
+    )
+
+
+cache_bus.subscribe("match", _on_match_change)
@@ -0,0 +1,186 @@
+"""Match proposals, acceptance and rosters.
+
+Every change is one conditional UPDATE: it only applies while ``Match.version`` still has the value the captain was
+shown, and it bumps the version. Nothing is read-modify-written and no lock is held while a captain looks at a
+Discord message. A write that lost the race raises MatchConflict, and the captain is shown the current match.
+
+A team only ever writes its own side of the match (``team_<side>_roster`` and ``team_<side>_accepted``). A roster
+change withdraws the other team's acceptance, they accepted the previous line-up.
+
+Start times are UTC, stored without a timezone like the other datetime columns. Compare them with ``utc_now()`` and
+turn them into Unix time with ``start_timestamp()``, never with the host's local time.
+
+The writes bypass ``Match.save``, so the async helpers publish cache_bus "match" themselves, on the loop. The written
+row is read back in the worker thread and published with it, so subscribers don't query the database on the loop.
+"""
+
+import asyncio
+from datetime import UTC, datetime
+from typing import Any
+
+from src.database.archive import find_match
+from src.database.db_models import Match, User
+from src.extras import cache_bus
+from src.extras.vwr_exceptions import MatchConflict, MatchNotFound
+
+SIDES = (1, 2)
+
+
+def utc_now() -> datetime:
+    """The current UTC time without a timezone, the way match start times are stored."""
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+def start_timestamp(start: datetime) -> int:
+    """Unix time of a stored start time, e.g. for a ``<t:...>`` timestamp."""
+    return int(start.replace(tzinfo=UTC).timestamp())
+
+
+def team_side(match: Match, team_id: int) -> int | None:
+    """1 or 2 for the teams playing the match, None for any other team."""
+    if match.team_id_1_id == team_id:
+        return 1
+    if match.team_id_2_id == team_id:
+        return 2
+    return None
+
+
+def _field(side: int, name: str):
+    return getattr(Match, name.format(side=side))
+
+
+def get_match(match_id: int) -> Match:
+    """Load a match, for showing it and for the version to write against. Archived matches are read from the archive.
+
+    Raises:
+        MatchNotFound: There is no match with this id.
+
+    """
+    match = find_match(match_id)
+    if match is None:
+        raise MatchNotFound(f"Match {match_id} not found")
+    return match
+
+
+def captain_team(discord_id: int) -> int | None:
+    """The team id of a team admin, None if the user is not the admin of an approved team."""
+    row = (
+        User.select(User.team_id)
+        .where(User.discord_id == discord_id, User.team_admin, User.team_approved)
+        .tuples()
+        .first()
+    )
+    return row[0] if row else None
+
+
+def team_riders(team_id: int, discord_ids: list[int]) -> tuple[list[int], list[int]]:
+    """Split discord ids into the team's approved riders and everyone else, both in the given order."""
+    members = {
+        discord_id
+        for (discord_id,) in User.select(User.discord_id)
+        .where(User.discord_id.in_(discord_ids), User.team_id == team_id, User.team_approved)
+        .tuples()
+    }
+    return [d for d in discord_ids if d in members], [d for d in discord_ids if d not in members]
+
+
+def upcoming_matches(team_id: int, limit: int = 10) -> list[Match]:
+    """The next matches of a team, soonest first."""
+    return list(
+        Match.select()
+        .where((Match.team_id_1 == team_id) | (Match.team_id_2 == team_id), Match.start_datetime > utc_now())
+        .order_by(Match.start_datetime)
+        .limit(limit)
+    )
+
+
+def _insert_match(team_id: int, opponent_id: int, start: datetime, **details: Any) -> Match:
+    now = datetime.now()
+    match_id = (
+        Match.insert(
+            team_id_1=team_id,
+            team_1_accepted=True,
+            team_id_2=opponent_id,
+            start_datetime=start,
+            version=0,
+            created_at=now,
+            updated_at=now,
+            **details,
+        )
+        .execute()
+    )
+    return Match.get_by_id(match_id)
+
+
+def _update_side(match_id: int, side: int, team_id: int, version: int, values: dict, *conditions) -> int:
+    """Apply ``values`` if the match still has ``version`` and ``team_id`` on ``side``. Returns the new version."""
+    values = {**values, Match.version: Match.version + 1, Match.updated_at: datetime.now()}
+    updated = (
+        Match.update(values)
+        .where(
+            Match.id == match_id,
+            Match.version == version,
+            _field(side, "team_id_{side}") == team_id,
+            *conditions,
+        )
+        .execute()
+    )
+    if not updated:
+        raise MatchConflict(match_id)
+    return version + 1
+
+
+def _accept(match_id: int, side: int, team_id: int, version: int) -> tuple[int, Match | None]:
+    accepted = _field(side, "team_{side}_accepted")
+    new_version = _update_side(match_id, side, team_id, version, {accepted: True}, ~accepted)
+    return new_version, Match.get_or_none(Match.id == match_id)
+
+
+def _set_roster(match_id: int, side: int, team_id: int, roster: list[int], version: int) -> tuple[int, Match | None]:
+    other = SIDES[side % 2]
+    values = {
+        _field(side, "team_{side}_roster"): roster,
+        _field(side, "team_{side}_accepted"): True,
+        _field(other, "team_{side}_accepted"): False,
+    }
+    new_version = _update_side(match_id, side, team_id, version, values)
+    return new_version, Match.get_or_none(Match.id == match_id)
+
+
+async def propose_match(team_id: int, opponent_id: int, start: datetime, **details: Any) -> int:
+    """Create a match, accepted by the proposing team. Returns the match id.
+
+    Args:
+        team_id: The proposing team, team 1 of the match.
+        opponent_id: The challenged team, team 2 of the match.
+        start: Start of the race.
+        **details: Other Match columns, e.g. ``course_name``, ``laps`` and ``race_link``.
+
+    """
+    match = await asyncio.to_thread(_insert_match, team_id, opponent_id, start, **details)
+    cache_bus.publish("match", match.id, match)
+    return match.id
+
+
+async def accept_match(match_id: int, side: int, team_id: int, version: int) -> int:
+    """Accept a match on behalf of one side, in a single conditional UPDATE. Returns the new version.
+
+    Raises:
+        MatchConflict: The match changed since ``version`` was read, or the side already accepted.
+
+    """
+    new_version, match = await asyncio.to_thread(_accept, match_id, side, team_id, version)
+    cache_bus.publish("match", match_id, match)
+    return new_version
+
+
+async def set_roster(match_id: int, side: int, team_id: int, roster: list[int], version: int) -> int:
+    """Replace one side's roster (discord ids), which withdraws the other side's acceptance. Returns the new version.
+
+    Raises:
+        MatchConflict: The match changed since ``version`` was read.
+
+    """
+    new_version, match = await asyncio.to_thread(_set_roster, match_id, side, team_id, roster, version)
+    cache_bus.publish("match", match_id, match)
+    return new_version